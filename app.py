@@ -1,37 +1,147 @@
-from typing import List
+from __future__ import annotations
 
-import gradio as gr
+import asyncio
+import hashlib
+import json
+import os
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, Iterator, List, Optional
 
-from pirjo_pipeline import generate_introduction
+from index_store import corpus_key
+from pirjo_pipeline import generate_introduction, iter_introduction
+from serving import QueueFull, Scheduler
+
+if TYPE_CHECKING:  # gradio is imported by build_demo, not at import time
+    import gradio as gr
+
+BLOCK_LABELS = {
+    "P": "Problema",
+    "I": "Información relevante",
+    "R": "Restricción o brecha",
+    "J": "Justificación",
+    "O": "Objetivo",
+}
+MISSING_INPUT = "Se requiere título, objetivo, resumen y al menos un PDF."
+SERVER_BUSY = "Hay demasiadas solicitudes en espera. Inténtalo de nuevo en unos minutos."
+
+_SCHEDULER: Optional[Scheduler] = None
+
+
+def configure_serving(workers: int = 2, max_queue: int = 16) -> Scheduler:
+    """Run at most ``workers`` pipelines at once with ``max_queue`` more waiting.
+
+    When this function is never called, the limits are read from
+    ``SERVE_WORKERS`` and ``SERVE_MAX_QUEUE`` on first use.
+    """
+    global _SCHEDULER
+    _SCHEDULER = Scheduler(workers, max_queue, stage_of=_event_stage)
+    return _SCHEDULER
+
+
+def _event_stage(event: Dict[str, Any]) -> Optional[str]:
+    """Return the stage under which a job keeps only its latest ``event``.
+
+    The final event is always kept.
+    """
+    return None if "result" in event else event["stage"]
+
+
+def _carry_blocks(events: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Repeat the latest PIRJO blocks in every event.
+
+    Compacting a job's events keeps one event per stage, which may not be
+    the one that first carried the blocks.
+    """
+    blocks = None
+    for event in events:
+        if "blocks" in event:
+            blocks = event["blocks"]
+        elif blocks is not None:
+            event = dict(event, blocks=blocks)
+        yield event
+
+
+def _get_scheduler() -> Scheduler:
+    """Return the configured scheduler."""
+    if _SCHEDULER is None:
+        configure_serving(
+            int(os.getenv("SERVE_WORKERS", "2")), int(os.getenv("SERVE_MAX_QUEUE", "16"))
+        )
+    return _SCHEDULER
+
+
+def request_key(title: str, objective: str, summary: str, file_paths: List[str]) -> str:
+    """Return the hash of a request: its fields and the names and contents of its PDFs."""
+    payload = json.dumps([title, objective, summary, corpus_key(file_paths)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def format_blocks(blocks: Dict[str, str]) -> str:
+    """Render PIRJO blocks one per section with the full Spanish label."""
+    return "\n\n".join(f"{BLOCK_LABELS.get(k, k)}:\n{v}" for k, v in blocks.items())
 
 
 def run_pipeline(title: str, objective: str, summary: str, files: List[gr.File]) -> tuple:
     """Execute the PIRJO pipeline and format outputs for Gradio.
 
     The introduction is returned as a single string while the PIRJO blocks are
-    rendered in a human friendly way (one block per section with the full
-    Spanish label) instead of raw JSON.
+    rendered in a human friendly way (see :func:`format_blocks`) instead of
+    raw JSON.
     """
 
     file_paths = [f.name for f in files] if files else []
     if not title or not objective or not summary or not file_paths:
-        return "Se requiere título, objetivo, resumen y al menos un PDF.", "", ""
+        return MISSING_INPUT, "", ""
 
     result = generate_introduction(title, objective, summary, file_paths)
+    processed = ", ".join(result["files"])
+    return result["introduction"], format_blocks(result["blocks"]), processed
 
-    block_labels = {
-        "P": "Problema",
-        "I": "Información relevante",
-        "R": "Restricción o brecha",
-        "J": "Justificación",
-        "O": "Objetivo",
-    }
-    blocks_text = "\n\n".join(
-        f"{block_labels.get(k, k)}:\n{v}" for k, v in result["blocks"].items()
-    )
 
-    processed = ", ".join(result["files"])
-    return result["introduction"], blocks_text, processed
+async def run_pipeline_stream(
+    title: str, objective: str, summary: str, files: List[gr.File]
+) -> AsyncIterator[tuple]:
+    """Streaming variant of :func:`run_pipeline` for Gradio generators.
+
+    The pipeline runs on the serving scheduler (see :func:`configure_serving`)
+    while this handler only awaits its progress. A request waiting for a
+    free worker shows its position in the queue, and a request identical to
+    one already queued or running (see :func:`request_key`) follows that job
+    instead of starting another. The result box then shows the current stage
+    until the writer agents start producing text, which appears token by
+    token. The PIRJO blocks are shown as soon as they are available.
+    """
+
+    file_paths = [f.name for f in files] if files else []
+    if not title or not objective or not summary or not file_paths:
+        yield MISSING_INPUT, "", ""
+        return
+
+    key = await asyncio.to_thread(request_key, title, objective, summary, file_paths)
+    try:
+        job = _get_scheduler().submit(
+            key, lambda: _carry_blocks(iter_introduction(title, objective, summary, file_paths))
+        )
+    except QueueFull:
+        yield SERVER_BUSY, "", ""
+        return
+
+    blocks_text = ""
+    processed = ""
+    async for events, position in job.aupdates():
+        if position:
+            yield f"En cola: posición {position}...", "", ""
+            continue
+        if not events:
+            continue
+        for event in events:
+            if "blocks" in event:
+                blocks_text = format_blocks(event["blocks"])
+            if "result" in event:
+                processed = ", ".join(event["result"]["files"])
+        text = events[-1]["text"] or f"{events[-1]['label']}..."
+        yield text, blocks_text, processed
+    if job.error is not None:
+        raise job.error
 
 
 def export_to_docx(text: str) -> str:
@@ -68,6 +178,8 @@ def export_to_pdf(text: str) -> str:
 
 
 def build_demo() -> gr.Blocks:
+    import gradio as gr
+
     with gr.Blocks(css=".scrollable textarea {overflow-y: auto; max-height: 500px;}") as demo:
         gr.Markdown("### Asistente de Introducciones de Investigación (PIRJO)")
         with gr.Row():
@@ -89,7 +201,13 @@ def build_demo() -> gr.Blocks:
         download_pdf = gr.File(label="Descargar PDF")
         export_word = gr.Button("Exportar a Word")
         export_pdf = gr.Button("Exportar a PDF")
-        btn.click(run_pipeline, inputs=[title, objective, summary, pdfs], outputs=[intro, blocks, files_out])
+        # The scheduler bounds the pipelines; waiting handlers only await it.
+        btn.click(
+            run_pipeline_stream,
+            inputs=[title, objective, summary, pdfs],
+            outputs=[intro, blocks, files_out],
+            concurrency_limit=None,
+        )
         export_word.click(export_to_docx, inputs=intro, outputs=download_word)
         export_pdf.click(export_to_pdf, inputs=intro, outputs=download_pdf)
     return demo
@@ -0,0 +1,197 @@
+"""Headless batch mode: generate the introductions of a JSONL file of jobs.
+
+Every input line is a job with ``title``, ``objective``, ``summary`` and
+``pdfs`` (a list of paths, relative to the jobs file) and optionally an
+``id``. Jobs run concurrently in one process, so they share the embedding
+model, the index store and the response cache, while the number of chat
+completions in flight stays bounded (see
+:func:`pirjo_pipeline.configure_llm_concurrency`). Each result is appended
+to the output JSONL as soon as its job finishes; running the same command
+again skips the jobs that already have an ``"ok"`` line and retries the
+rest::
+
+    python batch.py trabajos.jsonl resultados.jsonl --workers 4 --max-llm-calls 8
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Set
+
+from openai_utils import ensure_openai_api_key
+from pirjo_pipeline import configure_llm_concurrency, generate_introduction, warm_up
+
+logger = logging.getLogger(__name__)
+
+JOB_FIELDS = ("title", "objective", "summary", "pdfs")
+
+
+def job_id(job: Dict[str, Any]) -> str:
+    """Return the ``id`` of ``job``, or a hash of its fields when it has none."""
+    if job.get("id") not in (None, ""):
+        return str(job["id"])
+    payload = json.dumps({f: job.get(f) for f in JOB_FIELDS}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def read_jobs(path: str) -> List[Dict[str, Any]]:
+    """Return the jobs of ``path`` with their ``id`` set and PDF paths resolved."""
+    base = os.path.dirname(os.path.abspath(path))
+    jobs: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as exc:
+                raise ValueError(f"{path}:{number}: invalid JSON: {exc}") from exc
+            job["id"] = job_id(job)
+            job["pdfs"] = [os.path.join(base, p) for p in job.get("pdfs") or []]
+            jobs.append(job)
+    return jobs
+
+
+def completed_jobs(path: str) -> Set[str]:
+    """Return the ids with an ``"ok"`` result in the output file ``path``.
+
+    A line cut short by a crash is ignored, so its job runs again.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+class ResultWriter:
+    """Append one JSON line per result to ``path``, flushed to disk at once."""
+
+    def __init__(self, path: str):
+        partial = False
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                partial = f.read(1) != b"\n"
+        self._file = open(path, "a", encoding="utf-8")
+        if partial:
+            # Start after the line left unfinished by a crash.
+            self._file.write("\n")
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def run_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Generate the introduction of ``job`` and return its output record.
+
+    Failures are reported in the record (``"status": "error"``) instead of
+    being raised, so that one bad job does not stop the batch.
+    """
+    start = time.perf_counter()
+    record: Dict[str, Any] = {"id": job["id"]}
+    try:
+        missing = [f for f in JOB_FIELDS if not job.get(f)]
+        if missing:
+            raise ValueError(f"missing fields: {', '.join(missing)}")
+        result = generate_introduction(job["title"], job["objective"], job["summary"], job["pdfs"])
+    except Exception as exc:  # noqa: BLE001 - recorded and retried on the next run
+        logger.warning("Job %s failed: %s", job["id"], exc)
+        record.update(status="error", error=f"{type(exc).__name__}: {exc}")
+    else:
+        record.update(status="ok", **result)
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def run_batch(
+    jobs_path: str,
+    output_path: str,
+    workers: int = 4,
+    max_llm_calls: Optional[int] = None,
+) -> Dict[str, int]:
+    """Run the pending jobs of ``jobs_path`` on ``workers`` threads.
+
+    Results are appended to ``output_path`` as jobs finish. ``max_llm_calls``
+    bounds the chat completions in flight across all jobs (by default
+    ``LLM_MAX_CONCURRENCY``). Returns the number of jobs that succeeded,
+    failed and were skipped because they were already done.
+    """
+    jobs = read_jobs(jobs_path)
+    done = completed_jobs(output_path)
+    pending: List[Dict[str, Any]] = []
+    for job in jobs:
+        if job["id"] in done:
+            continue
+        done.add(job["id"])
+        pending.append(job)
+    counts = {"ok": 0, "error": 0, "skipped": len(jobs) - len(pending)}
+    if not pending:
+        return counts
+    if max_llm_calls is not None:
+        configure_llm_concurrency(max_llm_calls)
+    # Load the shared embedding model once instead of in the first jobs.
+    warm_up(index=False)
+
+    writer = ResultWriter(output_path)
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="batch")
+    try:
+        futures = [executor.submit(run_job, job) for job in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            writer.write(record)
+            counts[record["status"]] += 1
+            logger.info(
+                "Job %s: %s in %.1fs (%d/%d)",
+                record["id"],
+                record["status"],
+                record["seconds"],
+                counts["ok"] + counts["error"],
+                len(pending),
+            )
+    finally:
+        # Jobs not started yet are picked up by the next run.
+        executor.shutdown(wait=True, cancel_futures=True)
+        writer.close()
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command-line entry point of the batch mode."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("jobs", help="JSONL file with one job per line")
+    parser.add_argument("output", help="JSONL file the results are appended to")
+    parser.add_argument("--workers", type=int, default=4, help="jobs run at the same time")
+    parser.add_argument(
+        "--max-llm-calls", type=int, default=None, help="chat completions in flight at once"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    ensure_openai_api_key()
+    counts = run_batch(args.jobs, args.output, args.workers, args.max_llm_calls)
+    print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Recall-versus-latency benchmark of the FAISS index types in ``rag_faiss``.
+
+The benchmark runs on synthetic clustered vectors shaped like the
+``all-MiniLM-L6-v2`` embeddings (384 dimensions), so it needs neither the
+embedding model nor network access. Every configuration is compared against
+the exact flat index::
+
+    python benchmarks/ann_recall_latency.py --n 100000 --queries 200
+
+The target is a recall@k of at least ``--target`` (0.95 by default) with the
+default search parameters; ``meets_target`` tells which configurations reach
+it. The IVF row without knobs uses ``rag_faiss.default_nprobe``.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+RECALL_TARGET = 0.95
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rag_faiss
+
+
+def _synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Return ``n`` normalised vectors drawn around a few hundred centres."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((max(1, n // 500), dim)).astype("float32")
+    labels = rng.integers(0, len(centres), size=n)
+    vectors = centres[labels] + 0.3 * rng.standard_normal((n, dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.ascontiguousarray(vectors, dtype="float32")
+
+
+def _run(index, queries: np.ndarray, k: int, truth: np.ndarray, **knobs) -> Dict[str, float]:
+    params = rag_faiss._search_params(index, **knobs)
+    start = time.perf_counter()
+    if params is None:
+        _, ids = index.search(queries, k)
+    else:
+        _, ids = index.search(queries, k, params=params)
+    elapsed = time.perf_counter() - start
+    recall = np.mean([len(set(a) & set(b)) / k for a, b in zip(ids, truth)])
+    return {"recall": float(recall), "ms_per_query": 1000 * elapsed / len(queries)}
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=50_000, help="vectors in the corpus")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--target", type=float, default=RECALL_TARGET, help="recall@k to reach")
+    args = parser.parse_args(argv)
+
+    corpus = _synthetic_vectors(args.n, args.dim)
+    rng = np.random.default_rng(1)
+    queries = corpus[rng.integers(0, args.n, size=args.queries)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype("float32")
+    queries = np.ascontiguousarray(queries / np.linalg.norm(queries, axis=1, keepdims=True))
+    ids = np.arange(args.n, dtype="int64")
+
+    rows = []
+    configs = [
+        ("flat", {}, [{}]),
+        ("hnsw", {}, [{"ef_search": ef} for ef in (16, 32, 64, 128)]),
+        ("ivf", {}, [{}] + [{"nprobe": p} for p in (1, 4, 16, 64)]),
+    ]
+    truth = None
+    for index_type, index_params, knobs_list in configs:
+        spec = rag_faiss._index_spec(index_type, index_params)
+        start = time.perf_counter()
+        index = rag_faiss._create_index(spec, args.dim, corpus)
+        index.add_with_ids(corpus, ids)
+        build_s = time.perf_counter() - start
+        if truth is None:
+            _, truth = index.search(queries, args.k)
+        for knobs in knobs_list:
+            result = _run(index, queries, args.k, truth, **knobs)
+            described = rag_faiss._describe_index(index)
+            if described["type"] == "ivf" and not knobs:
+                knobs = {"nprobe": rag_faiss.default_nprobe(described["params"]["nlist"])}
+            rows.append({
+                "index": described,
+                "knobs": knobs,
+                "build_s": round(build_s, 3),
+                "recall": round(result["recall"], 4),
+                "meets_target": bool(result["recall"] >= args.target),
+                "ms_per_query": round(result["ms_per_query"], 4),
+            })
+
+    for row in rows:
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Embedding throughput (chunks per second) of every backend in ``embedding_backends``.
+
+Each backend loads the model used by ``rag_faiss`` and encodes the same
+chunks in batches of ``rag_faiss.EMBED_BATCH_SIZE``. Chunks are synthetic
+Spanish-like paragraphs of ``--words`` words, or the chunks of ``--pdfs``.
+Unlike the other benchmarks this one needs the model files, which
+sentence-transformers downloads on first use; backends whose dependencies
+are missing are reported with their error::
+
+    python benchmarks/embedding_backends_throughput.py --chunks 512
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rag_faiss
+from embedding_backends import BACKENDS, create_backend
+
+_WORDS = (
+    "el la de que los en estudio modelo datos resultados análisis método investigación "
+    "sistema red aprendizaje evaluación propuesta variables muestra efecto rendimiento"
+).split()
+
+
+def _synthetic_chunks(n: int, words: int) -> List[str]:
+    rng = np.random.default_rng(0)
+    return [" ".join(rng.choice(_WORDS, size=words)) for _ in range(n)]
+
+
+def _pdf_chunks(paths: List[str]) -> List[str]:
+    from pirjo_pipeline import extract_sources
+
+    sources, _ = extract_sources(paths)
+    return [s["text"] for s in sources if s["text"].strip()]
+
+
+def _measure(backend_name: str, chunks: List[str], batch_size: int) -> Dict[str, object]:
+    start = time.perf_counter()
+    backend = create_backend(backend_name, rag_faiss.MODEL_NAME)
+    load_s = time.perf_counter() - start
+    backend.encode(chunks[:batch_size], batch_size=batch_size, show_progress_bar=False)  # warm-up
+    start = time.perf_counter()
+    vectors = backend.encode(
+        chunks, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False
+    )
+    elapsed = time.perf_counter() - start
+    return {
+        "backend": backend_name,
+        "id": backend.id,
+        "dimension": backend.dimension,
+        "load_s": round(load_s, 3),
+        "chunks_per_s": round(len(chunks) / elapsed, 1),
+        "vectors": np.asarray(vectors, dtype="float32"),
+    }
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=512)
+    parser.add_argument("--words", type=int, default=120, help="words per synthetic chunk")
+    parser.add_argument("--batch-size", type=int, default=rag_faiss.EMBED_BATCH_SIZE)
+    parser.add_argument("--backends", nargs="*", default=list(BACKENDS))
+    parser.add_argument("--pdfs", nargs="*", help="embed the chunks of these PDFs instead")
+    args = parser.parse_args(argv)
+
+    chunks = _pdf_chunks(args.pdfs) if args.pdfs else _synthetic_chunks(args.chunks, args.words)
+    reference = None
+    for name in args.backends:
+        try:
+            row = _measure(name, chunks, args.batch_size)
+        except Exception as exc:  # noqa: BLE001 - report and go on with the others
+            print(json.dumps({"backend": name, "error": f"{type(exc).__name__}: {exc}"}))
+            continue
+        vectors = row.pop("vectors")
+        if reference is None:
+            reference = vectors
+        elif vectors.shape == reference.shape:
+            # Agreement with the first backend measured (normally torch).
+            a = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+            b = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+            row["mean_cosine_vs_first"] = round(float(np.mean(np.sum(a * b, axis=1))), 4)
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""End-to-end throughput and latency of the pipeline on synthetic PDF corpora.
+
+For every corpus size (``--files`` PDFs of ``--pages`` pages of synthetic
+Spanish-like text) a fresh process measures:
+
+* ``extract_sources``: PDF parsing and chunking;
+* ``build_index``: embedding and indexing of the extracted chunks;
+* ``search_index``: hybrid (dense + BM25) queries against that index;
+* ``generate_introduction``: one cold run (the corpus is indexed) followed by
+  ``--runs`` warm runs on ``--concurrency`` threads, with the per-stage times
+  of the pipeline trace (see ``pirjo_pipeline.configure_tracing``).
+
+Chat completions are answered by :class:`StubChatClient`, an
+OpenAI-compatible stand-in that sleeps ``--latency`` seconds plus the
+generation time of ``--completion-tokens`` at ``--tokens-per-s``. The
+tokenizer and the embedding model are offline stand-ins as well (a word
+tokenizer and hashed vectors), so the benchmark runs without network on a
+CPU-only machine; ``--real-tokenizer`` and ``--real-model`` use tiktoken and
+sentence-transformers instead when their files are available locally.
+
+Every size prints one JSON line with timings, requests per second and the
+peak RSS of its process after each stage; ``--output`` also writes all rows
+plus the run environment to a JSON file for later comparison::
+
+    python benchmarks/pipeline_end_to_end.py --files 1 4 16 --pages 10
+    python benchmarks/pipeline_end_to_end.py --output bench/$(date +%F).json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+_WORDS = (
+    "el la de que los en estudio modelo datos resultados análisis método investigación "
+    "sistema red aprendizaje evaluación propuesta variables muestra efecto rendimiento "
+    "hipótesis literatura enfoque técnica población error validación desempeño"
+).split()
+
+
+def _sentence(rng: np.random.Generator, words: int) -> str:
+    return " ".join(rng.choice(_WORDS, size=words)).capitalize() + "."
+
+
+def make_corpus(
+    directory: str, files: int, pages: int, words_per_page: int, seed: int = 0
+) -> List[str]:
+    """Write ``files`` synthetic PDFs of ``pages`` pages into ``directory``."""
+    from fpdf import FPDF
+
+    rng = np.random.default_rng(seed)
+    paths = []
+    for number in range(files):
+        pdf = FPDF()
+        pdf.set_author(f"Autor {number}")
+        pdf.set_title(f"Documento sintético {number}")
+        pdf.set_font("Helvetica", size=10)
+        for _ in range(pages):
+            pdf.add_page()
+            text = " ".join(_sentence(rng, 12) for _ in range(max(1, words_per_page // 12)))
+            # The core fonts are latin-1 only.
+            pdf.multi_cell(0, 5, text.encode("latin-1", "replace").decode("latin-1"))
+        path = os.path.join(directory, f"doc{number:03d}.pdf")
+        pdf.output(path)
+        paths.append(path)
+    return paths
+
+
+class StubChatClient:
+    """OpenAI-compatible chat client that simulates a remote model offline.
+
+    Every request waits ``latency`` seconds (time to first token) plus
+    ``completion_tokens / tokens_per_s`` and answers with a JSON object
+    holding the five PIRJO keys, so every agent of the pipeline can parse
+    it. Responses carry ``usage`` like the real API; prompt tokens are
+    approximated by words.
+    """
+
+    def __init__(
+        self, latency: float = 0.2, tokens_per_s: float = 200.0, completion_tokens: int = 60
+    ):
+        self.latency = latency
+        self.tokens_per_s = tokens_per_s
+        self.completion_tokens = completion_tokens
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def _answer(self) -> str:
+        per_key = max(1, self.completion_tokens // 5)
+        text = " ".join(_WORDS[i % len(_WORDS)] for i in range(per_key))
+        return json.dumps({key: f"{text} [doc000.pdf:1:1]" for key in "PIRJO"}, ensure_ascii=False)
+
+    def create(
+        self, model: str, messages: List[Dict[str, str]], stream: bool = False, **kwargs: Any
+    ):
+        with self._lock:
+            self.requests += 1
+        usage = types.SimpleNamespace(
+            prompt_tokens=sum(len(m["content"].split()) for m in messages),
+            completion_tokens=self.completion_tokens,
+        )
+        time.sleep(self.latency)
+        if stream:
+            return self._stream(self._answer(), usage)
+        time.sleep(self.completion_tokens / self.tokens_per_s)
+        message = types.SimpleNamespace(content=self._answer())
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+
+    def _stream(self, answer: str, usage: Any) -> Iterator[Any]:
+        words = answer.split(" ")
+        for position, word in enumerate(words):
+            time.sleep(self.completion_tokens / self.tokens_per_s / len(words))
+            delta = types.SimpleNamespace(content=word if position == 0 else " " + word)
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)], usage=None)
+        yield types.SimpleNamespace(choices=[], usage=usage)
+
+
+class _WordEncoding:
+    """Offline stand-in for a ``tiktoken`` encoding: one token per word."""
+
+    def encode_batch(self, texts: List[str]) -> List[List[str]]:
+        return [text.split() for text in texts]
+
+    def decode_batch(self, batches: List[List[str]]) -> List[str]:
+        return [" ".join(tokens) for tokens in batches]
+
+
+class _HashModel:
+    """Offline stand-in for the embedding model: a fixed random vector per text."""
+
+    id = "hash"
+    dimension = 384
+
+    def encode(self, texts, **kwargs):
+        return np.stack(
+            [
+                np.random.default_rng(zlib.crc32(t.encode())).standard_normal(self.dimension)
+                for t in texts
+            ]
+        ).astype("float32")
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux.
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return round(float(np.percentile(values, q)), 3) if values else 0.0
+
+
+def _mean_stages(traces: List[Dict[str, Any]]) -> Dict[str, float]:
+    totals: Dict[str, float] = {}
+    for trace in traces:
+        for stage, spent in trace["stages"].items():
+            totals[stage] = totals.get(stage, 0.0) + spent["seconds"]
+    return {stage: round(total / len(traces), 4) for stage, total in sorted(totals.items())}
+
+
+def _configure(args: argparse.Namespace, workdir: str) -> StubChatClient:
+    """Point the pipeline at offline stand-ins and a private working directory."""
+    import pirjo_pipeline
+    import rag_faiss
+
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    client = StubChatClient(args.latency, args.tokens_per_s, args.completion_tokens)
+    pirjo_pipeline._get_client = lambda: client
+    if not args.real_tokenizer:
+        pirjo_pipeline.get_encoding = lambda model=pirjo_pipeline.CHUNK_MODEL: _WordEncoding()
+    if not args.real_model:
+        rag_faiss._MODEL = _HashModel()
+    # Caches would turn repeated runs into lookups.
+    pirjo_pipeline.configure_response_cache(False)
+    pirjo_pipeline.configure_extraction_cache(None)
+    rag_faiss.configure_embedding_cache(None)
+    pirjo_pipeline.configure_index_store(os.path.join(workdir, "store"))
+    pirjo_pipeline.configure_tracing(True)
+    return client
+
+
+def run_size(args: argparse.Namespace, files: int) -> Dict[str, Any]:
+    """Benchmark one corpus size; meant to run in a fresh process."""
+    import pirjo_pipeline
+    import rag_faiss
+
+    with tempfile.TemporaryDirectory() as workdir:
+        client = _configure(args, workdir)
+        paths = make_corpus(workdir, files, args.pages, args.words_per_page)
+        row: Dict[str, Any] = {"files": files, "pages": files * args.pages}
+
+        start = time.perf_counter()
+        sources, _ = pirjo_pipeline.extract_sources(paths)
+        elapsed = time.perf_counter() - start
+        row["extract_sources"] = {
+            "seconds": round(elapsed, 3),
+            "chunks": len(sources),
+            "pages_per_s": round(files * args.pages / elapsed, 1),
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+
+        index_file = os.path.join(workdir, "bench.index")
+        start = time.perf_counter()
+        index, metadata = rag_faiss.build_index(
+            sources, index_file=index_file, meta_file=os.path.join(workdir, "bench_meta.json")
+        )
+        elapsed = time.perf_counter() - start
+        row["build_index"] = {
+            "seconds": round(elapsed, 3),
+            "vectors": int(index.ntotal),
+            "chunks_per_s": round(len(sources) / elapsed, 1),
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+
+        lexical = rag_faiss.load_lexical_index(index_file, metadata)
+        rng = np.random.default_rng(1)
+        latencies = []
+        for _ in range(args.queries):
+            query = " ".join(rng.choice(_WORDS, size=8))
+            start = time.perf_counter()
+            rag_faiss.search_index_batch([query], 5, index, metadata, lexical=lexical)
+            latencies.append(1000 * (time.perf_counter() - start))
+        row["search_index"] = {
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "queries_per_s": round(1000 * len(latencies) / sum(latencies), 1),
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+
+        def _introduction(_: int) -> Dict[str, Any]:
+            return pirjo_pipeline.generate_introduction("Título", "Objetivo", "Resumen", paths)
+
+        start = time.perf_counter()
+        cold = _introduction(0)
+        cold_s = time.perf_counter() - start
+        requests_before = client.requests
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            warm = list(pool.map(_introduction, range(args.runs)))
+        elapsed = time.perf_counter() - start
+        latencies = [r["trace"]["duration_s"] for r in warm]
+        row["generate_introduction"] = {
+            "cold_s": round(cold_s, 3),
+            "cold_stages_s": _mean_stages([cold["trace"]]),
+            "warm_p50_s": _percentile(latencies, 50),
+            "warm_p95_s": _percentile(latencies, 95),
+            "warm_stages_s": _mean_stages([r["trace"] for r in warm]),
+            "introductions_per_s": round(args.runs / elapsed, 3),
+            "llm_requests_per_s": round((client.requests - requests_before) / elapsed, 2),
+            "llm_requests_per_introduction": requests_before,
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+    return row
+
+
+def _environment(args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+    }
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, nargs="*", default=[1, 4, 16], help="corpus sizes")
+    parser.add_argument("--pages", type=int, default=10, help="pages per PDF")
+    parser.add_argument("--words-per-page", type=int, default=350)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=4, help="warm introductions per size")
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds to first token")
+    parser.add_argument("--tokens-per-s", type=float, default=200.0)
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    parser.add_argument("--real-tokenizer", action="store_true", help="use tiktoken")
+    parser.add_argument("--real-model", action="store_true", help="use the embedding model")
+    parser.add_argument("--output", help="also write all results to this JSON file")
+    args = parser.parse_args(argv)
+
+    rows = []
+    for files in args.files:
+        # A process per size keeps peak RSS and loaded state independent.
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            row = pool.submit(run_size, args, files).result()
+        print(json.dumps(row, ensure_ascii=False), flush=True)
+        rows.append(row)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            payload = {"environment": _environment(args), "results": rows}
+            json.dump(payload, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
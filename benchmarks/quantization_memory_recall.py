@@ -0,0 +1,116 @@
+"""Memory-versus-recall benchmark of the vector encodings in ``rag_faiss``.
+
+Every encoding (``float32``, ``fp16``, ``sq8`` and ``pq``) is built over the
+same corpus and searched through ``rag_faiss.search_index_batch``, with and
+without exact re-ranking, and compared against the exact float32 flat
+index. The memory column is the serialised size of the index. By default
+the corpus is synthetic (clustered 384-dimensional vectors shaped like the
+``all-MiniLM-L6-v2`` embeddings); ``--pdfs`` embeds the chunks of real PDFs
+with the model instead::
+
+    python benchmarks/quantization_memory_recall.py --n 50000
+    python benchmarks/quantization_memory_recall.py --pdfs articulos/*.pdf
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rag_faiss
+from ann_recall_latency import _synthetic_vectors
+from meta_store import ChunkStore
+
+
+class _LookupModel:
+    """Return the precomputed vector of every text (``"v<i>"`` / ``"q<i>"``)."""
+
+    def __init__(self, corpus: np.ndarray, queries: np.ndarray):
+        self.vectors = {f"v{i}": v for i, v in enumerate(corpus)}
+        self.vectors.update({f"q{i}": v for i, v in enumerate(queries)})
+
+    def encode(self, texts, **kwargs):
+        return np.stack([self.vectors[t] for t in texts])
+
+
+def _pdf_corpus(paths: List[str], n_queries: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Embed the chunks of ``paths``; queries are perturbed chunk vectors."""
+    from pirjo_pipeline import extract_sources
+
+    sources, _ = extract_sources(paths)
+    corpus = rag_faiss._embed_texts([s["text"] for s in sources if s["text"].strip()])
+    rng = np.random.default_rng(1)
+    queries = corpus[rng.integers(0, len(corpus), size=n_queries)]
+    return corpus, queries
+
+
+def _synthetic_corpus(n: int, dim: int, n_queries: int) -> Tuple[np.ndarray, np.ndarray]:
+    corpus = _synthetic_vectors(n, dim)
+    rng = np.random.default_rng(1)
+    queries = corpus[rng.integers(0, n, size=n_queries)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype("float32")
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return corpus, np.ascontiguousarray(queries, dtype="float32")
+
+
+def _search(index, metadata, n_queries: int, k: int, rerank: int = None) -> Tuple[List[List[int]], float]:
+    queries = [f"q{i}" for i in range(n_queries)]
+    start = time.perf_counter()
+    hits = rag_faiss.search_index_batch(queries, k, index, metadata, dedupe=False, rerank=rerank)
+    elapsed = time.perf_counter() - start
+    return [[h["id"] for h in row] for row in hits], 1000 * elapsed / n_queries
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=20_000, help="synthetic vectors in the corpus")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rerank", type=int, default=50, help="candidates re-scored exactly")
+    parser.add_argument("--pdfs", nargs="*", help="embed these PDFs instead of synthetic data")
+    args = parser.parse_args(argv)
+
+    if args.pdfs:
+        corpus, queries = _pdf_corpus(args.pdfs, args.queries)
+    else:
+        corpus, queries = _synthetic_corpus(args.n, args.dim, args.queries)
+    # Search through the real code path: texts map back to the vectors above.
+    rag_faiss.configure_embedding_cache(None)
+    rag_faiss._MODEL = _LookupModel(corpus, queries)
+    metadata = ChunkStore.from_records(
+        [{"id": i, "file": "corpus", "page": 0, "chunk": i, "text": f"v{i}"} for i in range(len(corpus))]
+    )
+    ids = np.arange(len(corpus), dtype="int64")
+
+    truth = None
+    for encoding in rag_faiss.ENCODINGS:
+        spec = rag_faiss._index_spec("flat", encoding=encoding)
+        start = time.perf_counter()
+        index = rag_faiss._create_index(spec, corpus.shape[1], corpus)
+        index.add_with_ids(corpus, ids)
+        build_s = time.perf_counter() - start
+        if truth is None:
+            truth, _ = _search(index, metadata, len(queries), args.k)
+        effective = rag_faiss._describe_encoding(index)
+        row: Dict[str, object] = {
+            "encoding": effective,
+            "bytes_per_vector": rag_faiss._code_size(effective, corpus.shape[1]),
+            "index_bytes": int(rag_faiss.faiss.serialize_index(index).size),
+            "build_s": round(build_s, 3),
+        }
+        for label, rerank in (("", None), ("_rerank", args.rerank)):
+            found, ms = _search(index, metadata, len(queries), args.k, rerank)
+            recall = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(found, truth)])
+            row["recall" + label] = round(float(recall), 4)
+            row["ms_per_query" + label] = round(ms, 4)
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""BM25 inverted index over chunk texts.
+
+Postings are kept in compressed sparse row form: for every term ``t`` the
+slice ``indptr[t]:indptr[t + 1]`` of ``docs`` and ``tfs`` lists the documents
+containing it and the term frequencies. Documents are numbered by position;
+``ids`` maps positions back to chunk ids. Indexes are updated by merging
+the postings of the new documents instead of rebuilding them, and saved as a
+single ``.npz`` archive without pickled objects.
+"""
+
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Return the lower-cased word tokens of ``text``."""
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """Okapi BM25 scoring over an immutable set of documents."""
+
+    def __init__(
+        self,
+        terms: List[str],
+        indptr: np.ndarray,
+        docs: np.ndarray,
+        tfs: np.ndarray,
+        ids: np.ndarray,
+        lengths: np.ndarray,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.vocabulary: Dict[str, int] = {term: i for i, term in enumerate(terms)}
+        self.terms = terms
+        self.indptr = indptr
+        self.docs = docs
+        self.tfs = tfs
+        self.ids = ids
+        self.lengths = lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_length = float(lengths.mean()) if len(lengths) else 0.0
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[int, str]], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """Index ``(chunk_id, text)`` pairs."""
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        ids: List[int] = []
+        lengths: List[int] = []
+        for position, (chunk_id, text) in enumerate(documents):
+            tokens = tokenize(text)
+            ids.append(chunk_id)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((position, tf))
+        terms = sorted(postings)
+        indptr = np.zeros(len(terms) + 1, dtype="int64")
+        docs: List[int] = []
+        tfs: List[int] = []
+        for i, term in enumerate(terms):
+            for position, tf in postings[term]:
+                docs.append(position)
+                tfs.append(tf)
+            indptr[i + 1] = len(docs)
+        return cls(
+            terms,
+            indptr,
+            np.asarray(docs, dtype="int32"),
+            np.asarray(tfs, dtype="int32"),
+            np.asarray(ids, dtype="int64"),
+            np.asarray(lengths, dtype="int32"),
+            k1,
+            b,
+        )
+
+    @classmethod
+    def merge(cls, parts: List["BM25Index"], removed: Iterable[int] = ()) -> "BM25Index":
+        """Return one index over the documents of ``parts`` without ``removed`` ids.
+
+        Postings are combined with array operations instead of tokenizing the
+        texts again, so an update costs the new documents plus one pass over
+        the existing postings. ``k1`` and ``b`` are taken from the first part.
+        """
+        if not parts:
+            return cls.build([])
+        removed = np.fromiter(removed, dtype="int64")
+        terms = sorted(set().union(*(part.terms for part in parts)))
+        vocabulary = {term: i for i, term in enumerate(terms)}
+        term_ids, docs, tfs, ids, lengths = [], [], [], [], []
+        offset = 0
+        for part in parts:
+            keep = ~np.isin(part.ids, removed)
+            position = offset + np.cumsum(keep) - 1
+            mapping = np.fromiter((vocabulary[t] for t in part.terms), "int64", len(part.terms))
+            entry_terms = np.repeat(mapping, np.diff(part.indptr))
+            kept = keep[part.docs]
+            term_ids.append(entry_terms[kept])
+            docs.append(position[part.docs[kept]])
+            tfs.append(part.tfs[kept])
+            ids.append(part.ids[keep])
+            lengths.append(part.lengths[keep])
+            offset += int(keep.sum())
+        term_ids = np.concatenate(term_ids)
+        # A stable sort keeps the documents of every term in ascending order.
+        order = np.argsort(term_ids, kind="stable")
+        counts = np.bincount(term_ids, minlength=len(terms))
+        used = np.flatnonzero(counts)
+        return cls(
+            [terms[i] for i in used],
+            np.concatenate([[0], np.cumsum(counts[used])]).astype("int64"),
+            np.concatenate(docs)[order].astype("int32"),
+            np.concatenate(tfs)[order].astype("int32"),
+            np.concatenate(ids).astype("int64"),
+            np.concatenate(lengths).astype("int32"),
+            parts[0].k1,
+            parts[0].b,
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Return up to ``k`` ``(chunk_id, score)`` pairs, best first."""
+        n = len(self.ids)
+        term_ids = [self.vocabulary[t] for t in set(tokenize(query)) if t in self.vocabulary]
+        if not n or not term_ids or k <= 0:
+            return []
+        scores = np.zeros(n, dtype="float64")
+        norm = self.k1 * (1 - self.b + self.b * self.lengths / (self.avg_length or 1.0))
+        for t in term_ids:
+            start, stop = self.indptr[t], self.indptr[t + 1]
+            docs = self.docs[start:stop]
+            tf = self.tfs[start:stop].astype("float64")
+            df = stop - start
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        order = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(self.ids[pos]), float(scores[pos])) for pos in order]
+
+    def save(self, path: str) -> None:
+        """Write the index to ``path`` atomically."""
+        # Terms are stored as one UTF-8 blob plus offsets: a fixed-width
+        # string array would pad every term to the longest one.
+        encoded = [term.encode("utf-8") for term in self.terms]
+        offsets = np.zeros(len(encoded) + 1, dtype="int64")
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        blob = b"".join(encoded)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                terms=np.frombuffer(blob, dtype="uint8"),
+                term_offsets=offsets,
+                indptr=self.indptr,
+                docs=self.docs,
+                tfs=self.tfs,
+                ids=self.ids,
+                lengths=self.lengths,
+                params=np.asarray([self.k1, self.b], dtype="float64"),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Read an index written by :meth:`save`."""
+        with np.load(path) as data:
+            k1, b = data["params"].tolist()
+            if "term_offsets" in data.files:
+                blob = data["terms"].tobytes()
+                offsets = data["term_offsets"].tolist()
+                terms = [
+                    blob[start:stop].decode("utf-8") for start, stop in zip(offsets, offsets[1:])
+                ]
+            else:
+                # Written as a fixed-width string array by earlier versions.
+                terms = data["terms"].tolist()
+            return cls(
+                terms,
+                data["indptr"],
+                data["docs"],
+                data["tfs"],
+                data["ids"],
+                data["lengths"],
+                k1,
+                b,
+            )
@@ -0,0 +1,170 @@
+"""Select the retrieved chunks that fit a prompt's token budget.
+
+Every candidate chunk costs its text tokens plus the tokens of its citation
+header and is worth a relevance value derived from its retrieval scores. The
+packer picks chunks greedily by value per token, skipping (instead of
+stopping at) chunks that do not fit, and keeps the single most valuable
+chunk instead when that is worth more. Selected chunks that are adjacent on
+the same page share one citation header, and the tokens saved that way are
+offered to the remaining candidates.
+"""
+
+import logging
+from typing import Any, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Rank offset used to value chunks that carry no retrieval score.
+RANK_OFFSET = 60
+
+Fragment = Dict[str, Any]
+
+
+def chunk_label(chunk: Dict[str, Any]) -> str:
+    """Return the citation header of ``chunk``.
+
+    ``search_index`` may return metadata with either ``chunk_id`` or ``chunk``
+    as the identifier field; both are supported. Deduplicated chunks are cited
+    with every copy collapsed into them.
+    """
+    if chunk.get("citations"):
+        return " ".join(f"[{c['file']}:{c['page']}:{c['chunk']}]" for c in chunk["citations"])
+    number = chunk.get("chunk_id", chunk.get("chunk", ""))
+    return f"[{chunk['file']}:{chunk['page']}:{number}]"
+
+
+def _value(chunk: Dict[str, Any], rank: int) -> float:
+    """Return the relevance of ``chunk`` from its scores, or from its rank."""
+    if "rrf" in chunk:
+        return float(chunk["rrf"])
+    if "score" in chunk:
+        return 1.0 / (1.0 + float(chunk["score"]))
+    return 1.0 / (RANK_OFFSET + rank)
+
+
+def _number(chunk: Dict[str, Any]) -> Any:
+    return chunk.get("chunk_id", chunk.get("chunk"))
+
+
+def _greedy(
+    order: List[int], costs: List[int], budget: int, chosen: List[bool]
+) -> int:
+    """Add candidates of ``order`` that still fit; return the tokens used."""
+    used = 0
+    for i in order:
+        if not chosen[i] and costs[i] <= budget - used:
+            chosen[i] = True
+            used += costs[i]
+    return used
+
+
+def _merge(candidates: List[Dict[str, Any]], chosen: List[bool]) -> List[List[int]]:
+    """Group chosen candidates into runs of consecutive chunks of one page.
+
+    Every chosen candidate ends up in exactly one group; one that shares its
+    file, page and number with an earlier candidate is kept on its own.
+    """
+    position: Dict[Tuple[Any, Any, Any], int] = {}
+    for i, chunk in enumerate(candidates):
+        if chosen[i] and not chunk.get("citations"):
+            position.setdefault((chunk["file"], chunk["page"], _number(chunk)), i)
+    groups: List[List[int]] = []
+    absorbed = set()
+    for i, chunk in enumerate(candidates):
+        if not chosen[i] or i in absorbed:
+            continue
+        group = [i]
+        key = (chunk["file"], chunk["page"], _number(chunk))
+        if isinstance(key[2], int) and position.get(key) == i:
+            # Walk back to the first chunk of the run, then forward to its end.
+            start = _number(chunk)
+            while (chunk["file"], chunk["page"], start - 1) in position:
+                start -= 1
+            group = []
+            n = start
+            while (chunk["file"], chunk["page"], n) in position:
+                group.append(position[(chunk["file"], chunk["page"], n)])
+                n += 1
+        absorbed.update(group)
+        groups.append(group)
+    return groups
+
+
+def pack_context(
+    chunks: List[Dict[str, Any]],
+    budget: int,
+    count_tokens: Callable[[List[str]], List[int]],
+) -> Tuple[List[Fragment], Dict[str, int]]:
+    """Choose the most valuable ``chunks`` that fit in ``budget`` tokens.
+
+    ``chunks`` are retrieval hits, best first; precomputed ``"tokens"``
+    counts are used as they are and the other texts, together with all
+    citation headers, are counted with ``count_tokens`` in one batch. Returns
+    the fragments to render (``label``, ``text``, ``tokens``) ordered by
+    relevance, and a report with the ``budget``, the ``used`` and
+    ``available`` tokens and the number of ``candidates``, ``selected``
+    chunks and ``merged`` headers.
+    """
+    candidates = [c for c in chunks if c["text"].strip()]
+    labels = [chunk_label(c) + "\n" for c in candidates]
+    unknown = [c["text"] for c in candidates if c.get("tokens") is None]
+    counted = iter(count_tokens(labels + unknown) if candidates else [])
+    header_tokens = [next(counted) for _ in candidates]
+    text_tokens = [
+        c["tokens"] if c.get("tokens") is not None else next(counted) for c in candidates
+    ]
+    # The label, the text and the trailing blank line are counted apart.
+    costs = [h + t + 1 for h, t in zip(header_tokens, text_tokens)]
+    values = [_value(c, rank) for rank, c in enumerate(candidates)]
+    order = sorted(range(len(candidates)), key=lambda i: -values[i] / max(costs[i], 1))
+
+    chosen = [False] * len(candidates)
+    used = _greedy(order, costs, budget, chosen)
+    fitting = [i for i in range(len(candidates)) if costs[i] <= budget]
+    if fitting:
+        best = max(fitting, key=lambda i: values[i])
+        if values[best] > sum(v for v, c in zip(values, chosen) if c):
+            chosen = [i == best for i in range(len(candidates))]
+            used = costs[best]
+
+    groups = _merge(candidates, chosen)
+    saved = sum(header_tokens[i] for group in groups for i in group[1:])
+    if saved:
+        used -= saved
+        used += _greedy(order, costs, budget - used, chosen)
+        groups = _merge(candidates, chosen)
+        used = sum(
+            costs[group[0]] + sum(text_tokens[i] + 1 for i in group[1:]) for group in groups
+        )
+
+    groups.sort(key=lambda group: -max(values[i] for i in group))
+    fragments = [
+        {
+            "label": labels[group[0]].rstrip("\n"),
+            "text": "\n".join(candidates[i]["text"] for i in group),
+            "tokens": costs[group[0]] + sum(text_tokens[i] + 1 for i in group[1:]),
+        }
+        for group in groups
+    ]
+    report = {
+        "budget": budget,
+        "used": used,
+        "available": budget - used,
+        "candidates": len(candidates),
+        "selected": sum(len(group) for group in groups),
+        "merged": sum(len(group) - 1 for group in groups),
+    }
+    logger.info(
+        "Packed %d of %d chunks into %d/%d tokens (%d headers merged)",
+        report["selected"],
+        report["candidates"],
+        report["used"],
+        budget,
+        report["merged"],
+    )
+    return fragments, report
+
+
+def render_context(fragments: List[Fragment]) -> str:
+    """Return the prompt text of packed ``fragments``."""
+    return "".join(f"{f['label']}\n{f['text']}\n\n" for f in fragments)
@@ -0,0 +1,169 @@
+"""Exact and near-duplicate detection for chunk texts.
+
+Texts are normalised (lower case, collapsed whitespace) and first compared
+by hash. Texts that are not exact copies are compared with MinHash
+signatures over word shingles; locality-sensitive hashing on bands of the
+signature finds candidate pairs, which count as duplicates when their
+estimated Jaccard similarity reaches ``threshold``.
+"""
+
+import hashlib
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+_PRIME = np.uint64((1 << 61) - 1)
+_SPACES = re.compile(r"\s+")
+
+
+def normalise(text: str) -> str:
+    """Return ``text`` lower-cased with collapsed whitespace."""
+    return _SPACES.sub(" ", text).strip().lower()
+
+
+class Deduplicator:
+    """Incrementally map chunk texts to the first equivalent text seen.
+
+    :meth:`add` registers a text under a caller-provided id and returns the id
+    of an earlier exact or near duplicate, or ``None`` when the text is new.
+    Duplicates are never registered themselves, so returned ids always point
+    to a canonical text. :meth:`seed` registers texts indexed earlier, and
+    :meth:`remove` forgets keys again.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 5,
+        seed: int = 1,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 31, size=num_perm).astype("uint64")
+        self._b = rng.randint(0, 1 << 31, size=num_perm).astype("uint64")
+        self._exact: Dict[bytes, int] = {}
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        self._signatures: Dict[int, np.ndarray] = {}
+        self._digests: Dict[int, bytes] = {}
+        self._seeded: Set[int] = set()
+        self._duplicates: Dict[int, str] = {}
+        self.unique = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """Return the MinHash signature of ``text`` or ``None`` if it is too short."""
+        words = normalise(text).split()
+        if len(words) < self.shingle_size:
+            return None
+        size = self.shingle_size
+        shingles = {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+        hashes = np.fromiter(
+            (
+                int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+                for s in shingles
+            ),
+            dtype="uint64",
+            count=len(shingles),
+        )
+        return ((np.outer(hashes, self._a) + self._b) % _PRIME).min(axis=0)
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [
+            (band, signature[band * self.rows : (band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def add(self, key: int, text: str) -> Optional[int]:
+        """Register ``text`` under ``key`` or return the key of its duplicate."""
+        digest = hashlib.sha1(normalise(text).encode("utf-8")).digest()
+        original = self._exact.get(digest)
+        if original is not None:
+            self.exact_duplicates += 1
+            self._duplicates[key] = "exact"
+            return original
+        signature = self.signature(text)
+        if signature is not None:
+            bands = self._band_keys(signature)
+            seen = set()
+            for band in bands:
+                for candidate in self._buckets.get(band, ()):
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    similarity = float(np.mean(self._signatures[candidate] == signature))
+                    if similarity >= self.threshold:
+                        self.near_duplicates += 1
+                        self._duplicates[key] = "near"
+                        return candidate
+        self._register(key, digest, signature)
+        self.unique += 1
+        return None
+
+    def seed(self, key: int, text: str) -> None:
+        """Register ``text`` under ``key`` as a canonical text indexed earlier.
+
+        Seeded texts are matched by :meth:`add` but are not counted in
+        :meth:`stats`.
+        """
+        digest = hashlib.sha1(normalise(text).encode("utf-8")).digest()
+        if digest not in self._exact:
+            self._register(key, digest, self.signature(text))
+            self._seeded.add(key)
+
+    def _register(self, key: int, digest: bytes, signature: Optional[np.ndarray]) -> None:
+        if signature is not None:
+            for band in self._band_keys(signature):
+                self._buckets.setdefault(band, []).append(key)
+            self._signatures[key] = signature
+        self._exact[digest] = key
+        self._digests[key] = digest
+
+    def remove(self, keys: Iterable[int]) -> None:
+        """Forget the texts and duplicates registered under ``keys``.
+
+        Duplicates of a removed text are not re-examined; callers index them
+        again themselves.
+        """
+        for key in keys:
+            kind = self._duplicates.pop(key, None)
+            if kind == "exact":
+                self.exact_duplicates -= 1
+            elif kind == "near":
+                self.near_duplicates -= 1
+            digest = self._digests.pop(key, None)
+            if digest is None:
+                continue
+            if self._exact.get(digest) == key:
+                del self._exact[digest]
+            signature = self._signatures.pop(key, None)
+            if signature is not None:
+                for band in self._band_keys(signature):
+                    bucket = self._buckets[band]
+                    bucket.remove(key)
+                    if not bucket:
+                        del self._buckets[band]
+            if key in self._seeded:
+                self._seeded.discard(key)
+            else:
+                self.unique -= 1
+
+    def stats(self, dim: int = 0) -> Dict[str, int]:
+        """Return duplicate counters and the embedding work saved for ``dim``-sized vectors."""
+        duplicates = self.exact_duplicates + self.near_duplicates
+        return {
+            "chunks": self.unique + duplicates,
+            "unique": self.unique,
+            "exact_duplicates": self.exact_duplicates,
+            "near_duplicates": self.near_duplicates,
+            "embeddings_saved": duplicates,
+            "bytes_saved": duplicates * dim * 4,
+        }
@@ -0,0 +1,113 @@
+"""Interchangeable inference backends for the sentence-transformer model.
+
+``torch`` runs the model in PyTorch eager mode (the original behaviour),
+``onnx`` runs its ONNX Runtime export through sentence-transformers and
+``int8`` applies PyTorch dynamic int8 quantization to the linear layers,
+which speeds up CPU inference at a small cost in precision. Every backend
+reports its vector dimension without encoding anything and an ``id`` that
+tags embedding caches and indexes, so vectors of different backends never
+mix.
+"""
+
+import warnings
+from typing import Any, Dict, Optional, Type
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "int8")
+
+# Resolved on first use; importing sentence-transformers loads torch.
+SentenceTransformer: Optional[type] = None
+
+
+def _sentence_transformer(model_name: str, **kwargs: Any) -> Any:
+    """Instantiate ``SentenceTransformer``, importing it on first use."""
+    global SentenceTransformer
+    if SentenceTransformer is None:
+        from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, **kwargs)
+
+
+def backend_id(model_name: str, backend: str) -> str:
+    """Return the tag of vectors produced by ``model_name`` on ``backend``.
+
+    The PyTorch backend keeps the bare model name so that caches and indexes
+    written before backends existed stay valid.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {BACKENDS}")
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+class EmbeddingBackend:
+    """PyTorch eager-mode backend; base class of the other backends."""
+
+    name = "torch"
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.model = self._load()
+
+    def _load(self) -> Any:
+        return _sentence_transformer(self.model_name)
+
+    @property
+    def id(self) -> str:
+        """Tag of the vectors produced by this backend."""
+        return backend_id(self.model_name, self.name)
+
+    @property
+    def dimension(self) -> Optional[int]:
+        """Width of the vectors, as reported by the model."""
+        getter = getattr(self.model, "get_sentence_embedding_dimension", None)
+        return getter() if getter is not None else None
+
+    def encode(self, texts: Any, **kwargs: Any) -> np.ndarray:
+        """Embed ``texts`` (a string or a list); see ``SentenceTransformer.encode``."""
+        return self.model.encode(texts, **kwargs)
+
+
+class OnnxBackend(EmbeddingBackend):
+    """ONNX Runtime export of the model (needs ``sentence-transformers[onnx]``)."""
+
+    name = "onnx"
+
+    def _load(self) -> Any:
+        try:
+            return _sentence_transformer(self.model_name, backend="onnx")
+        except ImportError as exc:
+            raise RuntimeError(
+                "The onnx embedding backend needs onnxruntime and optimum: "
+                "pip install 'sentence-transformers[onnx]'"
+            ) from exc
+
+
+class Int8Backend(EmbeddingBackend):
+    """PyTorch model with its linear layers dynamically quantized to int8."""
+
+    name = "int8"
+
+    def _load(self) -> Any:
+        import torch
+
+        model = _sentence_transformer(self.model_name, device="cpu")
+        with warnings.catch_warnings():
+            # Recent torch releases flag eager-mode quantization as deprecated.
+            warnings.simplefilter("ignore", DeprecationWarning)
+            return torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+
+
+_CLASSES: Dict[str, Type[EmbeddingBackend]] = {
+    "torch": EmbeddingBackend,
+    "onnx": OnnxBackend,
+    "int8": Int8Backend,
+}
+
+
+def create_backend(backend: str, model_name: str) -> EmbeddingBackend:
+    """Load ``model_name`` on the backend called ``backend``."""
+    if backend not in _CLASSES:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {BACKENDS}")
+    return _CLASSES[backend](model_name)
@@ -0,0 +1,295 @@
+"""Persistent, content-addressed cache of text embeddings.
+
+Vectors are stored in a memory-mapped ``float32`` matrix (``vectors.f32``)
+with one slot per cached chunk. Each slot is described by the SHA-256 digest
+of its text (``keys.npy``, one 32-byte row per slot) and a logical access
+time (``ticks.npy``) that is used to evict the least recently used entries
+once the configured byte budget is reached. Every model gets its own sub-directory so that vectors of
+different models or dimensions never mix.
+
+Vectors are written to the memory map as they are stored, but the key index
+is only written every ``flush_every`` batches, before an occupied slot is
+reused and on :meth:`EmbeddingCache.close`, so a batch does not pay I/O
+proportional to the cache capacity. The files are shared between processes
+under ``fcntl.flock`` on ``<dir>/.lock``: every change writes a new token to
+``generation``, and an instance that finds someone else's token reloads the
+index from disk and forgets the entries it had not written yet.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_FLUSH_EVERY = 16
+_INITIAL_SLOTS = 1024
+_LOCK_FILE = ".lock"
+_GENERATION = "generation"
+
+
+def _digest(text: str) -> bytes:
+    """Return the SHA-256 digest used as cache key for ``text``."""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """On-disk LRU cache mapping chunk texts to embedding vectors."""
+
+    def __init__(
+        self,
+        directory: str,
+        model_name: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        flush_every: int = DEFAULT_FLUSH_EVERY,
+    ):
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.flush_every = flush_every
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.directory = os.path.join(directory, slug)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._handle = None
+        self._generation: Optional[str] = None
+        self._synced = False
+        self._pending = 0
+        os.makedirs(self.directory, exist_ok=True)
+        with self._locked(exclusive=False):
+            pass  # loads the index
+
+    # -- persistence -----------------------------------------------------
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.directory, "vectors.f32")
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[None]:
+        """Hold the thread lock and the file lock, with the index in sync."""
+        with self._lock:
+            if self._handle is None:
+                self._handle = open(os.path.join(self.directory, _LOCK_FILE), "a+b")
+            if fcntl is not None:
+                fcntl.flock(self._handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                self._sync()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._handle, fcntl.LOCK_UN)
+
+    def _sync(self) -> None:
+        """Reload the index if another instance changed the files since."""
+        try:
+            with open(os.path.join(self.directory, _GENERATION), "r", encoding="utf-8") as f:
+                generation: Optional[str] = f.read()
+        except OSError:
+            generation = None
+        if generation != self._generation or not self._synced:
+            self._load()
+            self._generation = generation
+            self._synced = True
+
+    def _bump(self) -> None:
+        """Tell other instances that the files changed (exclusive lock held)."""
+        self._generation = f"{os.getpid()}-{os.urandom(8).hex()}"
+        path = os.path.join(self.directory, _GENERATION)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(self._generation)
+        os.replace(path + ".tmp", path)
+
+    def _load(self) -> None:
+        self._dim: Optional[int] = None
+        self._vectors: Optional[np.memmap] = None
+        self._keys = np.zeros((0, 32), dtype="uint8")
+        self._ticks = np.zeros(0, dtype="int64")
+        self._slots: Dict[bytes, int] = {}
+        self._clock = 0
+        self._pending = 0
+        try:
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            keys = np.load(os.path.join(self.directory, "keys.npy"))
+            ticks = np.load(os.path.join(self.directory, "ticks.npy"))
+            dim, capacity = int(meta["dim"]), int(meta["capacity"])
+            if len(keys) != capacity or len(ticks) != capacity:
+                return
+            vectors = np.memmap(self._vectors_path, dtype="float32", mode="r+", shape=(capacity, dim))
+        except (OSError, ValueError):
+            return
+        self._dim = dim
+        self._keys = keys
+        self._ticks = ticks
+        self._vectors = vectors
+        self._slots = {k.tobytes(): i for i, k in enumerate(keys) if ticks[i] > 0}
+        self._clock = int(ticks.max()) if capacity else 0
+
+    def flush(self) -> None:
+        """Write vectors and the key index to disk."""
+        with self._locked(exclusive=True):
+            if self._pending:
+                self._flush()
+                self._bump()
+
+    def close(self) -> None:
+        """Flush pending entries and release the lock file."""
+        self.flush()
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+    def _flush(self) -> None:
+        self._pending = 0
+        if self._vectors is None:
+            return
+        self._vectors.flush()
+        for name, arr in (("keys.npy", self._keys), ("ticks.npy", self._ticks)):
+            tmp = os.path.join(self.directory, f".{name}.tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, arr)
+            os.replace(tmp, os.path.join(self.directory, name))
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self._dim, "capacity": len(self._keys), "model": self.model_name}, f)
+        os.replace(tmp, self._meta_path)
+
+    def _resize(self, capacity: int) -> None:
+        """Grow the vector file and key arrays to ``capacity`` slots."""
+        os.makedirs(self.directory, exist_ok=True)
+        old = len(self._keys)
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self._vectors_path, "ab") as f:
+            # Never shrink the file: another process may map more slots.
+            if f.seek(0, os.SEEK_END) < capacity * self._dim * 4:
+                f.truncate(capacity * self._dim * 4)
+        self._vectors = np.memmap(self._vectors_path, dtype="float32", mode="r+", shape=(capacity, self._dim))
+        self._keys = np.concatenate([self._keys, np.zeros((capacity - old, 32), dtype="uint8")])
+        self._ticks = np.concatenate([self._ticks, np.zeros(capacity - old, dtype="int64")])
+        # Other processes learn the new capacity from the index.
+        self._flush()
+
+    def _reset(self, dim: int) -> None:
+        """Drop every entry and start over with vectors of size ``dim``."""
+        self._vectors = None
+        self._dim = dim
+        self._keys = np.zeros((0, 32), dtype="uint8")
+        self._ticks = np.zeros(0, dtype="int64")
+        self._slots = {}
+        if os.path.exists(self._vectors_path):
+            os.remove(self._vectors_path)
+
+    # -- public API ------------------------------------------------------
+
+    @property
+    def max_entries(self) -> int:
+        """Number of vectors that fit in ``max_bytes``."""
+        if not self._dim:
+            return 0
+        return self.max_bytes // (self._dim * 4)
+
+    def lookup(self, texts: List[str]) -> Tuple[List[int], Optional[np.ndarray], List[int]]:
+        """Return cached vectors for ``texts``.
+
+        The result is ``(hit_positions, hit_matrix, miss_positions)`` where
+        ``hit_matrix`` holds one row per entry of ``hit_positions`` (or is
+        ``None`` when nothing was found).
+        """
+        hits: List[int] = []
+        slots: List[int] = []
+        misses: List[int] = []
+        with self._locked(exclusive=False):
+            for pos, text in enumerate(texts):
+                slot = self._slots.get(_digest(text))
+                if slot is None:
+                    misses.append(pos)
+                else:
+                    hits.append(pos)
+                    slots.append(slot)
+            self.hits += len(hits)
+            self.misses += len(misses)
+            if not hits:
+                return hits, None, misses
+            self._clock += 1
+            self._ticks[slots] = self._clock
+            matrix = np.array(self._vectors[slots], dtype="float32")
+        return hits, matrix, misses
+
+    def store(self, texts: Iterable[str], vectors: np.ndarray) -> None:
+        """Insert ``vectors`` for ``texts``, evicting LRU entries if needed."""
+        vectors = np.asarray(vectors, dtype="float32")
+        if vectors.ndim != 2 or not len(vectors):
+            return
+        with self._locked(exclusive=True):
+            if self._dim != vectors.shape[1]:
+                self._reset(vectors.shape[1])
+                self._bump()
+            max_entries = self.max_entries
+            if max_entries == 0:
+                return
+            keys = list(dict.fromkeys(_digest(t) for t in texts))
+            rows = {k: i for i, k in enumerate(_digest(t) for t in texts)}
+            new_keys = [k for k in keys if k not in self._slots][:max_entries]
+            if not new_keys:
+                return
+            free = self._free_slots(len(new_keys), max_entries)
+            self._clock += 1
+            for key, slot in zip(new_keys, free):
+                self._keys[slot] = np.frombuffer(key, dtype="uint8")
+                self._ticks[slot] = self._clock
+                self._vectors[slot] = vectors[rows[key]]
+                self._slots[key] = slot
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._flush()
+            self._bump()
+
+    def _free_slots(self, needed: int, max_entries: int) -> List[int]:
+        """Return ``needed`` slots, growing the store or evicting LRU entries."""
+        capacity = len(self._keys)
+        used = len(self._slots)
+        if used + needed > capacity and capacity < max_entries:
+            target = max(capacity * 2, used + needed, _INITIAL_SLOTS)
+            self._resize(min(target, max_entries))
+        empty = np.flatnonzero(self._ticks == 0)[:needed].tolist()
+        shortfall = needed - len(empty)
+        if shortfall > 0:
+            occupied = np.flatnonzero(self._ticks > 0)
+            evicted = occupied[np.argsort(self._ticks[occupied], kind="stable")[:shortfall]]
+            for slot in evicted.tolist():
+                self._slots.pop(self._keys[slot].tobytes(), None)
+            self._ticks[evicted] = 0
+            # The index on disk must not pair the evicted keys with new vectors.
+            self._flush()
+            empty.extend(evicted.tolist())
+        return empty
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current cache footprint."""
+        with self._locked(exclusive=False):
+            entries = len(self._slots)
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": entries,
+                "bytes": entries * (self._dim or 0) * 4,
+                "max_bytes": self.max_bytes,
+            }
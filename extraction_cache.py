@@ -0,0 +1,140 @@
+"""Persistent cache of text extracted from PDFs, keyed by file contents.
+
+Every entry is a gzip-compressed JSON document named after the SHA-256 of
+the PDF bytes and holds the bibliographic metadata plus the text, token
+chunks and per-chunk token counts of every page. Entries record the chunking ``fingerprint`` they were
+produced with; an entry whose fingerprint no longer matches is treated as a
+miss and deleted. Once the directory exceeds ``max_bytes`` the least
+recently used entries (by modification time, refreshed on every hit) are
+removed.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+_SUFFIX = ".json.gz"
+
+Page = Tuple[int, str, List[str], List[int]]
+
+
+def file_digest(path: str) -> str:
+    """Return the hex SHA-256 of the contents of ``path``."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Size-bounded on-disk cache of ``(info, pages)`` per PDF digest."""
+
+    def __init__(
+        self,
+        directory: str,
+        fingerprint: Dict[str, Any],
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest + _SUFFIX)
+
+    def get(self, digest: str) -> Optional[Tuple[Dict[str, Any], List[Page]]]:
+        """Return the cached ``(info, pages)`` for ``digest`` or ``None``."""
+        path = self._path(digest)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+        if entry is not None and entry.get("fingerprint") != self.fingerprint:
+            self._remove(path)
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        pages = [(p["page"], p["text"], p["chunks"], p["tokens"]) for p in entry["pages"]]
+        return entry["info"], pages
+
+    def put(self, digest: str, info: Dict[str, Any], pages: List[Page]) -> None:
+        """Store ``info`` and ``pages`` for ``digest`` and enforce the size cap."""
+        entry = {
+            "fingerprint": self.fingerprint,
+            "info": info,
+            "pages": [
+                {"page": n, "text": text, "chunks": chunks, "tokens": tokens}
+                for n, text, chunks, tokens in pages
+            ],
+        }
+        path = self._path(digest)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._evict()
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until under ``max_bytes``."""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for item in it:
+                if item.name.endswith(_SUFFIX):
+                    st = item.stat()
+                    entries.append((st.st_mtime, st.st_size, item.path))
+                    total += st.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        """Remove every cached entry."""
+        with os.scandir(self.directory) as it:
+            for item in it:
+                if item.name.endswith(_SUFFIX):
+                    self._remove(item.path)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current size on disk."""
+        size = 0
+        entries = 0
+        with os.scandir(self.directory) as it:
+            for item in it:
+                if item.name.endswith(_SUFFIX):
+                    size += item.stat().st_size
+                    entries += 1
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+            }
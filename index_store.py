@@ -0,0 +1,360 @@
+"""Per-corpus index directories with locking and an in-process LRU.
+
+Every corpus (a set of input files) is identified by :func:`corpus_key`, a
+hash of the file names and contents, and gets its own directory under the
+store root. Building or loading a corpus happens under an exclusive lock
+(``fcntl.flock`` on ``<dir>/.lock`` across processes, plus a thread lock)
+and a ``.complete`` marker is written once a build has finished, so readers
+never see a half-written index. Loaded values are kept in a small LRU so
+that repeated queries against a hot corpus do not touch the disk. The key of
+the last corpus used is remembered so that it can be preloaded at start-up.
+
+A corpus can be built with a list of ``members`` (e.g. one entry per file).
+A new corpus is then seeded with a copy of the stored corpus that shares the
+most members, so that its build only has to apply the difference; the
+members it was copied from are available to the build through
+:func:`seed_members`. The copy is staged under the lock of the source corpus
+before the lock of the new corpus is taken, so a caller never holds two
+corpus locks at once. Beyond
+``max_corpora`` built corpora, the least recently used ones are removed from
+disk.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from extraction_cache import file_digest
+from instrumentation import count
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+DEFAULT_MAX_LOADED = 4
+DEFAULT_MAX_CORPORA = 32
+_MARKER = ".complete"
+_MEMBERS = ".members.json"
+_SEED = ".seed.json"
+_LAST_USED = ".last_used"
+_LOCK_FILE = ".lock"
+
+
+def corpus_members(file_paths: List[str]) -> List[str]:
+    """Return one ``"<name>:<sha256>"`` entry per file of ``file_paths``."""
+    return [f"{os.path.basename(path)}:{file_digest(path)}" for path in file_paths]
+
+
+def corpus_key(file_paths: List[str], members: Optional[List[str]] = None) -> str:
+    """Return a stable key for the names and contents of ``file_paths``.
+
+    ``members`` may pass the result of :func:`corpus_members` to avoid
+    hashing the files again.
+    """
+    digest = hashlib.sha256()
+    for member in members if members is not None else corpus_members(file_paths):
+        name, content = member.rsplit(":", 1)
+        digest.update(name.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(content.encode("ascii"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def seed_members(directory: str) -> List[str]:
+    """Return the members of the corpus ``directory`` was seeded from, if any.
+
+    Only meaningful inside the ``build`` callback of :meth:`IndexStore.get`.
+    """
+    try:
+        with open(os.path.join(directory, _SEED), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+class IndexStore:
+    """Directory-per-corpus store of built indexes."""
+
+    def __init__(
+        self,
+        root: str,
+        max_loaded: int = DEFAULT_MAX_LOADED,
+        max_corpora: int = DEFAULT_MAX_CORPORA,
+    ):
+        self.root = root
+        self.max_loaded = max_loaded
+        self.max_corpora = max_corpora
+        self.hits = 0
+        self.loads = 0
+        self.builds = 0
+        self.seeded = 0
+        self.removed = 0
+        self._loaded: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._last: Optional[str] = None
+        os.makedirs(root, exist_ok=True)
+
+    def directory(self, key: str) -> str:
+        """Return the directory holding the files of corpus ``key``."""
+        return os.path.join(self.root, key)
+
+    @contextmanager
+    def lock(self, key: str) -> Iterator[str]:
+        """Hold the exclusive lock of corpus ``key`` and yield its directory."""
+        directory = self.directory(key)
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock, open(os.path.join(directory, _LOCK_FILE), "a+b") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield directory
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _remember(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._loaded[key] = value
+            self._loaded.move_to_end(key)
+            while len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+
+    def _touch(self, key: str) -> None:
+        """Record ``key`` as the last corpus used."""
+        if key == self._last:
+            return
+        self._last = key
+        try:
+            # The marker's modification time orders corpora for eviction.
+            os.utime(os.path.join(self.directory(key), _MARKER))
+        except OSError:
+            pass
+        path = os.path.join(self.root, _LAST_USED)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(key)
+        os.replace(tmp, path)
+
+    def last_used(self) -> Optional[str]:
+        """Return the key of the last corpus used, if it is still on disk."""
+        try:
+            with open(os.path.join(self.root, _LAST_USED), "r", encoding="utf-8") as f:
+                key = f.read().strip()
+        except OSError:
+            return None
+        if key and os.path.exists(os.path.join(self.directory(key), _MARKER)):
+            return key
+        return None
+
+    def preload(self, key: str, load: Callable[[str], Any]) -> Optional[Any]:
+        """Load corpus ``key`` into memory if it has been built; never builds."""
+        with self._lock:
+            if key in self._loaded:
+                return self._loaded[key]
+        if not os.path.exists(os.path.join(self.directory(key), _MARKER)):
+            return None
+        with self.lock(key) as directory:
+            with self._lock:
+                if key in self._loaded:
+                    return self._loaded[key]
+            value = load(directory)
+            self.loads += 1
+            self._remember(key, value)
+            return value
+
+    def _stage_seed(self, members: List[str], group: str) -> Optional[str]:
+        """Copy the built corpus sharing most ``members`` to a staging directory.
+
+        Only corpora of the same ``group`` qualify. The copy is made under the
+        lock of the source corpus alone, and the seed's members are written to
+        the staging directory for :func:`seed_members`. Returns the staging
+        directory, which the caller removes.
+        """
+        wanted = set(members)
+        best, best_shared = None, 0
+        for name in os.listdir(self.root):
+            manifest = self._manifest(name)
+            if manifest is None or manifest.get("group") != group:
+                continue
+            shared = len(wanted & set(manifest.get("members", [])))
+            if shared > best_shared:
+                best, best_shared = name, shared
+        if best is None:
+            return None
+        stage = tempfile.mkdtemp(prefix=".seed-", dir=self.root)
+        with self.lock(best) as source:
+            manifest = self._manifest(best)
+            if manifest is None:
+                shutil.rmtree(stage, ignore_errors=True)
+                return None
+            for name in os.listdir(source):
+                if name not in (_LOCK_FILE, _MARKER, _MEMBERS, _SEED):
+                    shutil.copy2(os.path.join(source, name), os.path.join(stage, name))
+        with open(os.path.join(stage, _SEED), "w", encoding="utf-8") as f:
+            json.dump(manifest.get("members", []), f)
+        return stage
+
+    def _manifest(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the members file of built corpus ``key``, if any."""
+        directory = self.directory(key)
+        if not os.path.exists(os.path.join(directory, _MARKER)):
+            return None
+        try:
+            with open(os.path.join(directory, _MEMBERS), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get(
+        self,
+        key: str,
+        build: Callable[[str], Any],
+        load: Callable[[str], Any],
+        members: Optional[List[str]] = None,
+        group: str = "",
+    ) -> Any:
+        """Return corpus ``key`` from memory, from disk or by building it.
+
+        ``build`` and ``load`` receive the corpus directory. ``build`` runs at
+        most once per corpus even with concurrent callers; the others wait for
+        the lock and then ``load`` the finished files. With ``members``, a new
+        corpus directory starts as a copy of the built corpus of ``group``
+        that shares most of them, which ``build`` is expected to update
+        (:func:`seed_members` tells it which members the copy already holds).
+        """
+        with self._lock:
+            value = self._loaded.get(key)
+            if value is not None:
+                self.hits += 1
+                self._loaded.move_to_end(key)
+        if value is not None:
+            count("index_store.hits")
+            self._touch(key)
+            return value
+        stage = None
+        if members and not os.path.exists(os.path.join(self.directory(key), _MARKER)):
+            # Staged before taking the corpus lock: see _stage_seed.
+            stage = self._stage_seed(members, group)
+        try:
+            with self.lock(key) as directory:
+                with self._lock:
+                    if key in self._loaded:
+                        self.hits += 1
+                        count("index_store.hits")
+                        return self._loaded[key]
+                self._touch(key)
+                marker = os.path.join(directory, _MARKER)
+                built = not os.path.exists(marker)
+                if not built:
+                    value = load(directory)
+                    self.loads += 1
+                    count("index_store.loads")
+                else:
+                    value = self._build(directory, build, members, group, stage)
+                self._remember(key, value)
+        finally:
+            if stage is not None:
+                shutil.rmtree(stage, ignore_errors=True)
+        if built:
+            # Outside the corpus lock, so that only one lock is held at a time.
+            self.prune(keep=key)
+        return value
+
+    def _build(
+        self,
+        directory: str,
+        build: Callable[[str], Any],
+        members: Optional[List[str]],
+        group: str,
+        stage: Optional[str],
+    ) -> Any:
+        """Run ``build`` in ``directory`` (lock held), starting from ``stage``."""
+        # Leftovers of an interrupted build are not trusted.
+        _clear(directory)
+        if stage is not None:
+            for name in os.listdir(stage):
+                os.replace(os.path.join(stage, name), os.path.join(directory, name))
+            self.seeded += 1
+            count("index_store.seeded")
+        value = build(directory)
+        seed = os.path.join(directory, _SEED)
+        if os.path.exists(seed):
+            os.remove(seed)
+        if members is not None:
+            with open(os.path.join(directory, _MEMBERS), "w", encoding="utf-8") as f:
+                json.dump({"group": group, "members": list(members)}, f)
+        with open(os.path.join(directory, _MARKER), "w", encoding="utf-8"):
+            pass
+        self.builds += 1
+        count("index_store.builds")
+        return value
+
+    def prune(self, keep: Optional[str] = None) -> List[str]:
+        """Remove the least recently used corpora beyond ``max_corpora``.
+
+        Corpora loaded in this process and ``keep`` are never removed; the
+        lock file of a removed corpus stays so that waiting builders are not
+        left with a deleted directory. Returns the keys removed.
+        """
+        if self.max_corpora <= 0:
+            return []
+        built = []
+        for name in os.listdir(self.root):
+            try:
+                built.append((os.path.getmtime(os.path.join(self.root, name, _MARKER)), name))
+            except OSError:
+                continue
+        with self._lock:
+            protected = set(self._loaded) | {keep}
+        removed = []
+        excess = len(built) - self.max_corpora
+        for _, name in sorted(built):
+            if excess <= 0:
+                break
+            if name in protected:
+                continue
+            with self.lock(name) as directory:
+                _clear(directory)
+            removed.append(name)
+            excess -= 1
+        self.removed += len(removed)
+        return removed
+
+    def evict(self, key: str) -> None:
+        """Forget the in-memory copy of corpus ``key``."""
+        with self._lock:
+            self._loaded.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit, load, build, seed and removal counters."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "loads": self.loads,
+                "builds": self.builds,
+                "seeded": self.seeded,
+                "removed": self.removed,
+                "loaded": len(self._loaded),
+                "max_loaded": self.max_loaded,
+            }
+
+
+def _clear(directory: str) -> None:
+    """Remove every file of ``directory`` but its lock, marker first."""
+    marker = os.path.join(directory, _MARKER)
+    if os.path.exists(marker):
+        os.remove(marker)
+    for name in os.listdir(directory):
+        if name != _LOCK_FILE:
+            os.remove(os.path.join(directory, name))
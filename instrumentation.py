@@ -0,0 +1,433 @@
+"""Optional per-run tracing of the pipeline: stage timings, tokens and counters.
+
+Instrumented code opens :func:`span` blocks and bumps :func:`count`
+counters. Both only record something while a :class:`Trace` is active in the
+current context (see :meth:`Trace.activate` and :meth:`Trace.wrap`);
+otherwise they cost a single context-variable lookup. A finished trace is a
+JSON-serialisable dict (:meth:`Trace.to_dict`) that can also be rendered in
+the Prometheus text format (:func:`to_prometheus`) or as OpenTelemetry
+(OTLP/JSON) spans (:func:`to_otel`).
+
+Threads do not inherit context variables: work submitted to a pool or a
+thread is wrapped with :func:`bind` to be recorded in the caller's trace.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+FORMATS = ("json", "prometheus", "otel")
+
+_TRACE: "contextvars.ContextVar[Optional[Trace]]" = contextvars.ContextVar(
+    "pipeline_trace", default=None
+)
+# ``(name, span_id)`` of the innermost open span.
+_PARENT: "contextvars.ContextVar[Optional[Tuple[str, str]]]" = contextvars.ContextVar(
+    "pipeline_span", default=None
+)
+
+
+def _new_id(length: int = 16) -> str:
+    return uuid.uuid4().hex[:length]
+
+
+class Trace:
+    """Spans and counters recorded during one pipeline run."""
+
+    def __init__(self, name: str, **attrs: Any):
+        self.name = name
+        self.attrs = attrs
+        self.trace_id = uuid.uuid4().hex
+        self.span_id = _new_id()
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.spans: List[Dict[str, Any]] = []
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        """Seconds since the trace started."""
+        return time.perf_counter() - self._t0
+
+    def add_span(
+        self,
+        name: str,
+        start: float,
+        duration: float,
+        attrs: Dict[str, Any],
+        parent: Optional[Tuple[str, str]] = None,
+        span_id: Optional[str] = None,
+    ) -> None:
+        """Record a finished span; ``start`` is relative to the trace start."""
+        record = {
+            "name": name,
+            "span_id": span_id or _new_id(),
+            "parent": parent[0] if parent else None,
+            "parent_id": parent[1] if parent else self.span_id,
+            "start_s": round(start, 6),
+            "duration_s": round(duration, 6),
+            "thread": threading.current_thread().name,
+            "attrs": attrs,
+        }
+        with self._lock:
+            self.spans.append(record)
+
+    def count(self, name: str, value: float = 1) -> None:
+        """Add ``value`` to the counter ``name``."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def activate(self) -> Iterator["Trace"]:
+        """Make this trace the current one inside the ``with`` block."""
+        token = _TRACE.set(self)
+        try:
+            yield self
+        finally:
+            _TRACE.reset(token)
+
+    def wrap(self, iterator: Iterable[Any]) -> Iterator[Any]:
+        """Iterate ``iterator`` with this trace active in every step.
+
+        Each step runs in a private copy of the context, so spans may stay
+        open across ``yield`` without leaking into the consumer's context.
+        """
+        context = contextvars.copy_context()
+        context.run(_TRACE.set, self)
+        iterator = iter(iterator)
+        while True:
+            try:
+                item = context.run(next, iterator)
+            except StopIteration:
+                return
+            yield item
+
+    def finish(self) -> None:
+        """Fix the total duration of the trace."""
+        if self.duration is None:
+            self.duration = self.elapsed()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the trace as a JSON-serialisable dict.
+
+        ``stages`` sums the calls and seconds of every span name and
+        ``llm_calls`` breaks the ``"llm"`` spans down by the span that made
+        the call, with their token usage and cache hits.
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_s"])
+            counters = dict(self.counters)
+        stages: Dict[str, Dict[str, float]] = {}
+        llm_calls: Dict[str, Dict[str, float]] = {}
+        for record in spans:
+            stage = stages.setdefault(record["name"], {"calls": 0, "seconds": 0.0})
+            stage["calls"] += 1
+            stage["seconds"] = round(stage["seconds"] + record["duration_s"], 6)
+            if record["name"] != "llm":
+                continue
+            caller = llm_calls.setdefault(
+                record["parent"] or "?",
+                {
+                    "calls": 0,
+                    "seconds": 0.0,
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "cache_hits": 0,
+                },
+            )
+            attrs = record["attrs"]
+            caller["calls"] += 1
+            caller["seconds"] = round(caller["seconds"] + record["duration_s"], 6)
+            caller["prompt_tokens"] += attrs.get("prompt_tokens", 0)
+            caller["completion_tokens"] += attrs.get("completion_tokens", 0)
+            caller["cache_hits"] += int(bool(attrs.get("cached")))
+        duration = self.duration if self.duration is not None else self.elapsed()
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "started_at": self.started_at,
+            "duration_s": round(duration, 6),
+            "attrs": self.attrs,
+            "stages": stages,
+            "llm_calls": llm_calls,
+            "counters": counters,
+            "spans": spans,
+        }
+
+
+class _Span:
+    """Context manager that records one span of the current trace."""
+
+    __slots__ = ("trace", "name", "attrs", "span_id", "_start", "_token", "_parent")
+
+    def __init__(self, trace: Trace, name: str, attrs: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+        self.span_id = _new_id()
+
+    def set(self, key: str, value: Any) -> None:
+        """Attach ``key=value`` to the span."""
+        self.attrs[key] = value
+
+    def __enter__(self) -> "_Span":
+        self._parent = _PARENT.get()
+        self._token = _PARENT.set((self.name, self.span_id))
+        self._start = self.trace.elapsed()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = self.trace.elapsed() - self._start
+        try:
+            _PARENT.reset(self._token)
+        except ValueError:  # a generator closed from another context
+            _PARENT.set(self._parent)
+        if exc_type is not None and exc_type is not GeneratorExit:
+            self.attrs["error"] = exc_type.__name__
+        self.trace.add_span(
+            self.name, self._start, duration, self.attrs, self._parent, self.span_id
+        )
+
+
+class _NullSpan:
+    """Shared stand-in for :class:`_Span` when tracing is off."""
+
+    __slots__ = ()
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def current() -> Optional[Trace]:
+    """Return the trace active in this context, if any."""
+    return _TRACE.get()
+
+
+def span(name: str, **attrs: Any):
+    """Time the ``with`` block as a span called ``name`` of the current trace.
+
+    The object bound by ``as`` accepts further attributes with ``set``.
+    Without an active trace a shared no-op object is returned.
+    """
+    trace = _TRACE.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name, attrs)
+
+
+def traced(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorator recording every call of the function as a span called ``name``."""
+
+    def decorate(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            trace = _TRACE.get()
+            if trace is None:
+                return fn(*args, **kwargs)
+            with _Span(trace, name, {}):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def count(name: str, value: float = 1) -> None:
+    """Add ``value`` to the counter ``name`` of the current trace, if any."""
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.count(name, value)
+
+
+def bind(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Return ``fn`` bound to a copy of the current context, for other threads.
+
+    Without an active trace ``fn`` is returned unchanged.
+    """
+    if _TRACE.get() is None:
+        return fn
+    context = contextvars.copy_context()
+
+    def _run(*args: Any, **kwargs: Any) -> Any:
+        return context.run(fn, *args, **kwargs)
+
+    return _run
+
+
+def timed_iter(name: str, iterable: Iterable[Any], **attrs: Any) -> Iterable[Any]:
+    """Record the time spent producing the items of ``iterable`` as one span.
+
+    Only the time inside the producer counts, not the time the consumer
+    spends between items; the span also carries the number of ``items``.
+    Without an active trace ``iterable`` is returned unchanged.
+    """
+    trace = _TRACE.get()
+    if trace is None:
+        return iterable
+    return _timed_iter(trace, name, iter(iterable), attrs)
+
+
+def _timed_iter(
+    trace: Trace, name: str, iterator: Iterator[Any], attrs: Dict[str, Any]
+) -> Iterator[Any]:
+    parent = _PARENT.get()
+    start = trace.elapsed()
+    busy = 0.0
+    items = 0
+    try:
+        while True:
+            step = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                busy += time.perf_counter() - step
+                return
+            busy += time.perf_counter() - step
+            items += 1
+            yield item
+    finally:
+        attrs["items"] = items
+        trace.add_span(name, start, busy, attrs, parent)
+
+
+def _metric_name(name: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_prometheus(trace: Dict[str, Any], prefix: str = "pirjo") -> str:
+    """Render a :meth:`Trace.to_dict` result in the Prometheus text format.
+
+    The output suits the node-exporter textfile collector or a push gateway.
+    Counters are exported under ``<prefix>_counter_`` so that they never
+    share a family with the per-stage and per-caller gauges.
+    """
+    lines = [
+        f"# TYPE {prefix}_run_duration_seconds gauge",
+        f"{prefix}_run_duration_seconds {trace['duration_s']}",
+        f"# TYPE {prefix}_stage_seconds gauge",
+    ]
+    for stage, totals in sorted(trace["stages"].items()):
+        lines.append(f'{prefix}_stage_seconds{{stage="{_label(stage)}"}} {totals["seconds"]}')
+    lines.append(f"# TYPE {prefix}_stage_calls gauge")
+    for stage, totals in sorted(trace["stages"].items()):
+        lines.append(f'{prefix}_stage_calls{{stage="{_label(stage)}"}} {totals["calls"]}')
+    for field in ("seconds", "calls", "prompt_tokens", "completion_tokens", "cache_hits"):
+        lines.append(f"# TYPE {prefix}_llm_{field} gauge")
+        for caller, totals in sorted(trace["llm_calls"].items()):
+            lines.append(f'{prefix}_llm_{field}{{caller="{_label(caller)}"}} {totals[field]}')
+    families = set()
+    for name, value in sorted(trace["counters"].items()):
+        metric = f"{prefix}_counter_{_metric_name(name)}"
+        if metric in families:
+            # Another counter already maps to this name once sanitised.
+            continue
+        families.add(metric)
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _otel_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otel_attributes(attrs: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otel_value(value)} for key, value in attrs.items()]
+
+
+def to_otel(trace: Dict[str, Any], service_name: str = "pirjo") -> Dict[str, Any]:
+    """Render a :meth:`Trace.to_dict` result as an OTLP/JSON trace export.
+
+    The payload can be posted to an OpenTelemetry collector's
+    ``/v1/traces`` endpoint. Counters become attributes of the root span.
+    """
+
+    def _nanos(offset: float) -> str:
+        return str(int((trace["started_at"] + offset) * 1e9))
+
+    root = {
+        "traceId": trace["trace_id"],
+        "spanId": trace["span_id"],
+        "name": trace["name"],
+        "kind": 1,
+        "startTimeUnixNano": _nanos(0.0),
+        "endTimeUnixNano": _nanos(trace["duration_s"]),
+        "attributes": _otel_attributes({**trace["attrs"], **trace["counters"]}),
+    }
+    spans = [root]
+    for record in trace["spans"]:
+        spans.append(
+            {
+                "traceId": trace["trace_id"],
+                "spanId": record["span_id"],
+                "parentSpanId": record["parent_id"],
+                "name": record["name"],
+                "kind": 1,
+                "startTimeUnixNano": _nanos(record["start_s"]),
+                "endTimeUnixNano": _nanos(record["start_s"] + record["duration_s"]),
+                "attributes": _otel_attributes({**record["attrs"], "thread": record["thread"]}),
+            }
+        )
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": _otel_attributes({"service.name": service_name})},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }
+        ]
+    }
+
+
+def write_trace(
+    trace: Dict[str, Any], directory: str, formats: Iterable[str] = ("json",)
+) -> List[str]:
+    """Write ``trace`` to ``directory`` in each of ``formats``; return the paths.
+
+    Files are named after the trace id: ``<id>.json``, ``<id>.prom`` and
+    ``<id>.otel.json``.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for fmt in formats:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown trace format {fmt!r}; expected one of {FORMATS}")
+        if fmt == "json":
+            path, payload = f"{trace['trace_id']}.json", json.dumps(trace, ensure_ascii=False)
+        elif fmt == "prometheus":
+            path, payload = f"{trace['trace_id']}.prom", to_prometheus(trace)
+        else:
+            path, payload = f"{trace['trace_id']}.otel.json", json.dumps(to_otel(trace))
+        path = os.path.join(directory, path)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(path + ".tmp", path)
+        paths.append(path)
+    return paths
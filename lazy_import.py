@@ -0,0 +1,42 @@
+"""Deferred imports of heavy optional modules.
+
+``faiss``, ``tiktoken`` and friends are only needed once a document is
+indexed or tokenised; importing them at start-up slows down the application
+and the test suite for nothing. :class:`LazyModule` stands in for such a
+module and imports it on first attribute access.
+"""
+
+import importlib
+import sys
+import threading
+from types import ModuleType
+from typing import Any, Optional
+
+
+class LazyModule:
+    """Proxy that imports module ``name`` the first time it is used."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> ModuleType:
+        """Import (once) and return the real module."""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the module has already been imported by anyone."""
+        return self._module is not None or self._name in sys.modules
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.load(), attr)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
@@ -0,0 +1,328 @@
+"""Shared chat-completion client with retries and rate limiting.
+
+:func:`get_shared_client` returns one client per endpoint (``"openai"`` or
+``"deepseek"``) for the whole process. Its HTTP connection pool is sized for
+the concurrent workers of the pipeline, and every call goes through a
+:class:`ResilientClient`, which:
+
+* waits on a process-wide :class:`RateLimiter` before sending the request.
+  The limiter holds one :class:`TokenBucket` for requests per minute and one
+  for tokens per minute, charged with :func:`estimate_tokens` before the call
+  and corrected with the usage reported by the API afterwards;
+* retries 429s, 5xx errors, timeouts and connection errors with exponential
+  backoff and full jitter, honouring ``Retry-After`` when the server sends it.
+  A stream is only retried while it is being opened, never half way through.
+
+Each endpoint is configured separately from environment variables prefixed
+with ``OPENAI_`` or ``DEEPSEEK_``: ``*_RPM``, ``*_TPM``, ``*_MAX_RETRIES``,
+``*_TIMEOUT``, ``*_POOL_SIZE`` and ``*_BASE_URL``. All but the base URL fall
+back to ``LLM_*`` (e.g. ``LLM_MAX_RETRIES``) when unset, and a rate of ``0``
+disables that bucket.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from instrumentation import count
+
+logger = logging.getLogger(__name__)
+
+ENDPOINTS: Dict[str, Dict[str, Any]] = {
+    "openai": {"env": "OPENAI", "base_url": None},
+    "deepseek": {"env": "DEEPSEEK", "base_url": "https://api.deepseek.com/v1"},
+}
+
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_POOL_SIZE = 20
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 30.0
+# Completion budget charged when a request does not set ``max_tokens``.
+DEFAULT_COMPLETION_TOKENS = 512
+RETRY_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+class TokenBucket:
+    """Refill ``rate_per_minute`` units per minute up to ``capacity``.
+
+    :meth:`acquire` blocks until the requested amount is available. The level
+    may go negative after :meth:`adjust` charges more than was acquired, in
+    which case later callers wait for the debt to be refilled.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+        self._level = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1) -> float:
+        """Take ``amount`` units, waiting for them; return the seconds waited.
+
+        Amounts above the capacity are clamped to it so that they cannot
+        block forever.
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._level >= amount:
+                    self._level -= amount
+                    return waited
+                delay = (amount - self._level) / self.rate
+            self._sleep(delay)
+            waited += delay
+
+    def adjust(self, amount: float) -> None:
+        """Charge ``amount`` more units (or give them back when negative)."""
+        with self._lock:
+            self._refill()
+            self._level = min(self.capacity, self._level - amount)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets of one endpoint."""
+
+    def __init__(
+        self,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.requests = TokenBucket(rpm, clock=clock, sleep=sleep) if rpm else None
+        self.tokens = TokenBucket(tpm, clock=clock, sleep=sleep) if tpm else None
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Wait for one request and ``tokens`` tokens; return the seconds waited."""
+        waited = 0.0
+        if self.requests is not None:
+            waited += self.requests.acquire(1)
+        if self.tokens is not None and tokens:
+            waited += self.tokens.acquire(tokens)
+        return waited
+
+    def settle(self, estimated: int, actual: Optional[int]) -> None:
+        """Correct the token bucket once the API reports the ``actual`` usage."""
+        if self.tokens is not None and actual is not None:
+            self.tokens.adjust(actual - estimated)
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: Optional[int] = None) -> int:
+    """Return a pre-call estimate of the tokens a chat completion will use.
+
+    The prompt is counted at four characters per token plus a small overhead
+    per message, which does not need the tokenizer files, and the completion
+    at ``max_tokens`` or :data:`DEFAULT_COMPLETION_TOKENS`.
+    """
+    prompt = sum(len(str(m.get("content") or "")) // 4 + 4 for m in messages)
+    return prompt + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    from openai import APIConnectionError  # also covers APITimeoutError
+
+    if isinstance(exc, APIConnectionError):
+        return True
+    return getattr(exc, "status_code", None) in RETRY_STATUSES
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """Return the delay requested by the server in ``exc``, if any."""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def backoff_delay(
+    attempt: int, base: float = DEFAULT_BACKOFF_BASE, cap: float = DEFAULT_BACKOFF_MAX
+) -> float:
+    """Return a full-jitter delay for the retry number ``attempt`` (from 0)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class _Completions:
+    def __init__(self, owner: "ResilientClient"):
+        self._owner = owner
+
+    def create(self, **kwargs: Any) -> Any:
+        return self._owner._create(**kwargs)
+
+
+class _Chat:
+    def __init__(self, owner: "ResilientClient"):
+        self.completions = _Completions(owner)
+
+
+class ResilientClient:
+    """Wrap an OpenAI-compatible client with rate limiting and retries.
+
+    Only ``client.chat.completions.create`` is wrapped, which is the only
+    call the pipeline makes; ``client.raw`` is the underlying client.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        limiter: Optional[RateLimiter] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = DEFAULT_BACKOFF_BASE,
+        backoff_max: float = DEFAULT_BACKOFF_MAX,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.raw = client
+        self.limiter = limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._sleep = sleep
+        self.chat = _Chat(self)
+
+    def _create(self, **kwargs: Any) -> Any:
+        estimate = estimate_tokens(kwargs.get("messages") or [], kwargs.get("max_tokens"))
+        tokens = estimate
+        attempt = 0
+        while True:
+            waited = self.limiter.acquire(tokens)
+            if waited:
+                count("llm.rate_limit_wait_s", waited)
+            # Tokens are charged once; retries only take another request.
+            tokens = 0
+            try:
+                response = self.raw.chat.completions.create(**kwargs)
+            except Exception as exc:
+                if attempt >= self.max_retries or not _is_retryable(exc):
+                    raise
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                requested = _retry_after(exc)
+                if requested is not None:
+                    delay = max(delay, min(requested, self.backoff_max))
+                attempt += 1
+                count("llm.retries")
+                logger.warning(
+                    "Chat completion failed (%s); retry %d/%d in %.1fs",
+                    exc,
+                    attempt,
+                    self.max_retries,
+                    delay,
+                )
+                self._sleep(delay)
+                continue
+            usage = getattr(response, "usage", None)
+            self.limiter.settle(estimate, getattr(usage, "total_tokens", None))
+            return response
+
+
+def _setting(endpoint: str, name: str, default: Any, cast: Callable[[str], Any]) -> Any:
+    """Read ``<ENDPOINT>_<name>``, falling back to ``LLM_<name>`` and ``default``."""
+    prefix = ENDPOINTS[endpoint]["env"]
+    value = os.getenv(f"{prefix}_{name}") or os.getenv(f"LLM_{name}")
+    return cast(value) if value not in (None, "") else default
+
+
+_LIMITERS: Dict[str, RateLimiter] = {}
+_CLIENTS: Dict[str, ResilientClient] = {}
+_LOCK = threading.Lock()
+
+
+def configure_rate_limits(endpoint: str, rpm: Optional[float], tpm: Optional[float]) -> RateLimiter:
+    """Set the requests and tokens per minute allowed on ``endpoint``.
+
+    The limiter is shared by every client of the endpoint in this process;
+    ``None`` or ``0`` leaves that dimension unlimited. When this function is
+    never called, the limits are read from ``<ENDPOINT>_RPM`` and
+    ``<ENDPOINT>_TPM`` on first use.
+    """
+    limiter = RateLimiter(rpm, tpm)
+    with _LOCK:
+        _LIMITERS[endpoint] = limiter
+        client = _CLIENTS.get(endpoint)
+        if client is not None:
+            client.limiter = limiter
+    return limiter
+
+
+def _get_limiter(endpoint: str) -> RateLimiter:
+    """Return the process-wide limiter of ``endpoint`` (lock held)."""
+    limiter = _LIMITERS.get(endpoint)
+    if limiter is None:
+        limiter = RateLimiter(
+            _setting(endpoint, "RPM", None, float), _setting(endpoint, "TPM", None, float)
+        )
+        _LIMITERS[endpoint] = limiter
+    return limiter
+
+
+def make_client(
+    api_key: str,
+    base_url: Optional[str] = None,
+    limiter: Optional[RateLimiter] = None,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    timeout: float = DEFAULT_TIMEOUT,
+    pool_size: int = DEFAULT_POOL_SIZE,
+    **options: Any,
+) -> ResilientClient:
+    """Build a :class:`ResilientClient` over a pooled ``openai.OpenAI`` client.
+
+    ``options`` (e.g. ``backoff_base``) are passed to :class:`ResilientClient`.
+    """
+    import httpx
+    from openai import DefaultHttpxClient, OpenAI
+
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)),
+    )
+    # Retries are handled by the wrapper so that each one goes through the limiter.
+    client = OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=timeout,
+        max_retries=0,
+        http_client=http_client,
+    )
+    return ResilientClient(client, limiter, max_retries, **options)
+
+
+def get_shared_client(endpoint: str, api_key: str) -> ResilientClient:
+    """Return the client of ``endpoint`` shared by the whole process."""
+    with _LOCK:
+        client = _CLIENTS.get(endpoint)
+        if client is None:
+            config = ENDPOINTS[endpoint]
+            client = make_client(
+                api_key,
+                base_url=os.getenv(f"{config['env']}_BASE_URL") or config["base_url"],
+                limiter=_get_limiter(endpoint),
+                max_retries=_setting(endpoint, "MAX_RETRIES", DEFAULT_MAX_RETRIES, int),
+                timeout=_setting(endpoint, "TIMEOUT", DEFAULT_TIMEOUT, float),
+                pool_size=_setting(endpoint, "POOL_SIZE", DEFAULT_POOL_SIZE, int),
+            )
+            _CLIENTS[endpoint] = client
+        return client
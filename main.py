@@ -2,11 +2,14 @@
 
 from openai_utils import ensure_openai_api_key
 from app import build_demo
+from pirjo_pipeline import warm_up_in_background
 
 
 def main() -> None:
     """Launch the Gradio PIRJO assistant."""
     ensure_openai_api_key()
+    # Load the model and the last index while gradio builds the interface.
+    warm_up_in_background()
     demo = build_demo()
     demo.launch()
 
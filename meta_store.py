@@ -0,0 +1,290 @@
+"""Columnar storage for the chunk metadata of a FAISS index.
+
+Instead of one JSON document holding every chunk, metadata is split into:
+
+* ``<meta>.json`` – a small header (files table, hashes, index settings);
+* ``<meta>.rows.npy`` – a structured array with integer-coded id, file,
+  page, chunk, text offset, text length, token count (``-1`` when
+  unknown) and the id of the chunk it duplicates (``-1`` for none);
+* ``<meta>.text.bin`` – all chunk texts concatenated as UTF-8, opened with
+  a memory map so that only the texts of the requested rows are decoded.
+"""
+
+import json
+import os
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+FORMAT_VERSION = 4
+
+ROW_DTYPE = np.dtype(
+    [
+        ("id", "<i8"),
+        ("file", "<i4"),
+        ("page", "<i4"),
+        ("chunk", "<i4"),
+        ("offset", "<i8"),
+        ("length", "<i4"),
+        ("tokens", "<i4"),
+        ("dup_of", "<i8"),
+    ]
+)
+
+
+def _upgrade_rows(rows: np.ndarray) -> np.ndarray:
+    """Return ``rows`` with the current dtype, filling new columns as unknown."""
+    if rows.dtype == ROW_DTYPE:
+        return rows
+    upgraded = np.zeros(len(rows), dtype=ROW_DTYPE)
+    upgraded["tokens"] = -1
+    upgraded["dup_of"] = -1
+    for name in rows.dtype.names:
+        upgraded[name] = rows[name]
+    return upgraded
+
+
+def _sidecar_paths(meta_file: str) -> Tuple[str, str]:
+    """Return the paths of the row table and text blob for ``meta_file``."""
+    base = os.path.splitext(meta_file)[0]
+    return base + ".rows.npy", base + ".text.bin"
+
+
+def _commit(meta_file: str, rows: np.ndarray, files: List[str], header: Dict[str, Any]) -> None:
+    """Write rows and header, then move them and the staged text blob into place."""
+    rows_path, text_path = _sidecar_paths(meta_file)
+    with open(rows_path + ".tmp", "wb") as f:
+        np.save(f, rows)
+    payload = dict(header)
+    payload.update({"format": FORMAT_VERSION, "count": len(rows), "files": files})
+    with open(meta_file + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+    for path in (rows_path, text_path, meta_file):
+        os.replace(path + ".tmp", path)
+
+
+class ChunkStore(Sequence):
+    """Read-only sequence of chunk metadata backed by columnar arrays.
+
+    Items are materialised as ``{"id", "file", "page", "chunk", "text"}``
+    dictionaries on access (plus ``"tokens"`` when the count is known and
+    ``"dup_of"`` for duplicates that have no vector of their own), so iterating the whole store is as expensive as
+    the old list of dicts while looking up a few hits is cheap. Rows are
+    kept sorted by ``id``.
+    """
+
+    def __init__(self, rows: np.ndarray, text: np.ndarray, files: List[str]):
+        self.rows = rows
+        self.text = text
+        self.files = files
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "ChunkStore":
+        """Build a store from metadata dicts; missing ids become positions."""
+        records = list(records)
+        files: List[str] = []
+        codes: Dict[str, int] = {}
+        rows = np.zeros(len(records), dtype=ROW_DTYPE)
+        encoded: List[bytes] = []
+        offset = 0
+        for pos, rec in enumerate(records):
+            fname = rec["file"]
+            if fname not in codes:
+                codes[fname] = len(files)
+                files.append(fname)
+            data = rec.get("text", "").encode("utf-8")
+            rows[pos] = (
+                rec.get("id", pos),
+                codes[fname],
+                rec.get("page", 0),
+                rec.get("chunk", rec.get("chunk_id", 0)),
+                offset,
+                len(data),
+                rec.get("tokens", -1),
+                rec.get("dup_of", -1),
+            )
+            encoded.append(data)
+            offset += len(data)
+        text = np.frombuffer(b"".join(encoded), dtype="uint8")
+        return cls(rows, text, files)
+
+    @classmethod
+    def load(cls, meta_file: str, header: Dict[str, Any]) -> "ChunkStore":
+        """Open the sidecar files of ``meta_file`` described by ``header``."""
+        rows_path, text_path = _sidecar_paths(meta_file)
+        rows = _upgrade_rows(np.load(rows_path))
+        if os.path.getsize(text_path):
+            text = np.memmap(text_path, dtype="uint8", mode="r")
+        else:
+            text = np.zeros(0, dtype="uint8")
+        return cls(rows, text, list(header.get("files", [])))
+
+    def save(self, meta_file: str, header: Dict[str, Any]) -> None:
+        """Write the row table, text blob and JSON ``header`` to disk.
+
+        Every file is written next to its destination and renamed into place,
+        so a text blob that is still memory-mapped is never truncated.
+        """
+        _, text_path = _sidecar_paths(meta_file)
+        with open(text_path + ".tmp", "wb") as f:
+            f.write(memoryview(np.ascontiguousarray(self.text)))
+        _commit(meta_file, self.rows, self.files, header)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self.rows["id"]
+
+    @property
+    def next_id(self) -> int:
+        """Smallest id larger than every stored id."""
+        return int(self.ids[-1]) + 1 if len(self) else 0
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, pos: int) -> Dict[str, Any]:
+        row = self.rows[pos]
+        start = int(row["offset"])
+        data = self.text[start : start + int(row["length"])]
+        item = {
+            "id": int(row["id"]),
+            "file": self.files[int(row["file"])],
+            "page": int(row["page"]),
+            "chunk": int(row["chunk"]),
+            "text": bytes(data).decode("utf-8"),
+        }
+        if row["tokens"] >= 0:
+            item["tokens"] = int(row["tokens"])
+        if row["dup_of"] >= 0:
+            item["dup_of"] = int(row["dup_of"])
+        return item
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def find(self, chunk_id: int) -> Optional[Dict[str, Any]]:
+        """Return the chunk stored under ``chunk_id`` or ``None``."""
+        pos = int(np.searchsorted(self.ids, chunk_id))
+        if pos < len(self) and self.ids[pos] == chunk_id:
+            return self[pos]
+        return None
+
+    def citations(self, chunk_id: int) -> List[Dict[str, Any]]:
+        """Return ``{"file", "page", "chunk"}`` of ``chunk_id`` and of its duplicates."""
+        positions = np.flatnonzero((self.ids == chunk_id) | (self.rows["dup_of"] == chunk_id))
+        return [
+            {
+                "file": self.files[int(self.rows["file"][pos])],
+                "page": int(self.rows["page"][pos]),
+                "chunk": int(self.rows["chunk"][pos]),
+            }
+            for pos in positions
+        ]
+
+    def orphan_mask(self, removed: np.ndarray) -> np.ndarray:
+        """Return the rows outside ``removed`` that duplicate a removed row."""
+        dup_of = self.rows["dup_of"]
+        return ~removed & (dup_of >= 0) & np.isin(dup_of, self.ids[removed])
+
+    def file_mask(self, files: Iterable[str]) -> np.ndarray:
+        """Return a boolean mask of the rows that belong to ``files``."""
+        files = set(files)
+        codes = [i for i, fname in enumerate(self.files) if fname in files]
+        return np.isin(self.rows["file"], codes)
+
+    def drop(self, mask: np.ndarray) -> "ChunkStore":
+        """Return a copy without the rows selected by ``mask``."""
+        keep = ~mask
+        rows = self.rows[keep].copy()
+        # Bytes are gathered by each row's own offset: the blob of a store
+        # written by ChunkStoreWriter is in write order, not in id order.
+        lengths = rows["length"].astype("int64")
+        offsets = np.cumsum(lengths) - lengths
+        positions = np.arange(int(lengths.sum()), dtype="int64")
+        positions += np.repeat(rows["offset"] - offsets, lengths)
+        text = self.text[positions]
+        rows["offset"] = offsets
+        return ChunkStore(rows, np.asarray(text), list(self.files))
+
+    def extend(self, records: Iterable[Dict[str, Any]]) -> "ChunkStore":
+        """Return a copy with ``records`` (with larger ids) appended."""
+        added = ChunkStore.from_records(records)
+        if not len(added):
+            return self
+        files = list(self.files)
+        codes = {fname: i for i, fname in enumerate(files)}
+        remap = []
+        for fname in added.files:
+            if fname not in codes:
+                codes[fname] = len(files)
+                files.append(fname)
+            remap.append(codes[fname])
+        added_rows = added.rows.copy()
+        added_rows["file"] = np.asarray(remap, dtype="int32")[added_rows["file"]]
+        added_rows["offset"] += len(self.text)
+        rows = np.concatenate([self.rows, added_rows])
+        text = np.concatenate([np.asarray(self.text), added.text])
+        return ChunkStore(rows, text, files)
+
+
+class ChunkStoreWriter:
+    """Build a :class:`ChunkStore` on disk without holding its texts in memory.
+
+    Records passed to :meth:`append` have their texts written straight to a
+    staged text blob; only the fixed-size rows are kept until :meth:`finish`
+    sorts them by id and moves every file into place.
+    """
+
+    def __init__(self, meta_file: str):
+        self.meta_file = meta_file
+        _, text_path = _sidecar_paths(meta_file)
+        self._text = open(text_path + ".tmp", "wb")
+        self._offset = 0
+        self._rows: List[np.ndarray] = []
+        self._files: List[str] = []
+        self._codes: Dict[str, int] = {}
+        self.count = 0
+
+    def _code(self, fname: str) -> int:
+        if fname not in self._codes:
+            self._codes[fname] = len(self._files)
+            self._files.append(fname)
+        return self._codes[fname]
+
+    def _write(self, store: ChunkStore, rows: np.ndarray, data: bytes) -> None:
+        rows = rows.copy()
+        remap = np.asarray([self._code(f) for f in store.files], dtype="int32")
+        if len(rows):
+            rows["file"] = remap[rows["file"]]
+        rows["offset"] = self._offset + np.cumsum(rows["length"], dtype="int64") - rows["length"]
+        self._text.write(data)
+        self._offset += len(data)
+        self._rows.append(rows)
+        self.count += len(rows)
+
+    def append(self, records: Iterable[Dict[str, Any]]) -> None:
+        """Append metadata ``records`` (with ids) to the store being written."""
+        store = ChunkStore.from_records(records)
+        self._write(store, store.rows, store.text.tobytes())
+
+    def append_store(self, store: ChunkStore, mask: np.ndarray) -> None:
+        """Copy the rows of ``store`` selected by ``mask``."""
+        selected = store.drop(~mask)
+        self._write(selected, selected.rows, np.ascontiguousarray(selected.text).tobytes())
+
+    def abort(self) -> None:
+        """Discard everything written so far."""
+        self._text.close()
+        os.remove(self._text.name)
+
+    def finish(self, header: Dict[str, Any]) -> ChunkStore:
+        """Commit the store with ``header`` and return it memory-mapped."""
+        self._text.close()
+        rows = np.concatenate(self._rows) if self._rows else np.zeros(0, dtype=ROW_DTYPE)
+        rows = rows[np.argsort(rows["id"], kind="stable")]
+        _commit(self.meta_file, rows, self._files, header)
+        with open(self.meta_file, "r", encoding="utf-8") as f:
+            return ChunkStore.load(self.meta_file, json.load(f))
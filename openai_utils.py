@@ -24,12 +24,12 @@ def get_client():
     """Return an OpenAI-compatible client for OpenAI or DeepSeek.
 
     Prefers OpenAI when ``OPENAI_API_KEY`` is present; otherwise attempts to use
-    DeepSeek via its OpenAI-compatible endpoint.
+    DeepSeek via its OpenAI-compatible endpoint. The client is shared by the
+    whole process and retries and rate-limits its calls (see :mod:`llm_client`).
     """
     ensure_openai_api_key()
-    api_key = os.getenv("OPENAI_API_KEY") or os.getenv("DEEPSEEK_API_KEY")
-    from openai import OpenAI  # Imported here to avoid dependency during tests
+    from llm_client import get_shared_client  # Imported here to avoid dependency during tests
     if os.getenv("OPENAI_API_KEY"):
-        return OpenAI(api_key=api_key)
+        return get_shared_client("openai", os.environ["OPENAI_API_KEY"])
     # DeepSeek uses an OpenAI-compatible API
-    return OpenAI(api_key=api_key, base_url="https://api.deepseek.com/v1")
+    return get_shared_client("deepseek", os.environ["DEEPSEEK_API_KEY"])
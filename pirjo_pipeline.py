@@ -1,13 +1,56 @@
+import importlib
 import json
+import logging
+import multiprocessing
 import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from functools import lru_cache
-from typing import Any, Dict, List, Tuple
-
-from PyPDF2 import PdfReader
-import tiktoken
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
+from context_packer import pack_context, render_context
+from extraction_cache import DEFAULT_MAX_BYTES as EXTRACTION_CACHE_MAX_BYTES
+from extraction_cache import ExtractionCache, Page, file_digest
+from index_store import DEFAULT_MAX_CORPORA as INDEX_STORE_MAX_CORPORA
+from index_store import DEFAULT_MAX_LOADED as INDEX_STORE_MAX_LOADED
+from index_store import IndexStore, corpus_key, corpus_members, seed_members
+from instrumentation import FORMATS as TRACE_FORMATS
+from instrumentation import Trace, bind, count, span, timed_iter, traced, write_trace
+from instrumentation import current as current_trace
+from lazy_import import LazyModule
+from llm_cache import DEFAULT_MAX_BYTES as RESPONSE_CACHE_MAX_BYTES
+from llm_cache import DEFAULT_MAX_ENTRIES as RESPONSE_CACHE_MAX_ENTRIES
+from llm_cache import DEFAULT_TTL as RESPONSE_CACHE_TTL
+from llm_cache import MemoryResponseCache, ResponseCache, SQLiteResponseCache, make_key
 from openai_utils import ensure_openai_api_key, get_client
-from rag_faiss import ensure_index, search_index
+from bm25 import BM25Index
+from rag_faiss import (
+    INDEX_FILE,
+    META_FILE,
+    MODEL_NAME as EMBEDDING_MODEL,
+    embedding_backend_id,
+    ensure_index,
+    ensure_index_streaming,
+    load_index,
+    load_lexical_index,
+    merge_search_results,
+    search_index_batch,
+    warm_up as rag_warm_up,
+)
+
+logger = logging.getLogger(__name__)
+
+# Imported on first use to keep start-up fast (see :func:`warm_up`).
+tiktoken = LazyModule("tiktoken")
+PdfReader: Optional[type] = None
+
+PAGES_PER_TASK = 8
+CHUNK_MODEL = "gpt-3.5-turbo"
+CHUNK_SIZE = 700
 
 
 @lru_cache(maxsize=1)
@@ -16,25 +59,215 @@ def _get_client():
     return get_client()
 
 
-def _call_openai(prompt: str, system: str = "", client=None) -> str:
+# Sampling parameters sent with every chat completion; part of the cache key.
+SAMPLING_PARAMS: Dict[str, Any] = {}
+
+_RESPONSE_CACHE: Optional[ResponseCache] = None
+_RESPONSE_CACHE_CONFIGURED = False
+
+
+def configure_response_cache(
+    enabled: bool = True,
+    path: Optional[str] = None,
+    ttl: float = RESPONSE_CACHE_TTL,
+    max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+    max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+) -> Optional[ResponseCache]:
+    """Configure the cache of chat-completion responses.
+
+    Responses are kept in an in-memory LRU and, when ``path`` is given, also
+    in a SQLite database so they survive restarts. When this function is
+    never called, the cache is configured from ``LLM_CACHE`` (``0`` disables
+    it), ``LLM_CACHE_PATH``, ``LLM_CACHE_TTL``, ``LLM_CACHE_MAX_ENTRIES`` and
+    ``LLM_CACHE_MAX_BYTES`` on first use.
+    """
+    global _RESPONSE_CACHE, _RESPONSE_CACHE_CONFIGURED
+    _RESPONSE_CACHE = None
+    if enabled:
+        memory = MemoryResponseCache(max_entries, max_bytes, ttl)
+        disk = SQLiteResponseCache(path, max_entries, max_bytes, ttl) if path else None
+        _RESPONSE_CACHE = ResponseCache(memory, disk)
+    _RESPONSE_CACHE_CONFIGURED = True
+    return _RESPONSE_CACHE
+
+
+def _get_response_cache() -> Optional[ResponseCache]:
+    """Return the configured response cache, if any."""
+    if not _RESPONSE_CACHE_CONFIGURED:
+        configure_response_cache(
+            os.getenv("LLM_CACHE", "1") != "0",
+            os.getenv("LLM_CACHE_PATH") or None,
+            float(os.getenv("LLM_CACHE_TTL", RESPONSE_CACHE_TTL)),
+            int(os.getenv("LLM_CACHE_MAX_ENTRIES", RESPONSE_CACHE_MAX_ENTRIES)),
+            int(os.getenv("LLM_CACHE_MAX_BYTES", RESPONSE_CACHE_MAX_BYTES)),
+        )
+    return _RESPONSE_CACHE
+
+
+def response_cache_stats() -> Dict[str, int]:
+    """Return hit/miss counters of the response cache (empty when disabled)."""
+    cache = _get_response_cache()
+    return cache.stats() if cache is not None else {}
+
+
+# Bounds the chat completions in flight across all threads.
+_LLM_SLOTS: Optional[threading.BoundedSemaphore] = None
+_LLM_SLOTS_CONFIGURED = False
+
+
+def configure_llm_concurrency(limit: Optional[int]) -> None:
+    """Allow at most ``limit`` chat completions in flight at once.
+
+    The limit is shared by every thread of the process, e.g. the PIRJO block
+    pool of concurrent jobs (see ``batch.py``); ``None`` or ``0`` removes it.
+    When this function is never called, the limit is read from
+    ``LLM_MAX_CONCURRENCY`` on first use.
+    """
+    global _LLM_SLOTS, _LLM_SLOTS_CONFIGURED
+    _LLM_SLOTS = threading.BoundedSemaphore(limit) if limit else None
+    _LLM_SLOTS_CONFIGURED = True
+
+
+def _llm_slot():
+    """Return a context manager that holds one slot of the concurrency limit."""
+    if not _LLM_SLOTS_CONFIGURED:
+        configure_llm_concurrency(int(os.getenv("LLM_MAX_CONCURRENCY", "0")))
+    return _LLM_SLOTS if _LLM_SLOTS is not None else nullcontext()
+
+
+def _chat_model() -> str:
+    """Return the chat model of the configured provider."""
+    if os.getenv("DEEPSEEK_API_KEY") and not os.getenv("OPENAI_API_KEY"):
+        return "deepseek-chat"
+    return "gpt-3.5-turbo"
+
+
+def _record_cache_hit(call: Any) -> None:
+    """Mark ``call`` (an ``"llm"`` span) as answered from the response cache."""
+    call.set("cached", True)
+    count("llm.cache_hits")
+
+
+def _record_usage(call: Any, usage: Any) -> None:
+    """Add the token ``usage`` reported by the API to ``call`` and the trace."""
+    if usage is None:
+        return
+    for field in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, field, None) or 0
+        call.set(field, tokens)
+        count(f"llm.{field}", tokens)
+
+
+def _call_openai(prompt: str, system: str = "", client=None, use_cache: bool = True) -> str:
     """Helper to call OpenAI chat completion and return content.
 
     A client is created lazily on first use to avoid side effects at import time.
+    Identical requests (same model, messages and sampling parameters) are
+    answered from the response cache unless ``use_cache`` is false.
     """
     messages = []
     if system:
         messages.append({"role": "system", "content": system})
     messages.append({"role": "user", "content": prompt})
-    model = "gpt-3.5-turbo"
-    if os.getenv("DEEPSEEK_API_KEY") and not os.getenv("OPENAI_API_KEY"):
-        model = "deepseek-chat"
-    if client is None:
-        client = _get_client()
-    response = client.chat.completions.create(model=model, messages=messages)
-    return response.choices[0].message.content.strip()
+    model = _chat_model()
+    cache = _get_response_cache() if use_cache else None
+    key = make_key(model, messages, SAMPLING_PARAMS)
+    with span("llm", model=model) as call:
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                _record_cache_hit(call)
+                return cached
+        if client is None:
+            client = _get_client()
+        with _llm_slot():
+            response = client.chat.completions.create(
+                model=model, messages=messages, **SAMPLING_PARAMS
+            )
+        _record_usage(call, getattr(response, "usage", None))
+        content = response.choices[0].message.content.strip()
+    if cache is not None and content:
+        cache.put(key, content)
+    return content
+
+
+def _stream_openai(
+    prompt: str, system: str = "", client=None, use_cache: bool = True
+) -> Iterator[str]:
+    """Like :func:`_call_openai` but yield the answer as it is generated.
+
+    Text deltas of a streamed chat completion are yielded as they arrive; the
+    complete answer is stored in the response cache, and a cached answer is
+    yielded in one piece.
+    """
+    messages = []
+    if system:
+        messages.append({"role": "system", "content": system})
+    messages.append({"role": "user", "content": prompt})
+    model = _chat_model()
+    cache = _get_response_cache() if use_cache else None
+    key = make_key(model, messages, SAMPLING_PARAMS)
+    with span("llm", model=model, stream=True) as call:
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                _record_cache_hit(call)
+                yield cached
+                return
+        if client is None:
+            client = _get_client()
+        extra: Dict[str, Any] = {}
+        if current_trace() is not None:
+            # Streamed responses only report token usage when asked to.
+            extra["stream_options"] = {"include_usage": True}
+        parts: List[str] = []
+        with _llm_slot():
+            stream = client.chat.completions.create(
+                model=model, messages=messages, stream=True, **extra, **SAMPLING_PARAMS
+            )
+            for chunk in stream:
+                _record_usage(call, getattr(chunk, "usage", None))
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+    content = "".join(parts).strip()
+    if cache is not None and content:
+        cache.put(key, content)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = CHUNK_MODEL) -> "tiktoken.Encoding":
+    """Return the shared ``tiktoken`` encoding for ``model``."""
+    return tiktoken.encoding_for_model(model)
+
+
+def count_tokens(texts: List[str]) -> List[int]:
+    """Return the token count of every text, encoded in one batch."""
+    if not texts:
+        return []
+    return [len(tokens) for tokens in get_encoding().encode_batch(texts)]
+
 
+def chunk_pages(
+    texts: List[str], chunk_size: int = CHUNK_SIZE
+) -> List[Tuple[List[str], List[int]]]:
+    """Split every text into ``chunk_size``-token fragments in one batch.
 
-def chunk_text(text: str, chunk_size: int = 700) -> List[str]:
+    Returns one ``(chunks, token_counts)`` pair per text so that callers can
+    keep the counts next to the chunks instead of encoding them again.
+    """
+    encoding = get_encoding()
+    result: List[Tuple[List[str], List[int]]] = []
+    for tokens in encoding.encode_batch(texts) if texts else []:
+        pieces = [tokens[i : i + chunk_size] for i in range(0, len(tokens), chunk_size)]
+        result.append((encoding.decode_batch(pieces), [len(p) for p in pieces]))
+    return result
+
+
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE) -> List[str]:
     """Split text into roughly ``chunk_size``-token fragments.
 
     The function uses ``tiktoken`` to count tokens with the same encoding
@@ -42,16 +275,7 @@ def chunk_text(text: str, chunk_size: int = 700) -> List[str]:
     decoded back into strings.
     """
 
-    encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
-    tokens = encoding.encode(text)
-    if not tokens:
-        return []
-
-    chunks: List[str] = []
-    for i in range(0, len(tokens), chunk_size):
-        chunk_tokens = tokens[i : i + chunk_size]
-        chunks.append(encoding.decode(chunk_tokens))
-    return chunks
+    return chunk_pages([text], chunk_size)[0][0]
 
 
 def _parse_year(date_str: str) -> str:
@@ -62,67 +286,299 @@ def _parse_year(date_str: str) -> str:
     return digits[:4]
 
 
-def extract_sources(files: List[str]) -> Tuple[List[Dict[str, str]], Dict[str, Dict[str, str]]]:
+_EXTRACTION_CACHE: Optional[ExtractionCache] = None
+_EXTRACTION_CACHE_CONFIGURED = False
+
+
+def configure_extraction_cache(
+    directory: Optional[str],
+    max_bytes: int = EXTRACTION_CACHE_MAX_BYTES,
+) -> Optional[ExtractionCache]:
+    """Enable the persistent PDF extraction cache in ``directory``.
+
+    Passing ``None`` disables the cache. When this function is never called,
+    the cache is configured from ``EXTRACTION_CACHE_DIR`` and
+    ``EXTRACTION_CACHE_MAX_BYTES`` on first use. Entries are tied to the
+    current chunking parameters and ignored once they change.
+    """
+    global _EXTRACTION_CACHE, _EXTRACTION_CACHE_CONFIGURED
+    fingerprint = {"model": CHUNK_MODEL, "chunk_size": CHUNK_SIZE, "token_counts": True}
+    _EXTRACTION_CACHE = ExtractionCache(directory, fingerprint, max_bytes) if directory else None
+    _EXTRACTION_CACHE_CONFIGURED = True
+    return _EXTRACTION_CACHE
+
+
+def _get_extraction_cache() -> Optional[ExtractionCache]:
+    """Return the configured extraction cache, if any."""
+    if not _EXTRACTION_CACHE_CONFIGURED:
+        configure_extraction_cache(
+            os.getenv("EXTRACTION_CACHE_DIR") or None,
+            int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", EXTRACTION_CACHE_MAX_BYTES)),
+        )
+    return _EXTRACTION_CACHE
+
+
+def _open_pdf(path: str) -> "PdfReader":
+    """Return a ``PdfReader`` for ``path``, importing PyPDF2 on first use."""
+    global PdfReader
+    if PdfReader is None:
+        from PyPDF2 import PdfReader
+    return PdfReader(path)
+
+
+def _read_pdf_info(reader: "PdfReader") -> Dict[str, Optional[str]]:
+    """Return author, title and year from the metadata of ``reader``.
+
+    ``title`` is ``None`` when the PDF does not define one so that the file
+    name fallback can be applied by :func:`_file_metadata`.
+    """
+    info = reader.metadata or {}
+    return {
+        "author": info.get("/Author", ""),
+        "title": info.get("/Title"),
+        "year": _parse_year(info.get("/CreationDate", "")),
+    }
+
+
+def _file_metadata(info: Dict[str, Optional[str]], fname: str) -> Dict[str, str]:
+    """Return the bibliographic fields of ``fname`` with the title fallback."""
+    title = info.get("title")
+    return {
+        "author": info.get("author", ""),
+        "title": title if title is not None else os.path.splitext(fname)[0],
+        "year": info.get("year", ""),
+    }
+
+
+def _extract_page_chunks(reader: "PdfReader", start: int, stop: int) -> List[Page]:
+    """Return ``(page_number, text, chunks, token_counts)`` for pages ``start``..``stop``.
+
+    Page indexes are 0-based; all pages of the range are tokenised in one batch.
+    """
+    numbers = range(start, min(stop, len(reader.pages)))
+    texts = [reader.pages[page_index].extract_text() or "" for page_index in numbers]
+    return [
+        (page_index + 1, text, chunks, counts)
+        for page_index, text, (chunks, counts) in zip(numbers, texts, chunk_pages(texts))
+    ]
+
+
+def _pdf_info_task(path: str) -> Tuple[Dict[str, Optional[str]], int]:
+    """Worker task: return the bibliographic metadata and page count of ``path``."""
+    reader = _open_pdf(path)
+    return _read_pdf_info(reader), len(reader.pages)
+
+
+def _pdf_pages_task(path: str, start: int, stop: int) -> List[Page]:
+    """Worker task: extract and chunk a page range of ``path``."""
+    return _extract_page_chunks(_open_pdf(path), start, stop)
+
+
+def _page_sources(fname: str, pages: List[Page]) -> Iterator[Dict[str, str]]:
+    """Yield one source entry per chunk of ``pages``."""
+    for page_number, _, chunks, counts in pages:
+        for c_id, (chunk, tokens) in enumerate(zip(chunks, counts), start=1):
+            yield {
+                "file": fname,
+                "page": page_number,
+                "chunk_id": c_id,
+                "text": chunk,
+                "tokens": tokens,
+            }
+
+
+def _resolve_workers(workers: Optional[int]) -> int:
+    """Return the number of extraction processes to use."""
+    if workers is None:
+        workers = int(os.getenv("PDF_EXTRACT_WORKERS", "1"))
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    """Return the seconds left until ``deadline`` (``None`` waits forever)."""
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def _iter_files_parallel(
+    files: List[str], workers: int, timeout: Optional[float]
+) -> Iterator[Tuple[int, Dict[str, Optional[str]], List[Page]]]:
+    """Extract ``files`` in a process pool, yielding ``(position, info, pages)``.
+
+    Every file is split into ranges of :data:`PAGES_PER_TASK` pages that are
+    extracted in parallel and reassembled in page order. Files are yielded
+    in input order and at most ``2 * workers`` files are in flight, so
+    finished results do not pile up. A file is skipped when waiting for it
+    takes longer than ``timeout`` seconds; the pool is terminated at the end
+    so that stuck workers do not outlive the call.
+
+    Workers are spawned rather than forked: this runs on the prefetch thread
+    of ``ensure_index_streaming`` while torch, FAISS and OpenMP threads are
+    alive, and a forked child can inherit their locks held and deadlock.
+    """
+    ahead = max(2, 2 * workers)
+    pool = multiprocessing.get_context("spawn").Pool(processes=workers)
+    try:
+        info_results = [pool.apply_async(_pdf_info_task, (path,)) for path in files]
+        in_flight: Deque[Tuple[int, Dict[str, Optional[str]], list]] = deque()
+        position = 0
+        while position < len(files) or in_flight:
+            while position < len(files) and len(in_flight) < ahead:
+                path = files[position]
+                deadline = None if timeout is None else time.monotonic() + timeout
+                try:
+                    info, num_pages = info_results[position].get(_remaining(deadline))
+                except multiprocessing.TimeoutError:
+                    logger.warning("Timed out reading %s; skipping it", path)
+                else:
+                    page_results = [
+                        pool.apply_async(_pdf_pages_task, (path, start, start + PAGES_PER_TASK))
+                        for start in range(0, num_pages, PAGES_PER_TASK)
+                    ]
+                    in_flight.append((position, info, page_results))
+                position += 1
+            if not in_flight:
+                continue
+            file_position, info, page_results = in_flight.popleft()
+            deadline = None if timeout is None else time.monotonic() + timeout
+            pages: List[Page] = []
+            try:
+                for result in page_results:
+                    pages.extend(result.get(_remaining(deadline)))
+            except multiprocessing.TimeoutError:
+                logger.warning("Timed out extracting %s; skipping it", files[file_position])
+                continue
+            yield file_position, info, pages
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _iter_extracted(
+    files: List[str], workers: int, timeout: Optional[float]
+) -> Iterator[Tuple[str, Dict[str, Optional[str]], List[Page]]]:
+    """Yield ``(path, info, pages)`` for ``files`` in input order.
+
+    Cached files are yielded whole. Otherwise pages are yielded one at a
+    time in sequential mode and file by file in the process-pool mode;
+    freshly extracted files are added to the cache once complete.
+    """
+    cache = _get_extraction_cache()
+    digests: List[Optional[str]] = []
+    hits: Dict[int, Tuple[Dict[str, Optional[str]], List[Page]]] = {}
+    for position, path in enumerate(files):
+        digest = file_digest(path) if cache is not None else None
+        digests.append(digest)
+        hit = cache.get(digest) if cache is not None else None
+        if hit is not None:
+            hits[position] = hit
+
+    count("extraction.cache_hits", len(hits))
+    pending = [position for position in range(len(files)) if position not in hits]
+    fresh: Optional[Iterator[Tuple[int, Dict[str, Optional[str]], List[Page]]]] = None
+    if workers > 1 and pending:
+        fresh = _iter_files_parallel([files[p] for p in pending], workers, timeout)
+    lookahead: Optional[Tuple[int, Dict[str, Optional[str]], List[Page]]] = None
+
+    for position, path in enumerate(files):
+        if position in hits:
+            yield (path,) + hits.pop(position)
+            continue
+        if fresh is None:
+            reader = _open_pdf(path)
+            info = _read_pdf_info(reader)
+            collected: List[Page] = []
+            if not len(reader.pages):
+                yield path, info, []
+            for page_index in range(len(reader.pages)):
+                pages = _extract_page_chunks(reader, page_index, page_index + 1)
+                if cache is not None:
+                    collected.extend(pages)
+                yield path, info, pages
+            if cache is not None:
+                cache.put(digests[position], info, collected)
+            continue
+        if lookahead is None:
+            lookahead = next(fresh, None)
+        if lookahead is None or pending[lookahead[0]] != position:
+            continue
+        _, info, pages = lookahead
+        lookahead = None
+        if cache is not None:
+            cache.put(digests[position], info, pages)
+        yield path, info, pages
+
+
+def iter_sources(
+    files: List[str],
+    metadata: Optional[Dict[str, Dict[str, str]]] = None,
+    workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Iterator[Dict[str, str]]:
+    """Lazily yield the source chunks of ``files`` in file and page order.
+
+    ``metadata`` is filled with the bibliographic fields of every file as
+    soon as it is opened. Only the page (or, in process-pool mode, the file)
+    being processed is held in memory, which lets
+    :func:`rag_faiss.ensure_index_streaming` embed chunks while later PDFs
+    are still being parsed. See :func:`extract_sources` for ``workers`` and
+    ``timeout``.
+    """
+    if metadata is None:
+        metadata = {}
+    extracted = _iter_extracted(files, _resolve_workers(workers), timeout)
+    for path, info, pages in timed_iter("extract_sources", extracted, files=len(files)):
+        fname = os.path.basename(path)
+        metadata[fname] = _file_metadata(info, fname)
+        count("extraction.pages", len(pages))
+        count("extraction.chunks", sum(len(page[2]) for page in pages))
+        yield from _page_sources(fname, pages)
+
+
+def extract_sources(
+    files: List[str],
+    workers: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Tuple[List[Dict[str, str]], Dict[str, Dict[str, str]]]:
     """Extract text and metadata from PDFs.
 
     Returns a tuple ``(sources, metadata)`` where ``sources`` contains token
     chunks with citation information and ``metadata`` maps file names to basic
     bibliographic fields (author, title, year).
+
+    Files already present in the extraction cache (see
+    :func:`configure_extraction_cache`) are not parsed again. With
+    ``workers`` greater than one (``0`` means one per CPU; the default is
+    read from ``PDF_EXTRACT_WORKERS``) the remaining files and their page
+    ranges are extracted in a process pool. The output is identical to the
+    sequential mode, except that files exceeding the per-file ``timeout``
+    are skipped.
     """
 
-    sources: List[Dict[str, str]] = []
     metadata: Dict[str, Dict[str, str]] = {}
-    for path in files:
-        reader = PdfReader(path)
-        info = reader.metadata or {}
-        fname = os.path.basename(path)
-        metadata[fname] = {
-            "author": info.get("/Author", ""),
-            "title": info.get("/Title", os.path.splitext(fname)[0]),
-            "year": _parse_year(info.get("/CreationDate", "")),
-        }
-        for page_number, page in enumerate(reader.pages, start=1):
-            text = page.extract_text() or ""
-            for c_id, chunk in enumerate(chunk_text(text), start=1):
-                sources.append(
-                    {
-                        "file": fname,
-                        "page": page_number,
-                        "chunk_id": c_id,
-                        "text": chunk,
-                    }
-                )
+    sources = list(iter_sources(files, metadata, workers, timeout))
     return sources, metadata
 
 
+@traced("analista_de_fuentes")
 def analista_de_fuentes(
     title: str, objective: str, summary: str, chunks: List[Dict[str, str]]
 ) -> str:
 
     """Run the analysis agent and return bullets with citations.
 
-    Only as many fragments as fit within ``max_tokens`` are included in the prompt
-    sent to the language model, ensuring the request stays within model limits.
+    The fragments included in the prompt are chosen by
+    :func:`context_packer.pack_context`: the most relevant evidence per token
+    that fits within ``max_tokens``, with adjacent chunks of a page sharing
+    one citation header, ensuring the request stays within model limits.
     """
 
-    encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
     max_tokens = 12_000
-    compiled_parts: List[str] = []
-    token_count = 0
-    for c in chunks:
-        if not c["text"].strip():
-            continue
-        # ``search_index`` may return metadata with either ``chunk_id`` or
-        # ``chunk`` as the identifier field. Support both to avoid ``KeyError``
-        # when the caller provides one or the other.
-        chunk_label = c.get("chunk_id", c.get("chunk", ""))
-        fragment = f"[{c['file']}:{c['page']}:{chunk_label}]\n{c['text']}\n\n"
-        frag_tokens = len(encoding.encode(fragment))
-        if token_count + frag_tokens > max_tokens:
-            break
-        compiled_parts.append(fragment)
-        token_count += frag_tokens
-    compiled = "".join(compiled_parts)
+    fragments, _ = pack_context(chunks, max_tokens, count_tokens)
+    compiled = render_context(fragments)
 
     prompt = (
         f"Título de investigación: {title}\n"
@@ -134,7 +590,50 @@ def analista_de_fuentes(
     return _call_openai(prompt, system="Agente Analista de Fuentes")
 
 
-def metodologo_pirjo(bullets: str) -> Dict[str, str]:
+PIRJO_BLOCKS = {
+    "P": "Problema",
+    "I": "Información relevante",
+    "R": "Restricción o brecha",
+    "J": "Justificación",
+    "O": "Objetivo",
+}
+PIRJO_CONCURRENCY = 5
+PIRJO_CALL_TIMEOUT = 120.0
+
+
+def _pirjo_block(clave: str, nombre: str, bullets: str) -> str:
+    """Request a single PIRJO block and return its text."""
+    if clave == "I":
+        prompt = (
+            "Convierte las viñetas siguientes en mini-resúmenes de cada fuente citada "
+            "para el bloque I (Información relevante). Menciona autor y año cuando sea "
+            "posible. Responde estrictamente en JSON con la clave \"I\". Mantén las citas "
+            "entre corchetes exactamente como aparecen.\n\n"
+            f"Viñetas:\n{bullets}"
+        )
+    else:
+        prompt = (
+            f"Convierte las viñetas siguientes en el bloque {clave} ({nombre}) con 2-3 "
+            f"oraciones claras. Responde estrictamente en JSON con la clave \"{clave}\". "
+            "Mantén las citas entre corchetes exactamente como aparecen.\n\n"
+            f"Viñetas:\n{bullets}"
+        )
+    system = f"Agente {clave} - {nombre}"
+    with span("pirjo_block", block=clave):
+        content = _call_openai(prompt, system=system)
+    try:
+        parsed = json.loads(content)
+        return parsed.get(clave, content)
+    except json.JSONDecodeError:
+        return content
+
+
+@traced("metodologo_pirjo")
+def metodologo_pirjo(
+    bullets: str,
+    max_concurrency: int = 1,
+    timeout: Optional[float] = None,
+) -> Dict[str, str]:
     """Transform bullets into PIRJO blocks with individual JSON calls.
 
     Each block (P, I, R, J y O) is requested separately from the language
@@ -142,42 +641,51 @@ def metodologo_pirjo(bullets: str) -> Dict[str, str]:
     corresponding key. A dedicated agent role is used for every block to
     keep responsibilities isolated. The resulting values are gathered into a
     single dictionary for downstream use.
+
+    With ``max_concurrency`` above one or a ``timeout`` (seconds per call),
+    the requests run in a thread pool. A block whose call fails or times out
+    is logged and left empty while the other blocks are kept; the error is
+    only raised when every block failed.
     """
 
-    bloques = {
-        "P": "Problema",
-        "I": "Información relevante",
-        "R": "Restricción o brecha",
-        "J": "Justificación",
-        "O": "Objetivo",
+    if max_concurrency <= 1 and timeout is None:
+        return {
+            clave: _pirjo_block(clave, nombre, bullets) for clave, nombre in PIRJO_BLOCKS.items()
+        }
+
+    workers = max(1, min(max_concurrency, len(PIRJO_BLOCKS)))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pirjo")
+    submitted = time.monotonic()
+    futures = {
+        clave: executor.submit(bind(_pirjo_block), clave, nombre, bullets)
+        for clave, nombre in PIRJO_BLOCKS.items()
     }
     results: Dict[str, str] = {}
-    for clave, nombre in bloques.items():
-        if clave == "I":
-            prompt = (
-                "Convierte las viñetas siguientes en mini-resúmenes de cada fuente citada "
-                "para el bloque I (Información relevante). Menciona autor y año cuando sea "
-                "posible. Responde estrictamente en JSON con la clave \"I\". Mantén las citas "
-                "entre corchetes exactamente como aparecen.\n\n"
-                f"Viñetas:\n{bullets}"
-            )
-        else:
-            prompt = (
-                f"Convierte las viñetas siguientes en el bloque {clave} ({nombre}) con 2-3 "
-                f"oraciones claras. Responde estrictamente en JSON con la clave \"{clave}\". "
-                "Mantén las citas entre corchetes exactamente como aparecen.\n\n"
-                f"Viñetas:\n{bullets}"
-            )
-        system = f"Agente {clave} - {nombre}"
-        content = _call_openai(prompt, system=system)
-        try:
-            parsed = json.loads(content)
-            results[clave] = parsed.get(clave, content)
-        except json.JSONDecodeError:
-            results[clave] = content
+    errors: List[BaseException] = []
+    try:
+        for position, (clave, future) in enumerate(futures.items()):
+            # Calls queued behind the first ``workers`` ones get extra time slots.
+            deadline = None
+            if timeout is not None:
+                deadline = submitted + timeout * (position // workers + 1)
+            try:
+                results[clave] = future.result(timeout=_remaining(deadline))
+            except FutureTimeoutError as exc:
+                logger.warning("PIRJO block %s timed out after %.1fs", clave, timeout)
+                errors.append(exc)
+                results[clave] = ""
+            except Exception as exc:
+                logger.warning("PIRJO block %s failed: %s", clave, exc)
+                errors.append(exc)
+                results[clave] = ""
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    if len(errors) == len(PIRJO_BLOCKS):
+        raise errors[0]
     return results
 
 
+@traced("agente_manager")
 def agente_manager(title: str, objective: str, blocks: Dict[str, str]) -> Dict[str, str]:
     """Ensure PIRJO blocks align with title and objective."""
     prompt = (
@@ -207,17 +715,31 @@ def redactor_academico(blocks: Dict[str, str]) -> str:
     return _call_openai(prompt, system="Agente Redactor Académico")
 
 
-def redactor_cientifico(blocks: Dict[str, str]) -> str:
-    """Combine PIRJO blocks into a single coherent scientific text."""
+def _redactor_cientifico_request(blocks: Dict[str, str]) -> Tuple[str, str]:
+    """Return the ``(prompt, system)`` pair of the scientific writer agent."""
     prompt = (
         "Une todos los bloques PIRJO proporcionados en el siguiente JSON en un texto "
         "coherente con estilo de artículo científico. Evita listar las letras de los "
         "bloques y mantén la redacción en español.\n\n" + json.dumps(blocks, ensure_ascii=False)
     )
     system = "Un experto redactor de artículos científicos"
+    return prompt, system
+
+
+@traced("redactor_cientifico")
+def redactor_cientifico(blocks: Dict[str, str]) -> str:
+    """Combine PIRJO blocks into a single coherent scientific text."""
+    prompt, system = _redactor_cientifico_request(blocks)
     return _call_openai(prompt, system=system)
 
 
+def redactor_cientifico_stream(blocks: Dict[str, str]) -> Iterator[str]:
+    """Yield the text of :func:`redactor_cientifico` as it is generated."""
+    prompt, system = _redactor_cientifico_request(blocks)
+    with span("redactor_cientifico", stream=True):
+        yield from _stream_openai(prompt, system=system)
+
+
 def unir_bloques_pirjo(raw_blocks: Dict[str, Any]) -> Dict[str, str]:
     """Flatten a PIRJO JSON with subkeys into single text blocks.
 
@@ -253,16 +775,31 @@ def redactor_desde_json(raw_blocks: Dict[str, Any]) -> str:
     return redactor_cientifico(merged)
 
 
-def revisor_citas_referencias(text: str) -> str:
-    """Review text and ensure citations and references in APA 7 format."""
+def _revisor_request(text: str) -> Tuple[str, str]:
+    """Return the ``(prompt, system)`` pair of the citation reviewer agent."""
     prompt = (
         "Eres un revisor académico. Verifica que el texto incluya citas en el cuerpo "
         "y agrega una sección final titulada \"Referencias\" con las entradas en formato APA 7.\n\n"
         f"Texto:\n{text}"
     )
-    return _call_openai(prompt, system="Agente Revisor Académico")
+    return prompt, "Agente Revisor Académico"
 
 
+@traced("revisor_citas_referencias")
+def revisor_citas_referencias(text: str) -> str:
+    """Review text and ensure citations and references in APA 7 format."""
+    prompt, system = _revisor_request(text)
+    return _call_openai(prompt, system=system)
+
+
+def revisor_citas_referencias_stream(text: str) -> Iterator[str]:
+    """Yield the text of :func:`revisor_citas_referencias` as it is generated."""
+    prompt, system = _revisor_request(text)
+    with span("revisor_citas_referencias", stream=True):
+        yield from _stream_openai(prompt, system=system)
+
+
+@traced("verificador_bibliografia")
 def verificador_bibliografia(
     text: str, sources: List[Dict[str, str]], metadata: Dict[str, Dict[str, str]]
 ) -> str:
@@ -282,6 +819,9 @@ def verificador_bibliografia(
         f"{s['file']}:{s['page']}:{s.get('chunk_id', s.get('chunk', ''))}"
         for s in sources
     }
+    valid_keys.update(
+        f"{c['file']}:{c['page']}:{c['chunk']}" for s in sources for c in s.get("citations", [])
+    )
     used_files: List[str] = []
     for cit in citations:
         if cit in valid_keys:
@@ -302,45 +842,394 @@ def verificador_bibliografia(
     return f"{text}\n\nReferencias\n{refs}"
 
 
+def retrieval_queries(title: str, objective: str, summary: str) -> Dict[str, str]:
+    """Return the retrieval queries: the composite one plus one per PIRJO block."""
+    queries = {"composite": " ".join([title, summary, objective]).strip()}
+    for clave, nombre in PIRJO_BLOCKS.items():
+        queries[clave] = f"{nombre}: {title}. {objective}"
+    return queries
+
+
+@traced("retrieve_relevant_chunks")
 def retrieve_relevant_chunks(
     title: str,
     objective: str,
     summary: str,
-    sources: List[Dict[str, str]],
+    sources: Optional[List[Dict[str, str]]],
     k: int = 5,
+    index_data: Optional[Tuple[Any, Any]] = None,
+    lexical: Optional[BM25Index] = None,
+    rerank: Optional[int] = None,
 ) -> Tuple[str, List[Dict[str, str]]]:
     """Return a summary of prior studies and the supporting chunks.
 
-    This function searches the FAISS index built from ``sources`` using a
-    composite query derived from the research ``title``, ``objective`` and
-    ``summary``. The top ``k`` matching fragments are then analysed by the
+    This function searches the FAISS index built from ``sources`` with the
+    queries of :func:`retrieval_queries`: a composite query derived from the
+    research ``title``, ``objective`` and ``summary`` plus one query per
+    PIRJO block. All of them are embedded and searched in a single batch,
+    fusing the dense ranking with the BM25 ranking of the lexical index
+    stored next to the FAISS index so that exact technical terms, acronyms
+    and author names are not missed. The top ``k`` fragments of every query
+    are merged without duplicates, best matches first. They are then analysed by the
     ``analista_de_fuentes`` agent to extract relevant findings, which are
     returned as bullet points with citations. Both the bullet string and the
     underlying chunk metadata are provided so that later stages can verify
-    references.
+    references. An already built ``(index, metadata)`` pair can be passed as
+    ``index_data`` together with its ``lexical`` index (see
+    :func:`load_corpus`), in which case ``sources`` is not indexed again;
+    without ``lexical`` only dense search is used. ``rerank`` re-scores that
+    many candidates exactly, which is useful for quantized indexes.
     """
 
-    query = " ".join([title, summary, objective]).strip()
-    index, metadata = ensure_index(sources)
-    chunks = search_index(query, k, index, metadata)
+    queries = retrieval_queries(title, objective, summary)
+    if index_data is None:
+        index_data = ensure_index(sources)
+        lexical = load_lexical_index(metadata=index_data[1])
+    index, metadata = index_data
+    results = search_index_batch(
+        list(queries.values()), k, index, metadata, lexical=lexical, rerank=rerank
+    )
+    chunks = merge_search_results(results)
     bullets = analista_de_fuentes(title, objective, summary, chunks)
     return bullets, chunks
 
 
-def generate_introduction(
-    title: str, objective: str, summary: str, file_paths: List[str]
-) -> Dict[str, str]:
-    """Orchestrate the PIRJO pipeline and return results."""
+PDF_INFO_FILE = "pdf_info.json"
+
+_INDEX_STORE: Optional[IndexStore] = None
+# Vector encoding of new corpora and exact re-ranking depth of searches.
+INDEX_ENCODING = "float32"
+INDEX_RERANK: Optional[int] = None
+
+
+def configure_index_store(
+    directory: str,
+    max_loaded: int = INDEX_STORE_MAX_LOADED,
+    encoding: str = "float32",
+    rerank: Optional[int] = None,
+    max_corpora: int = INDEX_STORE_MAX_CORPORA,
+) -> IndexStore:
+    """Keep the index of every corpus in its own directory under ``directory``.
+
+    ``encoding`` compresses the vectors of the indexes (see
+    ``rag_faiss.build_index``) so that more corpora fit in memory, and
+    ``rerank`` re-scores that many candidates of every search exactly. At most
+    ``max_corpora`` corpora are kept on disk (``0`` keeps them all). When
+    this function is never called, the store is configured from
+    ``INDEX_STORE_DIR`` (default ``.index_store``), ``INDEX_STORE_MAX_LOADED``
+    (indexes kept in memory), ``INDEX_ENCODING``, ``INDEX_RERANK`` and
+    ``INDEX_STORE_MAX_CORPORA`` on first use.
+    """
+    global _INDEX_STORE, INDEX_ENCODING, INDEX_RERANK
+    _INDEX_STORE = IndexStore(directory, max_loaded, max_corpora)
+    INDEX_ENCODING = encoding
+    INDEX_RERANK = rerank
+    return _INDEX_STORE
+
+
+def _get_index_store() -> IndexStore:
+    """Return the configured index store."""
+    if _INDEX_STORE is None:
+        rerank = os.getenv("INDEX_RERANK")
+        configure_index_store(
+            os.getenv("INDEX_STORE_DIR", ".index_store"),
+            int(os.getenv("INDEX_STORE_MAX_LOADED", INDEX_STORE_MAX_LOADED)),
+            os.getenv("INDEX_ENCODING", "float32"),
+            int(rerank) if rerank else None,
+            int(os.getenv("INDEX_STORE_MAX_CORPORA", INDEX_STORE_MAX_CORPORA)),
+        )
+    return _INDEX_STORE
+
+
+@traced("load_corpus")
+def load_corpus(
+    file_paths: List[str],
+) -> Tuple[Any, Any, Dict[str, Dict[str, str]], Optional[BM25Index]]:
+    """Return ``(index, chunks, pdf_metadata, lexical)`` for ``file_paths``.
+
+    The corpus is looked up in the index store by the hash of its files (and
+    by :data:`INDEX_ENCODING` and the embedding backend when they are not the
+    defaults): a corpus already in memory is returned as is, one on disk is
+    loaded and a new one is extracted and indexed into its own directory.
+    A new corpus starts from a copy of the stored corpus sharing most of its
+    files: the files it already holds are neither parsed nor embedded again,
+    so only the files added or changed are processed.
+    Concurrent requests for the same corpus build it only once.
+    """
+
+    def _index(directory: str, kept: Set[str], extracted: Dict[str, Dict[str, str]]):
+        return ensure_index_streaming(
+            iter_sources(
+                [path for path in file_paths if os.path.basename(path) not in kept], extracted
+            ),
+            index_file=os.path.join(directory, INDEX_FILE),
+            meta_file=os.path.join(directory, META_FILE),
+            encoding=INDEX_ENCODING,
+            keep_files=kept,
+        )
+
+    def _build(directory: str):
+        seeded = set(seed_members(directory))
+        kept = {os.path.basename(p) for p, m in zip(file_paths, members) if m in seeded}
+        extracted: Dict[str, Dict[str, str]] = {}
+        try:
+            index, chunks = _index(directory, kept, extracted)
+        except ValueError:
+            if not kept:
+                raise
+            # The seed was built with other index settings: start from scratch.
+            kept = set()
+            extracted.clear()
+            index, chunks = _index(directory, kept, extracted)
+        info_file = os.path.join(directory, PDF_INFO_FILE)
+        seed_info: Dict[str, Dict[str, str]] = {}
+        if kept:
+            with open(info_file, "r", encoding="utf-8") as f:
+                seed_info = json.load(f)
+        pdf_metadata: Dict[str, Dict[str, str]] = {}
+        for path in file_paths:
+            fname = os.path.basename(path)
+            if fname in extracted:
+                pdf_metadata[fname] = extracted[fname]
+            elif fname in kept and fname in seed_info:
+                pdf_metadata[fname] = seed_info[fname]
+        with open(info_file + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(pdf_metadata, f, ensure_ascii=False)
+        os.replace(info_file + ".tmp", info_file)
+        return index, chunks, pdf_metadata, load_lexical_index(os.path.join(directory, INDEX_FILE), chunks)
+
+    store = _get_index_store()
+    members = corpus_members(file_paths)
+    variant = ""
+    if INDEX_ENCODING != "float32":
+        variant = f"{variant}-{INDEX_ENCODING}"
+    backend = embedding_backend_id()
+    if backend != EMBEDDING_MODEL:
+        variant = f"{variant}-{backend.rsplit('@', 1)[-1]}"
+    key = corpus_key(file_paths, members) + variant
+    return store.get(key, _build, _load_corpus_dir, members=members, group=variant)
+
+
+def _load_corpus_dir(
+    directory: str,
+) -> Tuple[Any, Any, Dict[str, Dict[str, str]], Optional[BM25Index]]:
+    """Load a corpus built by :func:`load_corpus` from ``directory``."""
+    index_file = os.path.join(directory, INDEX_FILE)
+    index, chunks, _, _ = load_index(index_file, os.path.join(directory, META_FILE))
+    with open(os.path.join(directory, PDF_INFO_FILE), "r", encoding="utf-8") as f:
+        pdf_metadata = json.load(f)
+    return index, chunks, pdf_metadata, load_lexical_index(index_file, chunks)
+
+
+def _warm_last_corpus() -> None:
+    store = _get_index_store()
+    key = store.last_used()
+    if key is not None:
+        store.preload(key, _load_corpus_dir)
+
+
+def warm_up(index: bool = True) -> Dict[str, float]:
+    """Preload the embedding model, the tokenizer and the last-used index.
+
+    Returns the seconds spent on every step. Failures are logged and skipped:
+    a warm-up only saves time and must never keep the application from
+    starting.
+    """
+    steps = [
+        ("model", rag_warm_up),
+        ("tokenizer", get_encoding),
+        ("pdf", lambda: importlib.import_module("PyPDF2")),
+    ]
+    if index:
+        steps.append(("index", _warm_last_corpus))
+    timings: Dict[str, float] = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception:  # noqa: BLE001 - the request path will report it
+            logger.warning("Warm-up step %s failed", name, exc_info=True)
+            continue
+        timings[name] = time.perf_counter() - start
+    logger.info("Warm-up finished: %s", {k: round(v, 3) for k, v in timings.items()})
+    return timings
+
+
+def warm_up_in_background(index: bool = True) -> threading.Thread:
+    """Run :func:`warm_up` in a daemon thread and return the thread."""
+    thread = threading.Thread(target=warm_up, args=(index,), name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+STAGE_LABELS = {
+    "indexando": "Indexando PDFs",
+    "analizando": "Analizando fuentes",
+    "pirjo": "Generando bloques PIRJO",
+    "manager": "Revisando coherencia",
+    "redactando": "Redactando introducción",
+    "revisando": "Revisando citas y referencias",
+    "listo": "Listo",
+}
+
+
+def _stage(stage: str, text: str = "", **extra: Any) -> Dict[str, Any]:
+    """Return a progress event of :func:`iter_introduction`."""
+    event = {"stage": stage, "label": STAGE_LABELS[stage], "text": text}
+    event.update(extra)
+    return event
+
+
+def _run_writer(
+    call, stream_call, arg: Any, stream: bool, stage: str
+) -> Iterator[Dict[str, Any]]:
+    """Run a writer agent, yielding the accumulated text of every delta."""
+    if not stream:
+        yield _stage(stage, call(arg))
+        return
+    text = ""
+    for delta in stream_call(arg):
+        text += delta
+        yield _stage(stage, text)
+    yield _stage(stage, text.strip())
+
+
+_TRACING: Optional[Dict[str, Any]] = None
+
+
+def configure_tracing(
+    enabled: bool = True,
+    directory: Optional[str] = None,
+    formats: Iterable[str] = ("json",),
+) -> Dict[str, Any]:
+    """Record a trace of every :func:`iter_introduction` run.
+
+    The trace (see :mod:`instrumentation`) holds the wall time of every
+    stage, agent and LLM call, the token usage reported by the API, page and
+    chunk counts and cache hits. It is added to the result under ``"trace"``
+    and, when ``directory`` is given, written there in ``formats`` (``json``,
+    ``prometheus`` and ``otel``). When this function is never called, tracing
+    is configured from ``PIPELINE_TRACE`` (``1`` enables it),
+    ``PIPELINE_TRACE_DIR`` and ``PIPELINE_TRACE_FORMATS`` (comma separated)
+    on first use.
+    """
+    global _TRACING
+    formats = tuple(formats)
+    for fmt in formats:
+        if fmt not in TRACE_FORMATS:
+            raise ValueError(f"Unknown trace format {fmt!r}; expected one of {TRACE_FORMATS}")
+    _TRACING = {"enabled": enabled, "directory": directory, "formats": formats}
+    return _TRACING
+
+
+def _get_tracing() -> Dict[str, Any]:
+    """Return the tracing settings."""
+    if _TRACING is None:
+        formats = os.getenv("PIPELINE_TRACE_FORMATS", "json")
+        configure_tracing(
+            os.getenv("PIPELINE_TRACE", "0") == "1",
+            os.getenv("PIPELINE_TRACE_DIR") or None,
+            [f.strip() for f in formats.split(",") if f.strip()],
+        )
+    return _TRACING
+
+
+def _traced_events(
+    events: Iterator[Dict[str, Any]], settings: Dict[str, Any], **attrs: Any
+) -> Iterator[Dict[str, Any]]:
+    """Run ``events`` under a new trace and attach it to the final result."""
+    trace = Trace("generate_introduction", **attrs)
+    for event in trace.wrap(events):
+        if "result" in event:
+            trace.finish()
+            data = trace.to_dict()
+            event["result"]["trace"] = data
+            if settings["directory"]:
+                try:
+                    write_trace(data, settings["directory"], settings["formats"])
+                except OSError:
+                    logger.warning("Could not write trace %s", trace.trace_id, exc_info=True)
+        yield event
+
+
+def iter_introduction(
+    title: str, objective: str, summary: str, file_paths: List[str], stream: bool = True
+) -> Iterator[Dict[str, Any]]:
+    """Run the PIRJO pipeline and yield progress events.
+
+    Every event is a dict with the ``stage`` key, its human readable
+    ``label`` and the ``text`` produced so far for that stage. An event is
+    emitted when a stage starts; with ``stream`` the writer and reviewer
+    stages also emit one event per streamed token. The last event has stage
+    ``"listo"`` and carries the final result under ``"result"``, including
+    the run's ``"trace"`` when tracing is enabled (see
+    :func:`configure_tracing`).
+    """
+    events = _introduction_events(title, objective, summary, file_paths, stream)
+    settings = _get_tracing()
+    if not settings["enabled"]:
+        return events
+    return _traced_events(events, settings, files=len(file_paths), stream=stream)
+
+
+def _introduction_events(
+    title: str, objective: str, summary: str, file_paths: List[str], stream: bool
+) -> Iterator[Dict[str, Any]]:
+    """Generator behind :func:`iter_introduction`."""
     ensure_openai_api_key()
-    sources, metadata = extract_sources(file_paths)
-    bullets, chunks = retrieve_relevant_chunks(title, objective, summary, sources)
-    blocks = metodologo_pirjo(bullets)
+    yield _stage("indexando")
+    index, store, metadata, lexical = load_corpus(file_paths)
+    yield _stage("analizando")
+    bullets, chunks = retrieve_relevant_chunks(
+        title,
+        objective,
+        summary,
+        None,
+        index_data=(index, store),
+        lexical=lexical,
+        rerank=INDEX_RERANK,
+    )
+    yield _stage("pirjo")
+    blocks = metodologo_pirjo(
+        bullets, max_concurrency=PIRJO_CONCURRENCY, timeout=PIRJO_CALL_TIMEOUT
+    )
+    yield _stage("manager", blocks=blocks)
     blocks = agente_manager(title, objective, blocks)
-    introduction = redactor_cientifico(blocks)
-    introduction = revisor_citas_referencias(introduction)
+    yield _stage("redactando", blocks=blocks)
+    introduction = ""
+    for event in _run_writer(
+        redactor_cientifico, redactor_cientifico_stream, blocks, stream, "redactando"
+    ):
+        introduction = event["text"]
+        yield event
+    yield _stage("revisando", introduction)
+    for event in _run_writer(
+        revisor_citas_referencias,
+        revisor_citas_referencias_stream,
+        introduction,
+        stream,
+        "revisando",
+    ):
+        introduction = event["text"]
+        yield event
     introduction = verificador_bibliografia(introduction, chunks, metadata)
-    return {
+    result = {
         "introduction": introduction,
         "blocks": blocks,
         "files": [os.path.basename(p) for p in file_paths],
     }
+    yield _stage("listo", introduction, result=result)
+
+
+def generate_introduction(
+    title: str, objective: str, summary: str, file_paths: List[str]
+) -> Dict[str, str]:
+    """Orchestrate the PIRJO pipeline and return results.
+
+    PDF pages are streamed into the FAISS index as they are parsed instead of
+    being extracted in full first, and indexes are reused per corpus (see
+    :func:`load_corpus`). See :func:`iter_introduction` for a
+    variant that reports progress and streams the generated text.
+    """
+    events = iter_introduction(title, objective, summary, file_paths, stream=False)
+    return deque(events, maxlen=1)[0]["result"]
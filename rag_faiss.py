@@ -1,14 +1,64 @@
+from __future__ import annotations
+
+import atexit
 import json
+import logging
 import os
 import hashlib
-from typing import Dict, List, Tuple, Optional
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Set, Tuple, Optional, Union
 
-import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from bm25 import BM25Index
+from dedup import Deduplicator
+from embedding_backends import EmbeddingBackend, backend_id, create_backend
+from embedding_cache import DEFAULT_MAX_BYTES, EmbeddingCache
+from instrumentation import bind, count, span, traced
+from lazy_import import LazyModule
+from meta_store import ChunkStore, ChunkStoreWriter
+
+logger = logging.getLogger(__name__)
+
+# Heavy dependencies are imported on first use (see :func:`warm_up`).
+faiss = LazyModule("faiss")
 
 INDEX_FILE = "faiss.index"
 META_FILE = "faiss_meta.json"
+EMBED_BATCH_SIZE = 64
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+ProgressCallback = Callable[[int, int], None]
+
+INDEX_TYPES = ("flat", "hnsw", "ivf")
+DEFAULT_INDEX_PARAMS: Dict[str, Dict[str, int]] = {
+    "flat": {},
+    "hnsw": {"M": 32, "efConstruction": 40},
+    "ivf": {"nlist": 100},
+}
+# FAISS needs roughly this many training points per k-means centroid (IVF
+# lists and PQ codes alike).
+IVF_MIN_POINTS_PER_LIST = 39
+# IVF queries probe ``nlist // IVF_NPROBE_DIVISOR`` lists unless ``nprobe`` is
+# given. FAISS probes a single list by default, which misses many of the true
+# neighbours; see benchmarks/ann_recall_latency.py.
+IVF_NPROBE_DIVISOR = 8
+# Vector encodings: full precision, scalar quantization to float16 or 8-bit
+# integers, and product quantization into ``m`` codes of ``nbits`` bits.
+ENCODINGS = ("float32", "fp16", "sq8", "pq")
+DEFAULT_ENCODING_PARAMS: Dict[str, Dict[str, int]] = {
+    "float32": {},
+    "fp16": {},
+    "sq8": {},
+    "pq": {"m": 48, "nbits": 8},
+}
+# Smallest PQ codebook worth training; smaller corpora fall back to sq8.
+PQ_MIN_NBITS = 4
+# Vectors held back while streaming to train the sq8 value ranges.
+SQ_TRAIN_POINTS = 1000
+# Rank offset of reciprocal-rank fusion in hybrid search.
+RRF_K = 60
 
 
 def _chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
@@ -25,133 +75,1343 @@ def _chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str
     return chunks
 
 
-_MODEL: Optional[SentenceTransformer] = None
+_MODEL: Optional[EmbeddingBackend] = None
+_BACKEND: Optional[str] = None
+_MODEL_LOCK = threading.Lock()
+
+
+def configure_embedding_backend(backend: str) -> None:
+    """Run the embedding model on ``torch``, ``onnx`` or ``int8`` (see :mod:`embedding_backends`).
+
+    The model is loaded again on next use and the embedding cache switches
+    to the vectors of the new backend. When this function is never called,
+    the backend is read from ``EMBEDDING_BACKEND`` (default ``torch``).
+    """
+    global _BACKEND, _MODEL
+    backend_id(MODEL_NAME, backend)  # raises for unknown backends
+    _BACKEND = backend
+    _MODEL = None
+    if _CACHE is not None:
+        configure_embedding_cache(*_CACHE_SETTINGS)
+
+
+def _backend_name() -> str:
+    global _BACKEND
+    if _BACKEND is None:
+        backend = os.getenv("EMBEDDING_BACKEND", "torch")
+        backend_id(MODEL_NAME, backend)  # raises for unknown backends
+        _BACKEND = backend
+    return _BACKEND
+
+
+def embedding_backend_id() -> str:
+    """Return the tag of the vectors produced by the configured backend."""
+    return getattr(_MODEL, "id", None) or backend_id(MODEL_NAME, _backend_name())
 
 
-def _get_model() -> SentenceTransformer:
-    """Lazily initialize and return the sentence-transformer model."""
+def _get_model() -> EmbeddingBackend:
+    """Lazily initialize and return the embedding backend.
+
+    The model is shared by all threads and loaded only once.
+    """
     global _MODEL
     if _MODEL is None:
-        _MODEL = SentenceTransformer("all-MiniLM-L6-v2")
+        with _MODEL_LOCK:
+            if _MODEL is None:
+                _MODEL = create_backend(_backend_name(), MODEL_NAME)
     return _MODEL
 
 
+def warm_up() -> None:
+    """Import FAISS and load the embedding model ahead of the first request."""
+    faiss.load()
+    _get_model()
+
+
+def embedding_dimension() -> int:
+    """Return the width of the embeddings produced by the model.
+
+    The dimension reported by the backend is used when available, so no text
+    has to be encoded; other models embed an empty string instead.
+    """
+    model = _get_model()
+    dim = getattr(model, "dimension", None)
+    if dim is None:
+        getter = getattr(model, "get_sentence_embedding_dimension", None)
+        dim = getter() if getter is not None else None
+    if dim is None:
+        dim = _embed_texts([""]).shape[1]
+    return int(dim)
+
+
+_CACHE: Optional[EmbeddingCache] = None
+_CACHE_CONFIGURED = False
+_CACHE_SETTINGS: Optional[Tuple[Optional[str], int]] = None
+
+
+def configure_embedding_cache(
+    directory: Optional[str],
+    max_bytes: int = DEFAULT_MAX_BYTES,
+) -> Optional[EmbeddingCache]:
+    """Enable the persistent embedding cache in ``directory``.
+
+    Passing ``None`` disables the cache. Vectors are kept apart per
+    :func:`embedding_backend_id`. When this function is never called, the
+    cache is configured from ``EMBEDDING_CACHE_DIR`` and
+    ``EMBEDDING_CACHE_MAX_BYTES`` on first use.
+    """
+    global _CACHE, _CACHE_CONFIGURED, _CACHE_SETTINGS
+    if _CACHE is not None:
+        _CACHE.close()
+    _CACHE_SETTINGS = (directory, max_bytes)
+    _CACHE = EmbeddingCache(directory, embedding_backend_id(), max_bytes) if directory else None
+    if _CACHE is not None:
+        # The key index is written in batches; write what is left on exit.
+        atexit.register(_CACHE.close)
+    _CACHE_CONFIGURED = True
+    return _CACHE
+
+
+def _get_cache() -> Optional[EmbeddingCache]:
+    """Return the configured embedding cache, if any."""
+    if not _CACHE_CONFIGURED:
+        configure_embedding_cache(
+            os.getenv("EMBEDDING_CACHE_DIR") or None,
+            int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+        )
+    return _CACHE
+
+
+def embedding_cache_stats() -> Dict[str, int]:
+    """Return hit/miss counters of the embedding cache (empty if disabled)."""
+    cache = _get_cache()
+    return cache.stats() if cache is not None else {}
+
+
 def _embed_text(text: str) -> List[float]:
     """Return embedding for ``text`` using a local sentence-transformer model."""
     model = _get_model()
     return model.encode(text).tolist()
 
 
+def _embed_texts(
+    texts: Iterable[str],
+    batch_size: int = EMBED_BATCH_SIZE,
+    progress_callback: Optional[ProgressCallback] = None,
+) -> np.ndarray:
+    """Return a contiguous ``float32`` matrix with one embedding row per text.
+
+    Texts found in the embedding cache (see :func:`configure_embedding_cache`)
+    are copied from it; the rest are encoded in batches of ``batch_size``,
+    written directly into a preallocated matrix and added to the cache.
+    ``progress_callback`` receives ``(done, total)`` after every batch.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer")
+    texts = list(texts)
+    total = len(texts)
+    matrix: Optional[np.ndarray] = None
+    pending: List[int] = list(range(total))
+    cache = _get_cache()
+    if cache is not None and texts:
+        hits, hit_matrix, pending = cache.lookup(texts)
+        if hit_matrix is not None:
+            matrix = np.empty((total, hit_matrix.shape[1]), dtype="float32")
+            matrix[hits] = hit_matrix
+    if pending:
+        model = _get_model()
+    done = total - len(pending)
+    count("embedding.texts", total)
+    count("embedding.cache_hits", done)
+    for start in range(0, len(pending), batch_size):
+        rows = pending[start : start + batch_size]
+        batch = [texts[i] for i in rows]
+        with span("embed", texts=len(batch)):
+            emb = np.asarray(
+                model.encode(
+                    batch,
+                    batch_size=batch_size,
+                    convert_to_numpy=True,
+                    show_progress_bar=False,
+                ),
+                dtype="float32",
+            )
+        if matrix is None:
+            matrix = np.empty((total, emb.shape[1]), dtype="float32")
+        matrix[rows] = emb
+        if cache is not None:
+            cache.store(batch, emb)
+        done += len(rows)
+        if progress_callback is not None:
+            progress_callback(done, total)
+    if not pending and total and progress_callback is not None:
+        progress_callback(total, total)
+    if matrix is None:
+        return np.empty((0, 0), dtype="float32")
+    return matrix
+
+
 def _hash_sources(sources: List[Dict[str, str]]) -> str:
     """Return a stable hash for the provided sources."""
     payload = json.dumps(sources, sort_keys=True, ensure_ascii=False).encode("utf-8")
     return hashlib.md5(payload).hexdigest()
 
 
-def build_index(
+def _hash_sources_by_file(sources: List[Dict[str, str]]) -> Dict[str, str]:
+    """Return a stable content hash for the sources of every file."""
+    grouped: Dict[str, List[Dict[str, str]]] = {}
+    for src in sources:
+        grouped.setdefault(src["file"], []).append(src)
+    return {fname: _hash_sources(items) for fname, items in grouped.items()}
+
+
+def _collect_chunks(
     sources: List[Dict[str, str]],
-    index_file: str = INDEX_FILE,
-    meta_file: str = META_FILE,
-    chunk_size: int = 500,
-    overlap: int = 50,
-) -> Tuple[faiss.IndexFlatL2, List[Dict[str, str]]]:
-    """Build a FAISS index from sources and persist it along with metadata."""
-    embeddings: List[np.ndarray] = []
+    chunk_size: int,
+    overlap: int,
+    start_id: int = 0,
+) -> Tuple[List[str], List[Dict[str, str]]]:
+    """Split ``sources`` into chunk texts and metadata with consecutive ids.
+
+    A source carrying a precomputed ``"tokens"`` count that fits in a single
+    chunk passes the count on to its chunk metadata (only whitespace is
+    normalised, so it remains an upper bound).
+
+    Chunks are numbered per page from the source's ``chunk_id`` when it has
+    one, so that ``(file, page, chunk)`` identifies a chunk even when a page
+    yields several sources.
+    """
+    texts: List[str] = []
     metadata: List[Dict[str, str]] = []
+    next_number: Dict[Tuple[str, Any], int] = {}
     for src in sources:
-        for idx, chunk in enumerate(_chunk_text(src["text"], chunk_size, overlap)):
-            emb = np.array(_embed_text(chunk), dtype="float32")
-            embeddings.append(emb)
-            metadata.append({
+        chunks = _chunk_text(src["text"], chunk_size, overlap)
+        page = (src["file"], src["page"])
+        first = max(int(src.get("chunk_id", 0)), next_number.get(page, 0))
+        next_number[page] = first + len(chunks)
+        for idx, chunk in enumerate(chunks):
+            texts.append(chunk)
+            record = {
+                "id": start_id + len(metadata),
                 "file": src["file"],
                 "page": src["page"],
-                "chunk": idx,
+                "chunk": first + idx,
                 "text": chunk,
-            })
-    if not embeddings:
-        dim = len(_embed_text(""))
-        index = faiss.IndexFlatL2(dim)
+            }
+            if len(chunks) == 1 and "tokens" in src:
+                record["tokens"] = src["tokens"]
+            metadata.append(record)
+    return texts, metadata
+
+
+def _add_chunks(
+    index: faiss.Index,
+    texts: List[str],
+    metadata: List[Dict[str, str]],
+    batch_size: int,
+    progress_callback: Optional[ProgressCallback],
+) -> None:
+    """Embed ``texts`` and add them to ``index`` under their metadata ids."""
+    if not texts:
+        return
+    emb_matrix = _embed_texts(texts, batch_size, progress_callback)
+    ids = np.fromiter((m["id"] for m in metadata), dtype="int64", count=len(metadata))
+    index.add_with_ids(emb_matrix, ids)
+
+
+def _dedupe(
+    dedup: Optional[Deduplicator], texts: List[str], records: List[Dict[str, Any]]
+) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """Mark duplicate ``records`` with ``dup_of`` and return the ones to embed."""
+    if dedup is None:
+        return texts, records
+    keep_texts: List[str] = []
+    keep_records: List[Dict[str, Any]] = []
+    for text, record in zip(texts, records):
+        original = dedup.add(record["id"], text)
+        if original is None:
+            keep_texts.append(text)
+            keep_records.append(record)
+        else:
+            record["dup_of"] = original
+    return keep_texts, keep_records
+
+
+def _seed_dedup(dedup: Optional[Deduplicator], store: ChunkStore, keep: np.ndarray) -> None:
+    """Register the canonical chunks of ``store`` selected by ``keep`` in ``dedup``.
+
+    New chunks that repeat an indexed chunk then become its duplicates
+    instead of being embedded again.
+    """
+    if dedup is None:
+        return
+    for pos in np.flatnonzero(keep & (store.rows["dup_of"] < 0)):
+        record = store[int(pos)]
+        dedup.seed(record["id"], record["text"])
+
+
+def _orphan_records(
+    store: ChunkStore, removed: np.ndarray, start_id: int
+) -> Tuple[np.ndarray, List[str], List[Dict[str, Any]]]:
+    """Return duplicates whose original is in ``removed`` as fresh records.
+
+    Such chunks have no vector of their own, so they are dropped from
+    ``store`` (the returned mask) and indexed again under new ids.
+    """
+    orphans = store.orphan_mask(removed)
+    records: List[Dict[str, Any]] = []
+    for pos in np.flatnonzero(orphans):
+        record = store[int(pos)]
+        del record["dup_of"]
+        record["id"] = start_id + len(records)
+        records.append(record)
+    return orphans, [r["text"] for r in records], records
+
+
+def _dedup_report(dedup: Optional[Deduplicator], dim: int) -> Optional[Dict[str, int]]:
+    """Log and return the savings of ``dedup`` for ``dim``-sized vectors."""
+    if dedup is None:
+        return None
+    stats = dedup.stats(dim)
+    logger.info(
+        "Deduplicated %d of %d chunks (%d exact, %d near); saved %d embeddings, %d bytes",
+        stats["embeddings_saved"],
+        stats["chunks"],
+        stats["exact_duplicates"],
+        stats["near_duplicates"],
+        stats["embeddings_saved"],
+        stats["bytes_saved"],
+    )
+    return stats
+
+
+def _index_spec(
+    index_type: str,
+    index_params: Optional[Dict[str, int]] = None,
+    encoding: str = "float32",
+    encoding_params: Optional[Dict[str, int]] = None,
+) -> Dict[str, Any]:
+    """Return the normalised ``{"type", "params"}`` spec for an index type.
+
+    Compressed vector encodings are recorded under ``"encoding"``; specs of
+    full-precision indexes omit it so that they match older meta files.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {INDEX_TYPES}")
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding {encoding!r}; expected one of {ENCODINGS}")
+    params = dict(DEFAULT_INDEX_PARAMS[index_type])
+    params.update(index_params or {})
+    spec: Dict[str, Any] = {"type": index_type, "params": params}
+    if encoding != "float32":
+        enc_params = dict(DEFAULT_ENCODING_PARAMS[encoding])
+        enc_params.update(encoding_params or {})
+        spec["encoding"] = {"type": encoding, "params": enc_params}
+    return spec
+
+
+def _spec_encoding(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the requested ``{"type", "params"}`` vector encoding of ``spec``."""
+    return spec.get("encoding", {"type": "float32", "params": {}})
+
+
+def _effective_encoding(encoding: Dict[str, Any], dim: int, n: int) -> Dict[str, Any]:
+    """Adapt ``encoding`` to ``dim`` dimensions and ``n`` training vectors.
+
+    PQ uses the largest number of codes up to ``m`` that divides ``dim`` and
+    fewer bits per code when there are not enough vectors to train
+    ``2**nbits`` centroids, falling back to sq8 below :data:`PQ_MIN_NBITS`.
+    Trained encodings fall back to fp16 when there is nothing to train on.
+    """
+    kind, params = encoding["type"], encoding["params"]
+    if kind == "pq":
+        m = max(d for d in range(1, min(params["m"], dim) + 1) if dim % d == 0)
+        nbits = min(params["nbits"], int(np.log2(n / IVF_MIN_POINTS_PER_LIST))) if n else 0
+        if nbits >= PQ_MIN_NBITS:
+            return {"type": "pq", "params": {"m": m, "nbits": nbits}}
+        kind = "sq8"
+    if kind == "sq8" and not n:
+        kind = "fp16"
+    return {"type": kind, "params": {}}
+
+
+def _code_size(encoding: Dict[str, Any], dim: int) -> int:
+    """Return the bytes stored per vector with ``encoding``."""
+    kind, params = encoding["type"], encoding["params"]
+    if kind == "pq":
+        return (params["m"] * params["nbits"] + 7) // 8
+    return dim * {"float32": 4, "fp16": 2, "sq8": 1}[kind]
+
+
+def _train_points(spec: Dict[str, Any]) -> int:
+    """Return how many vectors to collect before creating an index for ``spec``."""
+    points = 0
+    if spec["type"] == "ivf":
+        points = spec["params"]["nlist"] * IVF_MIN_POINTS_PER_LIST
+    encoding = _spec_encoding(spec)
+    if encoding["type"] == "pq":
+        points = max(points, 2 ** encoding["params"]["nbits"] * IVF_MIN_POINTS_PER_LIST)
+    elif encoding["type"] == "sq8":
+        points = max(points, SQ_TRAIN_POINTS)
+    return points
+
+
+def _create_index(spec: Dict[str, Any], dim: int, train_vectors: np.ndarray) -> faiss.Index:
+    """Return an empty ID-mapped index built according to ``spec``.
+
+    IVF indexes and quantized encodings are trained on ``train_vectors``; the
+    number of lists is reduced when there are not enough vectors to train the
+    requested ``nlist`` and a flat index is used when there is nothing to
+    train on (see :func:`_effective_encoding` for the encodings).
+    """
+    params = spec["params"]
+    n = len(train_vectors)
+    encoding = _effective_encoding(_spec_encoding(spec), dim, n)
+    kind, enc = encoding["type"], encoding["params"]
+    qtype = {
+        "fp16": faiss.ScalarQuantizer.QT_fp16,
+        "sq8": faiss.ScalarQuantizer.QT_8bit,
+    }.get(kind)
+    if spec["type"] == "hnsw":
+        if kind == "pq":
+            inner = faiss.IndexHNSWPQ(dim, enc["m"], params["M"], enc["nbits"])
+        elif qtype is not None:
+            inner = faiss.IndexHNSWSQ(dim, qtype, params["M"])
+        else:
+            inner = faiss.IndexHNSWFlat(dim, params["M"])
+        inner.hnsw.efConstruction = params["efConstruction"]
+    elif spec["type"] == "ivf" and n:
+        nlist = max(1, min(params["nlist"], n // IVF_MIN_POINTS_PER_LIST))
+        quantizer = faiss.IndexFlatL2(dim)
+        if kind == "pq":
+            inner = faiss.IndexIVFPQ(quantizer, dim, nlist, enc["m"], enc["nbits"])
+        elif qtype is not None:
+            inner = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, qtype)
+        else:
+            inner = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        inner.nprobe = default_nprobe(nlist)
+    elif kind == "pq":
+        inner = faiss.IndexPQ(dim, enc["m"], enc["nbits"])
+    elif qtype is not None:
+        inner = faiss.IndexScalarQuantizer(dim, qtype)
     else:
-        emb_matrix = np.vstack(embeddings)
-        dim = emb_matrix.shape[1]
-        index = faiss.IndexFlatL2(dim)
-        index.add(emb_matrix)
-    sources_hash = _hash_sources(sources)
-    save_index(index, metadata, index_file, meta_file, sources_hash=sources_hash, dim=dim)
+        inner = faiss.IndexFlatL2(dim)
+    if not inner.is_trained:
+        inner.train(train_vectors)
+    return faiss.IndexIDMap2(inner)
+
+
+def _inner_index(index: faiss.Index) -> faiss.Index:
+    """Return the index wrapped by an ID map, downcast to its concrete type."""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def _describe_index(index: faiss.Index) -> Dict[str, Any]:
+    """Return the effective type and parameters of ``index``."""
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return {
+            "type": "hnsw",
+            "params": {"M": inner.hnsw.nb_neighbors(1), "efConstruction": inner.hnsw.efConstruction},
+        }
+    if isinstance(inner, faiss.IndexIVF):
+        return {"type": "ivf", "params": {"nlist": inner.nlist}}
+    return {"type": "flat", "params": {}}
+
+
+def _describe_encoding(index: faiss.Index) -> Dict[str, Any]:
+    """Return the effective vector encoding of ``index``."""
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner = faiss.downcast_index(inner.storage)
+    if isinstance(inner, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return {"type": "pq", "params": {"m": inner.pq.M, "nbits": inner.pq.nbits}}
+    if isinstance(inner, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        kind = "fp16" if inner.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+        return {"type": kind, "params": {}}
+    return {"type": "float32", "params": {}}
+
+
+def default_nprobe(nlist: int) -> int:
+    """Return the IVF lists probed per query when ``nprobe`` is not given."""
+    return max(1, nlist // IVF_NPROBE_DIVISOR)
+
+
+def _search_params(
+    index: faiss.Index,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+) -> Optional[faiss.SearchParameters]:
+    """Return query-time parameters matching the concrete type of ``index``.
+
+    IVF indexes always get an explicit ``nprobe`` (:func:`default_nprobe`
+    when none is given), so that indexes saved with FAISS's default of one
+    list are searched the same way as new ones.
+    """
+    inner = _inner_index(index)
+    if ef_search is not None and isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    if isinstance(inner, faiss.IndexIVF):
+        if nprobe is None:
+            nprobe = default_nprobe(inner.nlist)
+        return faiss.SearchParametersIVF(nprobe=min(nprobe, inner.nlist))
+    return None
+
+
+def build_index(
+    sources: List[Dict[str, str]],
+    index_file: str = INDEX_FILE,
+    meta_file: str = META_FILE,
+    chunk_size: int = 500,
+    overlap: int = 50,
+    batch_size: int = EMBED_BATCH_SIZE,
+    progress_callback: Optional[ProgressCallback] = None,
+    index_type: str = "flat",
+    index_params: Optional[Dict[str, int]] = None,
+    dedupe: bool = True,
+    encoding: str = "float32",
+    encoding_params: Optional[Dict[str, int]] = None,
+) -> Tuple[faiss.Index, ChunkStore]:
+    """Build a FAISS index from sources and persist it along with metadata.
+
+    All chunk texts are collected first and embedded through
+    :func:`_embed_texts` in batches of ``batch_size``. Vectors are stored in an
+    ID-mapped index so that :func:`update_index` can later add or remove the
+    chunks of individual files. ``index_type`` selects exact search
+    (``"flat"``) or an approximate ``"hnsw"`` or ``"ivf"`` index; missing
+    ``index_params`` are taken from :data:`DEFAULT_INDEX_PARAMS`.
+
+    ``encoding`` compresses the stored vectors: ``"fp16"`` and ``"sq8"``
+    scalar-quantize every dimension to 2 bytes or 1 byte and ``"pq"``
+    product-quantizes a vector into ``m`` codes (see
+    :data:`DEFAULT_ENCODING_PARAMS`). The effective encoding and its bytes
+    per vector are recorded in the meta header; pass ``rerank`` to
+    :func:`search_index_batch` to recover the precision lost.
+
+    With ``dedupe``, exact and near-duplicate chunks (see :mod:`dedup`) are
+    embedded once: the copies keep their metadata rows, pointing to the
+    original through ``dup_of``, and are reported as citations of its hits.
+    The savings are logged and stored under ``"dedup"`` in the meta header.
+    """
+    spec = _index_spec(index_type, index_params, encoding, encoding_params)
+    texts, records = _collect_chunks(sources, chunk_size, overlap)
+    dedup = Deduplicator() if dedupe else None
+    texts, embedded = _dedupe(dedup, texts, records)
+    if texts:
+        emb_matrix = _embed_texts(texts, batch_size, progress_callback)
+    else:
+        emb_matrix = np.empty((0, embedding_dimension()), dtype="float32")
+    dim = emb_matrix.shape[1]
+    index = _create_index(spec, dim, emb_matrix)
+    if texts:
+        ids = np.fromiter((r["id"] for r in embedded), dtype="int64", count=len(embedded))
+        index.add_with_ids(emb_matrix, ids)
+    metadata = ChunkStore.from_records(records)
+    save_index(
+        index,
+        metadata,
+        index_file,
+        meta_file,
+        sources_hash=_hash_sources(sources),
+        dim=dim,
+        file_hashes=_hash_sources_by_file(sources),
+        index_spec=spec,
+        dedup_stats=_dedup_report(dedup, dim),
+    )
+    return index, metadata
+
+
+def update_index(
+    index: faiss.Index,
+    metadata: ChunkStore,
+    sources: List[Dict[str, str]],
+    stored_file_hashes: Dict[str, str],
+    index_file: str = INDEX_FILE,
+    meta_file: str = META_FILE,
+    chunk_size: int = 500,
+    overlap: int = 50,
+    batch_size: int = EMBED_BATCH_SIZE,
+    progress_callback: Optional[ProgressCallback] = None,
+    index_spec: Optional[Dict[str, Any]] = None,
+    dedupe: bool = True,
+) -> Tuple[faiss.Index, ChunkStore]:
+    """Refresh ``index`` so that it reflects ``sources`` file by file.
+
+    Only files whose content hash differs from ``stored_file_hashes`` (or that
+    are new) are chunked and embedded again; chunks of files that changed or
+    disappeared are removed by id. Unchanged files are left untouched, except
+    for duplicates of removed chunks, which are indexed again. With
+    ``dedupe``, the new chunks are deduplicated among themselves and against
+    the chunks that are kept.
+    """
+    file_hashes = _hash_sources_by_file(sources)
+    changed = {f for f, h in file_hashes.items() if stored_file_hashes.get(f) != h}
+    stale = changed | (set(stored_file_hashes) - set(file_hashes))
+
+    stale_mask = metadata.file_mask(stale)
+    orphans, orphan_texts, orphan_records = _orphan_records(
+        metadata, stale_mask, metadata.next_id
+    )
+    lexical = load_lexical_index(index_file, metadata)
+    removed = metadata.ids[stale_mask | orphans]
+    if stale_mask.any():
+        index.remove_ids(metadata.ids[stale_mask].astype("int64"))
+
+    texts, added = _collect_chunks(
+        [src for src in sources if src["file"] in changed],
+        chunk_size,
+        overlap,
+        start_id=metadata.next_id + len(orphan_records),
+    )
+    added = orphan_records + added
+    dedup = Deduplicator() if dedupe else None
+    _seed_dedup(dedup, metadata, ~(stale_mask | orphans))
+    texts, embedded = _dedupe(dedup, orphan_texts + texts, added)
+    _add_chunks(index, texts, embedded, batch_size, progress_callback)
+    metadata = metadata.drop(stale_mask | orphans).extend(added)
+    save_index(
+        index,
+        metadata,
+        index_file,
+        meta_file,
+        sources_hash=_hash_sources(sources),
+        dim=index.d,
+        file_hashes=file_hashes,
+        index_spec=index_spec,
+        dedup_stats=_dedup_report(dedup, index.d),
+        lexical=BM25Index.merge([lexical, _lexical_part(added)], removed.tolist()),
+    )
     return index, metadata
 
 
+def _write_faiss(index: faiss.Index, index_file: str) -> None:
+    """Write ``index`` next to ``index_file`` and rename it into place."""
+    tmp = index_file + ".tmp"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, index_file)
+
+
 def save_index(
-    index: faiss.IndexFlatL2,
-    metadata: List[Dict[str, str]],
+    index: faiss.Index,
+    metadata: Union[ChunkStore, List[Dict[str, str]]],
     index_file: str = INDEX_FILE,
     meta_file: str = META_FILE,
     *,
     sources_hash: Optional[str] = None,
     dim: Optional[int] = None,
+    file_hashes: Optional[Dict[str, str]] = None,
+    index_spec: Optional[Dict[str, Any]] = None,
+    dedup_stats: Optional[Dict[str, int]] = None,
+    lexical: Optional[BM25Index] = None,
 ) -> None:
-    """Persist index and metadata to disk."""
-    faiss.write_index(index, index_file)
-    meta_payload = {
+    """Persist index and metadata to disk.
+
+    ``meta_file`` receives a small JSON header while the chunk metadata is
+    written in the columnar format of :mod:`meta_store`, and the BM25 index
+    of the chunks goes next to ``index_file`` (see
+    :func:`lexical_index_path`); it is built from ``metadata`` unless an
+    up-to-date ``lexical`` index is passed. ``index_spec`` is
+    the requested index type and parameters; the effective ones (which may
+    differ for small IVF corpora) are stored as well.
+    """
+    _write_faiss(index, index_file)
+    if not isinstance(metadata, ChunkStore):
+        metadata = ChunkStore.from_records(metadata)
+    metadata.save(
+        meta_file, _meta_header(index, sources_hash, dim, file_hashes, index_spec, dedup_stats)
+    )
+    if lexical is None:
+        lexical = build_lexical_index(metadata)
+    lexical.save(lexical_index_path(index_file))
+
+
+def _meta_header(
+    index: faiss.Index,
+    sources_hash: Optional[str],
+    dim: Optional[int],
+    file_hashes: Optional[Dict[str, str]],
+    index_spec: Optional[Dict[str, Any]],
+    dedup_stats: Optional[Dict[str, int]] = None,
+) -> Dict[str, Any]:
+    """Return the JSON header stored in the meta file next to the chunk store."""
+    effective = _describe_index(index)
+    encoding = _describe_encoding(index)
+    header = {
         "dim": dim if dim is not None else index.d,
         "sources_hash": sources_hash,
-        "chunks": metadata,
+        "file_hashes": file_hashes or {},
+        "index_type": effective["type"],
+        "index_params": effective["params"],
+        "index_spec": index_spec or effective,
+        "encoding": encoding,
+        "bytes_per_vector": _code_size(encoding, index.d),
+        "embedding_backend": embedding_backend_id(),
     }
-    with open(meta_file, "w", encoding="utf-8") as f:
-        json.dump(meta_payload, f, ensure_ascii=False)
+    if dedup_stats is not None:
+        header["dedup"] = dedup_stats
+    return header
 
 
-def load_index(
+def lexical_index_path(index_file: str = INDEX_FILE) -> str:
+    """Return where the BM25 index belonging to ``index_file`` is stored."""
+    return os.path.splitext(index_file)[0] + ".bm25.npz"
+
+
+def build_lexical_index(metadata: ChunkStore) -> BM25Index:
+    """Return a BM25 index over the chunks of ``metadata`` that have vectors."""
+    positions = np.flatnonzero(metadata.rows["dup_of"] < 0)
+    return BM25Index.build(
+        (int(metadata.ids[pos]), metadata[int(pos)]["text"]) for pos in positions
+    )
+
+
+def _lexical_part(records: List[Dict[str, Any]]) -> BM25Index:
+    """Return a BM25 index over the ``records`` that have vectors."""
+    return BM25Index.build((r["id"], r["text"]) for r in records if "dup_of" not in r)
+
+
+_LEXICAL: Dict[str, Tuple[Tuple[int, int], BM25Index]] = {}
+
+
+def load_lexical_index(
+    index_file: str = INDEX_FILE, metadata: Optional[ChunkStore] = None
+) -> Optional[BM25Index]:
+    """Return the BM25 index stored next to ``index_file``.
+
+    Loaded indexes are reused until the file changes. A missing index is
+    built from ``metadata`` when given (e.g. for indexes written before BM25
+    support), otherwise ``None`` is returned.
+    """
+    path = lexical_index_path(index_file)
+    if not os.path.exists(path):
+        if metadata is None:
+            return None
+        build_lexical_index(metadata).save(path)
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = _LEXICAL.get(path)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, BM25Index.load(path))
+        _LEXICAL[path] = cached
+    return cached[1]
+
+
+def _load_payload(
     index_file: str = INDEX_FILE,
     meta_file: str = META_FILE,
-) -> Tuple[faiss.IndexFlatL2, List[Dict[str, str]], Optional[int], Optional[str]]:
-    """Load index, metadata and extra info from disk."""
+) -> Tuple[faiss.Index, ChunkStore, Dict[str, Any]]:
+    """Load the index, its chunk store and the meta header.
+
+    Meta files written as a single JSON document (a list of chunks or a dict
+    with a ``chunks`` key) are migrated to the columnar format on load.
+    """
     index = faiss.read_index(index_file)
     with open(meta_file, "r", encoding="utf-8") as f:
-        meta_payload = json.load(f)
-    if isinstance(meta_payload, dict):
-        metadata = meta_payload.get("chunks", [])
-        dim = meta_payload.get("dim")
-        sources_hash = meta_payload.get("sources_hash")
+        header = json.load(f)
+    if not isinstance(header, dict):
+        header = {"chunks": header}
+    if "chunks" in header:
+        metadata = ChunkStore.from_records(header.pop("chunks"))
+        metadata.save(meta_file, header)
     else:
-        metadata = meta_payload
-        dim = None
-        sources_hash = None
-    return index, metadata, dim, sources_hash
+        metadata = ChunkStore.load(meta_file, header)
+    return index, metadata, header
+
 
+def load_index(
+    index_file: str = INDEX_FILE,
+    meta_file: str = META_FILE,
+) -> Tuple[faiss.Index, ChunkStore, Optional[int], Optional[str]]:
+    """Load index, metadata and extra info from disk."""
+    index, metadata, header = _load_payload(index_file, meta_file)
+    return index, metadata, header.get("dim"), header.get("sources_hash")
+
+
+def _same_backend(header: Dict[str, Any]) -> bool:
+    """Return whether the index of ``header`` holds vectors of the current backend.
+
+    Headers written before backends were recorded hold PyTorch vectors.
+    """
+    return header.get("embedding_backend", MODEL_NAME) == embedding_backend_id()
 
+
+def _can_update(index: faiss.Index, header: Dict[str, Any]) -> bool:
+    """Return whether ``index`` supports per-file updates (see :func:`update_index`)."""
+    return (
+        header.get("file_hashes") is not None
+        and isinstance(index, faiss.IndexIDMap2)
+        and not isinstance(_inner_index(index), faiss.IndexHNSW)
+    )
+
+
+@traced("ensure_index")
 def ensure_index(
     sources: List[Dict[str, str]],
     index_file: str = INDEX_FILE,
     meta_file: str = META_FILE,
-) -> Tuple[faiss.IndexFlatL2, List[Dict[str, str]]]:
-    """Load existing index or build a new one from sources."""
-    embed_dim = len(_embed_text(""))
+    batch_size: int = EMBED_BATCH_SIZE,
+    progress_callback: Optional[ProgressCallback] = None,
+    index_type: str = "flat",
+    index_params: Optional[Dict[str, int]] = None,
+    dedupe: bool = True,
+    encoding: str = "float32",
+    encoding_params: Optional[Dict[str, int]] = None,
+) -> Tuple[faiss.Index, ChunkStore]:
+    """Load existing index, refresh it incrementally or build a new one.
+
+    When the stored index is ID-mapped, carries per-file hashes and was built
+    with the requested index type, parameters and encoding, only the files that
+    were added, changed or removed since the last call are processed (see
+    :func:`update_index`). HNSW indexes cannot delete vectors, so they are
+    rebuilt whenever the sources change. Indexes embedded by another backend
+    (see :func:`configure_embedding_backend`) are always rebuilt.
+    """
+    spec = _index_spec(index_type, index_params, encoding, encoding_params)
+    build_kwargs = dict(
+        index_file=index_file,
+        meta_file=meta_file,
+        batch_size=batch_size,
+        progress_callback=progress_callback,
+        index_type=index_type,
+        index_params=index_params,
+        dedupe=dedupe,
+        encoding=encoding,
+        encoding_params=encoding_params,
+    )
+    embed_dim = embedding_dimension()
     current_hash = _hash_sources(sources)
     if os.path.exists(index_file) and os.path.exists(meta_file):
-        index, metadata, stored_dim, stored_hash = load_index(index_file, meta_file)
-        if index.d != embed_dim or stored_hash != current_hash:
-            index, metadata = build_index(sources, index_file=index_file, meta_file=meta_file)
+        index, metadata, meta_payload = _load_payload(index_file, meta_file)
+        stored_hash = meta_payload.get("sources_hash")
+        stored_file_hashes = meta_payload.get("file_hashes")
+        stored_spec = meta_payload.get("index_spec", _index_spec("flat"))
+        incremental = _can_update(index, meta_payload)
+        if index.d != embed_dim or stored_spec != spec or not _same_backend(meta_payload):
+            index, metadata = build_index(sources, **build_kwargs)
+        elif stored_hash != current_hash and not incremental:
+            index, metadata = build_index(sources, **build_kwargs)
+        elif stored_hash != current_hash:
+            index, metadata = update_index(
+                index,
+                metadata,
+                sources,
+                stored_file_hashes,
+                index_file=index_file,
+                meta_file=meta_file,
+                batch_size=batch_size,
+                progress_callback=progress_callback,
+                index_spec=spec,
+                dedupe=dedupe,
+            )
         else:
-            if stored_dim != embed_dim or stored_hash is None:
-                save_index(index, metadata, index_file, meta_file, sources_hash=current_hash, dim=embed_dim)
+            if meta_payload.get("dim") != embed_dim or stored_hash is None:
+                save_index(
+                    index,
+                    metadata,
+                    index_file,
+                    meta_file,
+                    sources_hash=current_hash,
+                    dim=embed_dim,
+                    file_hashes=stored_file_hashes,
+                    index_spec=spec,
+                )
         return index, metadata
-    return build_index(sources, index_file=index_file, meta_file=meta_file)
+    return build_index(sources, **build_kwargs)
+
+
+class _SourcesHasher:
+    """Compute :func:`_hash_sources` and :func:`_hash_sources_by_file` incrementally."""
+
+    def __init__(self):
+        self._all = hashlib.md5(b"[")
+        self._count = 0
+        self._files: Dict[str, Any] = {}
+
+    def update(self, src: Dict[str, str]) -> None:
+        payload = json.dumps(src, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        self._all.update(b", " + payload if self._count else payload)
+        self._count += 1
+        per_file = self._files.get(src["file"])
+        if per_file is None:
+            self._files[src["file"]] = hashlib.md5(b"[" + payload)
+        else:
+            per_file.update(b", " + payload)
+
+    @staticmethod
+    def _close(digest: Any) -> str:
+        digest = digest.copy()
+        digest.update(b"]")
+        return digest.hexdigest()
+
+    def sources_hash(self) -> str:
+        return self._close(self._all)
+
+    def file_hashes(self) -> Dict[str, str]:
+        return {fname: self._close(d) for fname, d in self._files.items()}
+
+
+class _PrefetchError:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+_PREFETCH_DONE = object()
+
+
+def _prefetch(items: Iterable[Any], maxsize: int) -> Iterator[Any]:
+    """Iterate ``items`` in a background thread, at most ``maxsize`` ahead.
+
+    This lets CPU work in the producer (PDF parsing) overlap with the model
+    forward passes of the consumer. Exceptions raised by the producer are
+    re-raised in the consumer.
+    """
+    buffer: "queue.Queue[Any]" = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def _put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce() -> None:
+        try:
+            for item in items:
+                if not _put(item):
+                    return
+            _put(_PREFETCH_DONE)
+        except BaseException as exc:
+            _put(_PrefetchError(exc))
+
+    producer = threading.Thread(target=bind(_produce), daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _PREFETCH_DONE:
+                return
+            if isinstance(item, _PrefetchError):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+
+class _IndexSink:
+    """Receive embedding batches for an index that is created on first use.
+
+    IVF indexes and quantized encodings need training data, so batches are
+    held back until enough vectors have arrived (see :func:`_train_points`)
+    or the stream ends.
+    """
+
+    def __init__(self, spec: Dict[str, Any], index: Optional[faiss.Index] = None):
+        self.spec = spec
+        self.index = index
+        self._held: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._held_count = 0
+
+    def add(self, vectors: np.ndarray, ids: np.ndarray) -> None:
+        if self.index is not None:
+            self.index.add_with_ids(vectors, ids)
+            return
+        self._held.append((vectors, ids))
+        self._held_count += len(ids)
+        if self._held_count >= _train_points(self.spec):
+            self._create()
+
+    def _create(self) -> None:
+        vectors = np.vstack([v for v, _ in self._held])
+        ids = np.concatenate([i for _, i in self._held])
+        self._held.clear()
+        self.index = _create_index(self.spec, vectors.shape[1], vectors)
+        self.index.add_with_ids(vectors, ids)
+
+    def finish(self, dim: int) -> faiss.Index:
+        if self.index is None:
+            if self._held:
+                self._create()
+            else:
+                self.index = _create_index(self.spec, dim, np.empty((0, dim), dtype="float32"))
+        return self.index
+
+
+@traced("ensure_index")
+def ensure_index_streaming(
+    sources: Iterable[Dict[str, str]],
+    index_file: str = INDEX_FILE,
+    meta_file: str = META_FILE,
+    chunk_size: int = 500,
+    overlap: int = 50,
+    batch_size: int = EMBED_BATCH_SIZE,
+    progress_callback: Optional[ProgressCallback] = None,
+    index_type: str = "flat",
+    index_params: Optional[Dict[str, int]] = None,
+    prefetch: int = 256,
+    dedupe: bool = True,
+    encoding: str = "float32",
+    encoding_params: Optional[Dict[str, int]] = None,
+    keep_files: Iterable[str] = (),
+) -> Tuple[faiss.Index, ChunkStore]:
+    """Streaming counterpart of :func:`ensure_index` for lazily produced sources.
+
+    ``sources`` is consumed from a background thread (at most ``prefetch``
+    items ahead) so that producing them overlaps with embedding. Chunks of
+    files missing from the stored index are embedded and added in batches of
+    ``batch_size`` as they arrive, and their texts are written straight to
+    disk, so peak memory depends on the batch size rather than the corpus.
+    Files that are already indexed are held until all their sources have
+    arrived and only re-embedded if their hash changed; files that no longer
+    appear are removed. ``progress_callback`` receives ``(done, seen)``
+    chunk counts because the total is unknown in advance. With ``dedupe``,
+    new chunks are deduplicated among themselves as in :func:`build_index`
+    and against the stored chunks that are kept, and ``encoding`` selects
+    the vector compression as there.
+
+    ``keep_files`` names stored files that are known to be unchanged and are
+    left out of ``sources`` (so they are not even parsed): their chunks and
+    hashes are kept as they are. It raises ``ValueError`` when the stored
+    index cannot be reused, as those files would otherwise be lost.
+    """
+    spec = _index_spec(index_type, index_params, encoding, encoding_params)
+    embed_dim = embedding_dimension()
+    index: Optional[faiss.Index] = None
+    old_store = ChunkStore.from_records([])
+    stored_file_hashes: Dict[str, str] = {}
+    # Postings of the stored chunks and of every flushed batch, merged at the end.
+    lexical_parts: List[BM25Index] = []
+    if os.path.exists(index_file) and os.path.exists(meta_file):
+        loaded, loaded_store, header = _load_payload(index_file, meta_file)
+        reusable = (
+            loaded.d == embed_dim
+            and _same_backend(header)
+            and header.get("index_spec", _index_spec("flat")) == spec
+            and _can_update(loaded, header)
+        )
+        if reusable:
+            index, old_store, stored_file_hashes = loaded, loaded_store, header["file_hashes"]
+            lexical_parts.append(load_lexical_index(index_file, old_store))
+    keep = set(keep_files)
+    if keep and index is None:
+        raise ValueError("keep_files needs a stored index that can be updated")
+
+    sink = _IndexSink(spec, index)
+    writer = ChunkStoreWriter(meta_file)
+    hasher = _SourcesHasher()
+    stale: Set[str] = set()
+    next_id = old_store.next_id
+    dedup = Deduplicator() if dedupe else None
+    seeded = dedup is None
+    first_new_id = next_id
+    texts: List[str] = []
+    ids: List[int] = []
+    records: List[Dict[str, str]] = []
+    # New duplicates of stored chunks, written once it is known whether those stay.
+    borrowed: List[Dict[str, Any]] = []
+    held: List[Dict[str, str]] = []
+    counts = {"done": 0, "seen": 0}
+
+    def _seed(keep: np.ndarray) -> None:
+        nonlocal seeded
+        if not seeded:
+            _seed_dedup(dedup, old_store, keep)
+            seeded = True
+
+    def _flush() -> None:
+        if not records:
+            return
+        if texts:
+            sink.add(_embed_texts(texts, batch_size), np.asarray(ids, dtype="int64"))
+        writer.append(records)
+        lexical_parts.append(_lexical_part(records))
+        counts["done"] += len(records)
+        texts.clear()
+        ids.clear()
+        records.clear()
+        if progress_callback is not None:
+            progress_callback(counts["done"], counts["seen"])
+
+    def _queue_chunks(new_texts: List[str], new_records: List[Dict[str, Any]]) -> None:
+        # Stored chunks are registered on the first new chunk, so that a
+        # refresh without changes does not pay for their signatures.
+        _seed(np.ones(len(old_store), dtype=bool))
+        counts["seen"] += len(new_records)
+        new_texts, embedded = _dedupe(dedup, new_texts, new_records)
+        for record in new_records:
+            if record.get("dup_of", first_new_id) < first_new_id:
+                borrowed.append(record)
+            else:
+                records.append(record)
+        texts.extend(new_texts)
+        ids.extend(r["id"] for r in embedded)
+        # Pending duplicates only cost metadata, but keep them bounded too.
+        if len(texts) >= batch_size or len(records) >= 4 * batch_size:
+            _flush()
+
+    def _queue(batch: List[Dict[str, str]]) -> None:
+        nonlocal next_id
+        new_texts, new_records = _collect_chunks(batch, chunk_size, overlap, start_id=next_id)
+        next_id += len(new_records)
+        _queue_chunks(new_texts, new_records)
+
+    def _settle_held() -> None:
+        if held and _hash_sources(held) != stored_file_hashes[held[0]["file"]]:
+            stale.add(held[0]["file"])
+            _queue(held)
+        held.clear()
+
+    try:
+        for src in _prefetch(sources, prefetch):
+            hasher.update(src)
+            if held and held[0]["file"] != src["file"]:
+                _settle_held()
+            if src["file"] in stored_file_hashes:
+                held.append(src)
+            else:
+                _queue([src])
+        _settle_held()
+        _flush()
+        file_hashes = hasher.file_hashes()
+        sources_hash: Optional[str] = hasher.sources_hash()
+        for fname in sorted(keep - set(file_hashes)):
+            if fname in stored_file_hashes:
+                file_hashes[fname] = stored_file_hashes[fname]
+                # The hash of all sources is unknown without the kept ones.
+                sources_hash = None
+        stale |= set(stored_file_hashes) - set(file_hashes)
+        if index is not None and not stale and not writer.count and not borrowed:
+            writer.abort()
+            return index, old_store
+        stale_mask = old_store.file_mask(stale)
+        gone = set(old_store.ids[stale_mask].tolist())
+        if seeded and dedup is not None:
+            dedup.remove(gone)
+        _seed(~stale_mask)
+        # Duplicates of removed chunks are indexed again, like the orphans.
+        rework = [r for r in borrowed if r["dup_of"] in gone]
+        records.extend(r for r in borrowed if r["dup_of"] not in gone)
+        borrowed.clear()
+        if rework:
+            dedup.remove(r["id"] for r in rework)
+            for record in rework:
+                del record["dup_of"]
+            counts["seen"] -= len(rework)
+        orphans, orphan_texts, orphan_records = _orphan_records(old_store, stale_mask, next_id)
+        _queue_chunks(orphan_texts + [r["text"] for r in rework], orphan_records + rework)
+        records.extend(borrowed)
+        _flush()
+    except BaseException:
+        writer.abort()
+        raise
+
+    if index is not None and stale_mask.any():
+        index.remove_ids(old_store.ids[stale_mask].astype("int64"))
+    writer.append_store(old_store, ~(stale_mask | orphans))
+    index = sink.finish(embed_dim)
+    _write_faiss(index, index_file)
+    metadata = writer.finish(
+        _meta_header(
+            index,
+            sources_hash,
+            embed_dim,
+            file_hashes,
+            spec,
+            _dedup_report(dedup, embed_dim),
+        )
+    )
+    removed = old_store.ids[stale_mask | orphans].tolist()
+    BM25Index.merge(lexical_parts, removed).save(lexical_index_path(index_file))
+    return index, metadata
 
 
 def search_index(
     query: str,
     k: int,
-    index: faiss.IndexFlatL2,
-    metadata: List[Dict[str, str]],
+    index: faiss.Index,
+    metadata: Union[ChunkStore, List[Dict[str, str]]],
+    *,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+    rerank: Optional[int] = None,
 ) -> List[Dict[str, str]]:
-    """Retrieve ``k`` most similar chunks to ``query`` from ``index``."""
-    if index.ntotal == 0:
+    """Retrieve ``k`` most similar chunks to ``query`` from ``index``.
+
+    ``ef_search`` (HNSW) and ``nprobe`` (IVF) trade recall for latency on
+    approximate indexes and are ignored for other index types; IVF indexes
+    probe :func:`default_nprobe` lists when ``nprobe`` is not given. ``rerank`` is
+    described in :func:`search_index_batch`. Only the metadata of the
+    returned hits is materialised. Every hit carries its L2 distance to the
+    query under ``"score"``.
+    """
+    return search_index_batch(
+        [query],
+        k,
+        index,
+        metadata,
+        ef_search=ef_search,
+        nprobe=nprobe,
+        dedupe=False,
+        rerank=rerank,
+    )[0]
+
+
+@traced("search_index")
+def search_index_batch(
+    queries: List[str],
+    k: int,
+    index: faiss.Index,
+    metadata: Union[ChunkStore, List[Dict[str, str]]],
+    *,
+    ef_search: Optional[int] = None,
+    nprobe: Optional[int] = None,
+    dedupe: bool = True,
+    lexical: Optional[BM25Index] = None,
+    rrf_k: int = RRF_K,
+    rerank: Optional[int] = None,
+) -> List[List[Dict[str, Any]]]:
+    """Retrieve the ``k`` nearest chunks for each of ``queries`` at once.
+
+    All queries are embedded in one model call and searched with a single
+    ``index.search`` over the query matrix. The result holds one list per
+    query, ordered by ascending L2 distance (``"score"``). Hits whose chunk
+    was deduplicated at indexing time list every ``(file, page, chunk)`` of
+    the collapsed copies under ``"citations"``. With ``dedupe``,
+    chunks whose text already appeared higher in the same list are skipped
+    and replaced by the next candidates. Use :func:`merge_search_results`
+    to combine the lists.
+
+    Passing a ``lexical`` BM25 index (see :func:`load_lexical_index`) turns
+    on hybrid search: the dense and BM25 rankings of every query are fused
+    with reciprocal-rank fusion, each hit carrying its fused ``"rrf"`` score
+    (higher is better) and, where available, ``"score"`` and ``"bm25"``.
+
+    With ``rerank``, at least that many candidates are fetched from a
+    compressed index and re-ordered by their exact distances (see
+    :func:`_rerank`), so ``"score"`` is exact for them.
+    """
+    if not queries:
         return []
-    emb = np.array([_embed_text(query)], dtype="float32")
-    _, idxs = index.search(emb, k)
-    results: List[Dict[str, str]] = []
-    for i in idxs[0]:
-        if 0 <= i < len(metadata):
-            results.append(metadata[i])
+    if index.ntotal == 0:
+        return [[] for _ in queries]
+    if not isinstance(metadata, ChunkStore):
+        metadata = ChunkStore.from_records(metadata)
+    emb = _embed_texts(list(queries))
+    fetch = min(2 * k, index.ntotal) if dedupe else k
+    if rerank:
+        fetch = max(fetch, min(rerank, index.ntotal))
+    params = _search_params(index, ef_search=ef_search, nprobe=nprobe)
+    with span("faiss_search", queries=len(queries), fetch=fetch):
+        if params is None:
+            dists, idxs = index.search(emb, fetch)
+        else:
+            dists, idxs = index.search(emb, fetch, params=params)
+    if rerank:
+        dists, idxs = _rerank(emb, dists, idxs, metadata, rerank)
+    results: List[List[Dict[str, Any]]] = []
+    for query, row_dists, row_ids in zip(queries, dists, idxs):
+        candidates = [(int(i), {"score": float(d)}) for d, i in zip(row_dists, row_ids) if i >= 0]
+        if lexical is not None:
+            candidates = _fuse_rankings(candidates, lexical.search(query, fetch), rrf_k)
+        hits: List[Dict[str, Any]] = []
+        seen = set()
+        for chunk_id, extra in candidates:
+            if len(hits) == k:
+                break
+            chunk = metadata.find(chunk_id)
+            if chunk is None:
+                continue
+            if dedupe:
+                if chunk["text"] in seen:
+                    continue
+                seen.add(chunk["text"])
+            chunk.update(extra)
+            citations = metadata.citations(chunk_id)
+            if len(citations) > 1:
+                chunk["citations"] = citations
+            hits.append(chunk)
+        results.append(hits)
     return results
+
+
+def _rerank(
+    emb: np.ndarray,
+    dists: np.ndarray,
+    idxs: np.ndarray,
+    metadata: ChunkStore,
+    rerank: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Re-order the first ``rerank`` candidates of every query exactly.
+
+    The full-precision vectors of the candidates come from
+    :func:`_embed_texts`, i.e. from the embedding cache when it is enabled
+    and from the model otherwise; only the candidates are touched, so the
+    compressed index stays the only copy held in memory. Candidates beyond
+    ``rerank`` keep their approximate distances.
+    """
+    rows: Dict[int, int] = {}
+    texts: List[str] = []
+    for chunk_id in idxs[:, :rerank].ravel():
+        chunk_id = int(chunk_id)
+        if chunk_id >= 0 and chunk_id not in rows:
+            chunk = metadata.find(chunk_id)
+            if chunk is not None:
+                rows[chunk_id] = len(texts)
+                texts.append(chunk["text"])
+    if not texts:
+        return dists, idxs
+    vectors = _embed_texts(texts)
+    dists, idxs = dists.copy(), idxs.copy()
+    for q, query in enumerate(emb):
+        top = idxs[q, :rerank]
+        exact = np.full(len(top), np.inf, dtype="float32")
+        known = [j for j, chunk_id in enumerate(top) if int(chunk_id) in rows]
+        diff = vectors[[rows[int(top[j])] for j in known]] - query
+        exact[known] = np.einsum("ij,ij->i", diff, diff)
+        order = np.argsort(exact, kind="stable")
+        idxs[q, : len(top)] = top[order]
+        dists[q, : len(top)] = exact[order]
+    return dists, idxs
+
+
+def _fuse_rankings(
+    dense: List[Tuple[int, Dict[str, float]]],
+    lexical: List[Tuple[int, float]],
+    rrf_k: int,
+) -> List[Tuple[int, Dict[str, float]]]:
+    """Combine dense and BM25 rankings with reciprocal-rank fusion."""
+    fused: Dict[int, Dict[str, float]] = {}
+    for rank, (chunk_id, extra) in enumerate(dense):
+        entry = fused.setdefault(chunk_id, {"rrf": 0.0})
+        entry.update(extra)
+        entry["rrf"] += 1.0 / (rrf_k + rank + 1)
+    for rank, (chunk_id, score) in enumerate(lexical):
+        entry = fused.setdefault(chunk_id, {"rrf": 0.0})
+        entry["bm25"] = score
+        entry["rrf"] += 1.0 / (rrf_k + rank + 1)
+    return sorted(fused.items(), key=lambda item: -item[1]["rrf"])
+
+
+def merge_search_results(results: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Combine per-query hits into one list without repeated chunks.
+
+    A chunk found by several queries is kept once with its best score (the
+    highest ``"rrf"`` of hybrid hits, otherwise the smallest distance); the
+    merged list is ordered best first.
+    """
+
+    def _rank(hit: Dict[str, Any]) -> float:
+        return -hit["rrf"] if "rrf" in hit else hit["score"]
+
+    best: Dict[Any, Dict[str, Any]] = {}
+    for hits in results:
+        for hit in hits:
+            key = hit.get("id", (hit["file"], hit["page"], hit["text"]))
+            if key not in best or _rank(hit) < _rank(best[key]):
+                best[key] = hit
+    return sorted(best.values(), key=_rank)
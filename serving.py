@@ -0,0 +1,224 @@
+"""Bounded job scheduler that coalesces identical requests.
+
+The Gradio handlers do not run the pipeline themselves: they submit it to a
+:class:`Scheduler`, which runs at most ``workers`` jobs at a time and keeps
+at most ``max_queue`` more waiting, rejecting further submissions with
+:class:`QueueFull`. A job submitted under the key of a job that is still
+queued or running is not started again; the caller is attached to the
+existing :class:`Job` and follows the same progress events. Waiting jobs
+know their position in the queue so that the interface can show it.
+
+Jobs run on the scheduler's threads while callers follow them either with
+the blocking :meth:`Job.updates` or, from an event loop, with
+:meth:`Job.aupdates`, which awaits without holding a thread.
+
+Streaming events usually repeat the whole text produced so far, so a job
+does not keep all of them: given a ``stage_of`` function, a new event
+replaces the previous one of the same stage, and only events without a
+stage (``None``, e.g. the final result) are always kept. Followers that
+catch up, or fall behind, receive this compacted history.
+"""
+
+import asyncio
+import threading
+from collections import deque
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+Update = Tuple[List[Any], int]
+StageOf = Callable[[Any], Optional[Hashable]]
+
+
+class QueueFull(RuntimeError):
+    """Raised when a job is submitted while the waiting queue is full."""
+
+
+class Job:
+    """A unit of work whose events can be followed by several callers."""
+
+    def __init__(
+        self, key: str, run: Callable[[], Iterable[Any]], stage_of: Optional[StageOf] = None
+    ):
+        self.key = key
+        self.run = run
+        self.stage_of = stage_of
+        # Compacted events, the sequence number of each and their stages.
+        self.events: List[Any] = []
+        self._seqs: List[int] = []
+        self._stages: List[Optional[Hashable]] = []
+        self.position = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._version = 0
+        self._cond = threading.Condition()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def _publish(self, **changes: Any) -> None:
+        """Apply ``changes`` (and an optional ``event``) and wake every follower."""
+        with self._cond:
+            event = changes.pop("event", None)
+            if event is not None:
+                self._append(event)
+            for name, value in changes.items():
+                setattr(self, name, value)
+            self._version += 1
+            waiters, self._waiters = self._waiters, []
+            self._cond.notify_all()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def _append(self, event: Any) -> None:
+        """Add ``event``, dropping the earlier event of its stage (lock held)."""
+        stage = self.stage_of(event) if self.stage_of is not None else None
+        if stage is not None and stage in self._stages:
+            drop = self._stages.index(stage)
+            for column in (self.events, self._seqs, self._stages):
+                del column[drop]
+        self.events.append(event)
+        self._seqs.append(self._version + 1)
+        self._stages.append(stage)
+
+    def _snapshot(self, cursor: int) -> Tuple[List[Any], int, bool, int]:
+        """Return the events newer than version ``cursor`` and the job state."""
+        with self._cond:
+            start = len(self._seqs)
+            while start and self._seqs[start - 1] > cursor:
+                start -= 1
+            return self.events[start:], self.position, self.done, self._version
+
+    def updates(self, timeout: Optional[float] = None) -> Iterator[Update]:
+        """Yield ``(new_events, queue_position)`` every time the job changes.
+
+        The first update replays the (compacted) events produced so far, so a
+        caller attached to a running job catches up. The iteration ends when
+        the job finishes; check :attr:`error` afterwards.
+        """
+        seen = -1
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._version != seen, timeout)
+            events, position, done, seen = self._snapshot(max(seen, 0))
+            yield events, position
+            if done:
+                return
+
+    async def aupdates(self) -> AsyncIterator[Update]:
+        """Asynchronous counterpart of :meth:`updates` for event loops."""
+        loop = asyncio.get_running_loop()
+        seen = -1
+        while True:
+            with self._cond:
+                if self._version == seen:
+                    future = loop.create_future()
+                    self._waiters.append((loop, future))
+                else:
+                    future = None
+            if future is not None:
+                await future
+            events, position, done, seen = self._snapshot(max(seen, 0))
+            yield events, position
+            if done:
+                return
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class Scheduler:
+    """Run submitted jobs on ``workers`` threads with a bounded waiting queue.
+
+    ``stage_of`` compacts the events of every job (see :class:`Job`).
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 16, stage_of: Optional[StageOf] = None):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.stage_of = stage_of
+        self.coalesced = 0
+        self.rejected = 0
+        self._queue: Deque[Job] = deque()
+        self._active: Dict[str, Job] = {}
+        self._idle = 0
+        self._busy = 0
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Condition()
+
+    def submit(self, key: str, run: Callable[[], Iterable[Any]]) -> Job:
+        """Queue ``run`` (a callable returning an iterable of events) under ``key``.
+
+        Returns the job already queued or running under ``key`` when there is
+        one. Raises :class:`QueueFull` when all workers are busy and
+        ``max_queue`` jobs are already waiting.
+        """
+        with self._lock:
+            job = self._active.get(key)
+            if job is not None:
+                self.coalesced += 1
+                return job
+            if len(self._queue) + 1 - (self.workers - self._busy) > self.max_queue:
+                self.rejected += 1
+                raise QueueFull(f"{self._waiting()} requests are already waiting")
+            job = Job(key, run, self.stage_of)
+            self._active[key] = job
+            self._queue.append(job)
+            job.position = self._waiting()
+            if len(self._threads) < self.workers and len(self._queue) > self._idle:
+                thread = threading.Thread(
+                    target=self._work, name=f"serve-{len(self._threads)}", daemon=True
+                )
+                self._threads.append(thread)
+                thread.start()
+            self._lock.notify()
+        return job
+
+    def _waiting(self) -> int:
+        """Return the queued jobs that no free worker will take (lock held)."""
+        return max(0, len(self._queue) - (self.workers - self._busy))
+
+    def _work(self) -> None:
+        while True:
+            with self._lock:
+                self._idle += 1
+                while not self._queue:
+                    self._lock.wait()
+                self._idle -= 1
+                self._busy += 1
+                job = self._queue.popleft()
+                queued = list(self._queue)
+                free = self.workers - self._busy
+            job._publish(position=0)
+            for number, waiting in enumerate(queued, start=1):
+                waiting._publish(position=max(0, number - free))
+            try:
+                for event in job.run():
+                    job._publish(event=event)
+            except Exception as exc:  # noqa: BLE001 - handed to the job's followers
+                job._publish(error=exc)
+            finally:
+                with self._lock:
+                    self._active.pop(job.key, None)
+                    self._busy -= 1
+                job._publish(done=True)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the running, waiting, coalesced and rejected job counts."""
+        with self._lock:
+            return {
+                "running": self._busy,
+                "waiting": len(self._queue),
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+            }
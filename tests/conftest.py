@@ -0,0 +1,43 @@
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+# The embedding model is never downloaded in tests: rag_faiss only needs the
+# module to exist, and tests install their own model as ``rag_faiss._MODEL``.
+dummy_module = types.ModuleType("sentence_transformers")
+dummy_module.SentenceTransformer = object
+sys.modules.setdefault("sentence_transformers", dummy_module)
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import rag_faiss
+
+
+class RecordingModel:
+    """Embed every text as ``[len(text), 1]`` and record what was encoded."""
+
+    def __init__(self):
+        self.encoded = []
+        self.batches = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        self.batches.append(list(texts))
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype="float32")
+
+
+@pytest.fixture
+def model(monkeypatch):
+    m = RecordingModel()
+    monkeypatch.setattr(rag_faiss, "_MODEL", m)
+    return m
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return {
+        "index_file": str(tmp_path / "faiss.index"),
+        "meta_file": str(tmp_path / "faiss_meta.json"),
+    }
@@ -0,0 +1,122 @@
+import json
+import os
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import batch
+import pirjo_pipeline
+
+
+def _write_jobs(path, jobs):
+    with open(path, "w", encoding="utf-8") as f:
+        for job in jobs:
+            f.write(json.dumps(job) + "\n")
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    calls = []
+
+    def generate(title, objective, summary, paths):
+        calls.append(title)
+        if title == "falla":
+            raise RuntimeError("sin respuesta")
+        files = [os.path.basename(p) for p in paths]
+        return {"introduction": f"intro {title}", "blocks": {}, "files": files}
+
+    monkeypatch.setattr(batch, "generate_introduction", generate)
+    monkeypatch.setattr(batch, "warm_up", lambda index=True: {})
+    return calls
+
+
+def test_results_are_written_and_failures_retried(tmp_path, pipeline):
+    jobs = tmp_path / "jobs.jsonl"
+    out = tmp_path / "out.jsonl"
+    _write_jobs(
+        jobs,
+        [
+            {"id": "a", "title": "uno", "objective": "o", "summary": "s", "pdfs": ["a.pdf"]},
+            {"title": "dos", "objective": "o", "summary": "s", "pdfs": ["b.pdf"]},
+            {"id": "c", "title": "falla", "objective": "o", "summary": "s", "pdfs": ["c.pdf"]},
+            {"id": "d", "title": "", "objective": "o", "summary": "s", "pdfs": []},
+        ],
+    )
+
+    assert batch.run_batch(str(jobs), str(out), workers=2) == {"ok": 2, "error": 2, "skipped": 0}
+    records = {r["id"]: r for r in _read(out)}
+    assert records["a"]["introduction"] == "intro uno"
+    assert records["a"]["files"] == ["a.pdf"]
+    assert records["c"]["error"] == "RuntimeError: sin respuesta"
+    assert "missing fields: title, pdfs" in records["d"]["error"]
+
+    pipeline.clear()
+    assert batch.run_batch(str(jobs), str(out)) == {"ok": 0, "error": 2, "skipped": 2}
+    assert sorted(pipeline) == ["falla"]
+
+
+def test_resume_ignores_a_line_cut_by_a_crash(tmp_path, pipeline):
+    jobs = tmp_path / "jobs.jsonl"
+    out = tmp_path / "out.jsonl"
+    _write_jobs(
+        jobs,
+        [
+            {"id": "a", "title": "uno", "objective": "o", "summary": "s", "pdfs": ["a.pdf"]},
+            {"id": "b", "title": "dos", "objective": "o", "summary": "s", "pdfs": ["b.pdf"]},
+        ],
+    )
+    with open(out, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "a", "status": "ok"}) + "\n")
+        f.write('{"id": "b", "status": "o')
+
+    assert batch.run_batch(str(jobs), str(out)) == {"ok": 1, "error": 0, "skipped": 1}
+    assert pipeline == ["dos"]
+    with open(out, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert json.loads(lines[-1])["id"] == "b"
+
+
+def test_llm_calls_in_flight_are_bounded(monkeypatch):
+    state = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+
+    class SlowClient:
+        def __init__(self):
+            self.chat = types.SimpleNamespace(completions=self)
+
+        def create(self, model, messages, **kwargs):
+            with lock:
+                state["now"] += 1
+                state["peak"] = max(state["peak"], state["now"])
+            time.sleep(0.05)
+            with lock:
+                state["now"] -= 1
+            message = types.SimpleNamespace(content="ok")
+            return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+    monkeypatch.setattr(pirjo_pipeline, "_LLM_SLOTS", None)
+    monkeypatch.setattr(pirjo_pipeline, "_LLM_SLOTS_CONFIGURED", False)
+    pirjo_pipeline.configure_llm_concurrency(2)
+    client = SlowClient()
+    threads = [
+        threading.Thread(
+            target=pirjo_pipeline._call_openai,
+            args=(f"p{i}",),
+            kwargs={"client": client, "use_cache": False},
+        )
+        for i in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state["peak"] == 2
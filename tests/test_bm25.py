@@ -0,0 +1,107 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import rag_faiss
+from bm25 import BM25Index
+
+
+def test_bm25_ranks_rare_terms_first(tmp_path):
+    index = BM25Index.build(
+        [
+            (10, "el modelo de lenguaje"),
+            (11, "el modelo BERT de Devlin"),
+            (12, "el el el modelo"),
+        ]
+    )
+    assert [i for i, _ in index.search("Devlin modelo", 3)] == [11, 10, 12]
+    assert index.search("inexistente", 3) == []
+
+    path = str(tmp_path / "lex.bm25.npz")
+    index.save(path)
+    assert BM25Index.load(path).search("devlin", 1) == index.search("devlin", 1)
+
+
+def test_build_index_persists_lexical_index_next_to_faiss(model, paths):
+    sources = [
+        {"file": "a.pdf", "page": 1, "text": "abcd"},
+        {"file": "b.pdf", "page": 1, "text": "uso de ONNX runtime"},
+        {"file": "c.pdf", "page": 1, "text": "uso de ONNX runtime"},
+    ]
+    index, metadata = rag_faiss.build_index(sources, **paths)
+
+    path = rag_faiss.lexical_index_path(paths["index_file"])
+    assert path.endswith("faiss.bm25.npz") and os.path.exists(path)
+    lexical = rag_faiss.load_lexical_index(paths["index_file"])
+    assert len(lexical) == 2
+
+    dense = rag_faiss.search_index_batch(["ONNX"], 1, index, metadata)[0]
+    hybrid = rag_faiss.search_index_batch(["ONNX"], 1, index, metadata, lexical=lexical)[0]
+    assert dense[0]["text"] == "abcd"
+    assert hybrid[0]["text"] == "uso de ONNX runtime"
+    assert hybrid[0]["bm25"] > 0 and hybrid[0]["rrf"] > 0
+    assert len(hybrid[0]["citations"]) == 2
+
+
+def test_missing_lexical_index_is_built_from_metadata(model, paths):
+    index, metadata = rag_faiss.build_index([{"file": "a.pdf", "page": 1, "text": "hola"}], **paths)
+    os.remove(rag_faiss.lexical_index_path(paths["index_file"]))
+
+    assert rag_faiss.load_lexical_index(paths["index_file"]) is None
+    lexical = rag_faiss.load_lexical_index(paths["index_file"], metadata)
+    assert lexical.search("hola", 1)[0][0] == metadata[0]["id"]
+
+
+def test_bm25_merge_matches_a_full_rebuild():
+    docs = [(i, f"termino{i % 3} comun palabra{i}") for i in range(10)]
+    full = BM25Index.build([d for d in docs if d[0] not in (2, 7)])
+    merged = BM25Index.merge([BM25Index.build(docs[:6]), BM25Index.build(docs[6:])], [2, 7])
+    assert merged.terms == full.terms
+    for query in ("termino1", "comun palabra3", "palabra2"):
+        assert merged.search(query, 10) == full.search(query, 10)
+
+
+def test_saved_terms_are_not_padded_to_the_longest_one(tmp_path):
+    long_token = "https_" + "x" * 2000
+    docs = [(i, f"palabra{i}") for i in range(200)] + [(200, long_token)]
+    index = BM25Index.build(docs)
+    path = str(tmp_path / "lex.bm25.npz")
+    index.save(path)
+
+    assert os.path.getsize(path) < 40_000
+    loaded = BM25Index.load(path)
+    assert loaded.terms == index.terms
+    assert loaded.search(long_token, 1) == [(200, index.search(long_token, 1)[0][1])]
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_updates_merge_postings_instead_of_rebuilding(model, paths, monkeypatch, streaming):
+    ensure = rag_faiss.ensure_index_streaming if streaming else rag_faiss.ensure_index
+    ensure(
+        [
+            {"file": "a.pdf", "page": 1, "text": "modelo de lenguaje"},
+            {"file": "b.pdf", "page": 1, "text": "redes neuronales"},
+        ],
+        **paths,
+    )
+
+    build = rag_faiss.build_lexical_index
+
+    def rebuild(metadata):
+        raise AssertionError("the lexical index was rebuilt from scratch")
+
+    monkeypatch.setattr(rag_faiss, "build_lexical_index", rebuild)
+    index, metadata = ensure(
+        [
+            {"file": "a.pdf", "page": 1, "text": "modelo de lenguaje"},
+            {"file": "c.pdf", "page": 1, "text": "bosques aleatorios"},
+        ],
+        **paths,
+    )
+    lexical = rag_faiss.load_lexical_index(paths["index_file"])
+    expected = build(metadata)
+    assert lexical.search("redes", 5) == []
+    for query in ("modelo", "bosques aleatorios"):
+        assert lexical.search(query, 5) == expected.search(query, 5)
@@ -0,0 +1,74 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+from context_packer import pack_context, render_context
+
+
+def _count(texts):
+    # Two tokens per citation header, one per word otherwise.
+    return [2 if t.startswith("[") else len(t.split()) for t in texts]
+
+
+def _chunk(file, page, chunk, tokens, **extra):
+    return dict(file=file, page=page, chunk=chunk, text=f"t{file}{page}{chunk}", tokens=tokens, **extra)
+
+
+def test_large_chunk_does_not_block_smaller_relevant_ones():
+    chunks = [
+        _chunk("a.pdf", 1, 0, 90, rrf=0.030),
+        _chunk("b.pdf", 1, 0, 40, rrf=0.029),
+        _chunk("c.pdf", 1, 0, 40, rrf=0.028),
+    ]
+    fragments, report = pack_context(chunks, 100, _count)
+
+    assert [f["label"] for f in fragments] == ["[b.pdf:1:0]", "[c.pdf:1:0]"]
+    assert report["used"] == 2 * (40 + 2 + 1)
+    assert report["available"] == 100 - report["used"]
+    assert report["selected"] == 2 and report["candidates"] == 3
+
+
+def test_single_valuable_chunk_beats_weak_filler():
+    chunks = [
+        _chunk("a.pdf", 1, 0, 90, rrf=1.0),
+        _chunk("b.pdf", 1, 0, 10, rrf=0.01),
+    ]
+    fragments, _ = pack_context(chunks, 100, _count)
+    assert [f["label"] for f in fragments] == ["[a.pdf:1:0]"]
+
+
+def test_adjacent_chunks_of_a_page_share_one_header():
+    chunks = [
+        _chunk("a.pdf", 3, 2, 10, score=0.1),
+        _chunk("a.pdf", 3, 1, 10, score=0.2),
+        _chunk("a.pdf", 4, 3, 10, score=0.3),
+    ]
+    fragments, report = pack_context(chunks, 100, _count)
+
+    assert fragments[0]["label"] == "[a.pdf:3:1]"
+    assert fragments[0]["text"] == "ta.pdf31\nta.pdf32"
+    assert report["merged"] == 1
+    assert report["used"] == (10 + 2 + 1) + (10 + 1) + (10 + 2 + 1)
+    assert render_context(fragments).startswith("[a.pdf:3:1]\nta.pdf31\nta.pdf32\n\n")
+
+
+def test_header_savings_make_room_for_another_chunk():
+    chunks = [
+        _chunk("a.pdf", 1, 0, 10, rrf=0.03),
+        _chunk("a.pdf", 1, 1, 10, rrf=0.03),
+        _chunk("b.pdf", 1, 0, 11, rrf=0.01),
+    ]
+    # 13 + 13 + 14 exceed 38; merging the first two saves a 2-token header.
+    fragments, report = pack_context(chunks, 38, _count)
+    assert report["selected"] == 3 and report["merged"] == 1
+    assert report["used"] == 38
+
+
+def test_candidates_sharing_file_page_and_chunk_are_all_kept():
+    chunks = [
+        dict(file="a.pdf", page=1, chunk=0, text="primero", tokens=5, rrf=0.03),
+        dict(file="a.pdf", page=1, chunk=0, text="segundo", tokens=5, rrf=0.02),
+    ]
+    fragments, report = pack_context(chunks, 100, _count)
+    assert report["selected"] == 2 and report["merged"] == 0
+    assert [f["text"] for f in fragments] == ["primero", "segundo"]
@@ -0,0 +1,106 @@
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import rag_faiss
+from dedup import Deduplicator
+
+PARAGRAPH = (
+    "Los modelos de lenguaje permiten resumir artículos científicos y extraer hallazgos "
+    "relevantes para la revisión de literatura en ciencias de la educación durante el "
+    "periodo comprendido entre los años dos mil diez y dos mil veinte en América Latina"
+)
+
+
+def test_deduplicator_finds_exact_and_near_copies():
+    dedup = Deduplicator()
+    assert dedup.add(0, PARAGRAPH) is None
+    assert dedup.add(1, "  " + PARAGRAPH.upper()) == 0
+    assert dedup.add(2, PARAGRAPH.replace("América Latina", "América del Sur")) == 0
+    assert dedup.add(3, "Un texto completamente distinto sobre redes neuronales profundas") is None
+    stats = dedup.stats(dim=384)
+    assert stats["exact_duplicates"] == 1 and stats["near_duplicates"] == 1
+    assert stats["embeddings_saved"] == 2 and stats["bytes_saved"] == 2 * 384 * 4
+
+
+def test_build_index_embeds_duplicates_once_and_keeps_citations(model, paths):
+    sources = [
+        {"file": "a.pdf", "page": 1, "text": PARAGRAPH},
+        {"file": "copia.pdf", "page": 4, "text": PARAGRAPH},
+        {"file": "b.pdf", "page": 2, "text": "otro contenido"},
+    ]
+    index, metadata = rag_faiss.build_index(sources, **paths)
+
+    assert model.encoded.count(PARAGRAPH) == 1
+    assert index.ntotal == 2 and len(metadata) == 3
+    hit = rag_faiss.search_index(PARAGRAPH, 1, index, metadata)[0]
+    assert [(c["file"], c["page"]) for c in hit["citations"]] == [("a.pdf", 1), ("copia.pdf", 4)]
+    with open(paths["meta_file"], encoding="utf-8") as f:
+        assert json.load(f)["dedup"]["embeddings_saved"] == 1
+
+
+def test_removing_the_original_reindexes_its_copy(model, paths):
+    sources = [
+        {"file": "a.pdf", "page": 1, "text": PARAGRAPH},
+        {"file": "copia.pdf", "page": 4, "text": PARAGRAPH},
+    ]
+    rag_faiss.ensure_index(sources, **paths)
+    index, metadata = rag_faiss.ensure_index(sources[1:], **paths)
+
+    assert index.ntotal == 1
+    assert [m["file"] for m in metadata] == ["copia.pdf"]
+    assert rag_faiss.search_index(PARAGRAPH, 1, index, metadata)[0]["file"] == "copia.pdf"
+
+
+def test_streaming_deduplicates_and_handles_orphans(model, paths):
+    sources = [
+        {"file": "a.pdf", "page": 1, "text": PARAGRAPH},
+        {"file": "copia.pdf", "page": 4, "text": PARAGRAPH},
+    ]
+    index, metadata = rag_faiss.ensure_index_streaming(iter(sources), batch_size=1, **paths)
+    assert index.ntotal == 1 and len(metadata) == 2
+
+    index, metadata = rag_faiss.ensure_index_streaming(iter(sources[1:]), **paths)
+    assert index.ntotal == 1
+    assert "dup_of" not in metadata[0]
+    assert rag_faiss.search_index(PARAGRAPH, 1, index, metadata)[0]["file"] == "copia.pdf"
+
+
+def test_seeded_texts_are_matched_but_not_counted():
+    dedup = Deduplicator()
+    dedup.seed(0, PARAGRAPH)
+    assert dedup.add(1, PARAGRAPH.replace("América Latina", "América del Sur")) == 0
+    dedup.remove([0, 1])
+    assert dedup.add(2, PARAGRAPH) is None
+    assert dedup.stats()["unique"] == 1 and dedup.stats()["near_duplicates"] == 0
+
+
+def test_copy_arriving_in_an_update_reuses_the_stored_vector(model, paths, tmp_path):
+    original = {"file": "a.pdf", "page": 1, "text": PARAGRAPH}
+    copy = {"file": "renombrado.pdf", "page": 3, "text": PARAGRAPH}
+    rag_faiss.ensure_index([original], **paths)
+    index, metadata = rag_faiss.ensure_index([original, copy], **paths)
+    assert model.encoded.count(PARAGRAPH) == 1 and index.ntotal == 1
+    hit = rag_faiss.search_index(PARAGRAPH, 1, index, metadata)[0]
+    assert [c["file"] for c in hit["citations"]] == ["a.pdf", "renombrado.pdf"]
+
+    (tmp_path / "stream").mkdir()
+    streamed = {k: str(tmp_path / "stream" / os.path.basename(v)) for k, v in paths.items()}
+    rag_faiss.ensure_index_streaming(iter([original]), **streamed)
+    model.encoded.clear()
+    index, metadata = rag_faiss.ensure_index_streaming(iter([copy, original]), **streamed)
+    assert PARAGRAPH not in model.encoded and index.ntotal == 1
+    assert metadata[1]["dup_of"] == metadata[0]["id"]
+
+
+def test_streamed_copy_of_a_changed_file_is_indexed_again(model, paths):
+    rag_faiss.ensure_index_streaming(iter([{"file": "a.pdf", "page": 1, "text": PARAGRAPH}]), **paths)
+    sources = [
+        {"file": "copia.pdf", "page": 2, "text": PARAGRAPH},
+        {"file": "a.pdf", "page": 1, "text": "otro contenido"},
+    ]
+    index, metadata = rag_faiss.ensure_index_streaming(iter(sources), **paths)
+
+    assert index.ntotal == 2 and all("dup_of" not in m for m in metadata)
+    assert rag_faiss.search_index(PARAGRAPH, 1, index, metadata)[0]["file"] == "copia.pdf"
@@ -0,0 +1,105 @@
+import json
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import embedding_backends
+import rag_faiss
+
+
+class HashModel:
+    def __init__(self, backend_id):
+        self.id = backend_id
+        self.dimension = 4
+
+    def encode(self, texts, **kwargs):
+        return np.stack(
+            [np.random.default_rng(zlib.crc32(t.encode())).random(4) for t in texts]
+        ).astype("float32")
+
+
+@pytest.fixture(autouse=True)
+def reset_backend(monkeypatch):
+    monkeypatch.setattr(rag_faiss, "_BACKEND", None)
+    monkeypatch.setattr(rag_faiss, "_MODEL", None)
+    monkeypatch.setattr(rag_faiss, "_CACHE", None)
+    monkeypatch.setattr(rag_faiss, "_CACHE_CONFIGURED", True)
+    monkeypatch.delenv("EMBEDDING_BACKEND", raising=False)
+
+
+def test_backend_ids_keep_torch_compatible():
+    assert embedding_backends.backend_id("m", "torch") == "m"
+    assert embedding_backends.backend_id("m", "int8") == "m@int8"
+    with pytest.raises(ValueError):
+        embedding_backends.backend_id("m", "tensorrt")
+
+
+def test_dimension_is_reported_without_encoding(monkeypatch):
+    class Model:
+        def __init__(self, name, **kwargs):
+            self.kwargs = kwargs
+
+        def get_sentence_embedding_dimension(self):
+            return 384
+
+        def encode(self, *args, **kwargs):
+            raise AssertionError("encode should not be called")
+
+    monkeypatch.setattr(embedding_backends, "SentenceTransformer", Model)
+    rag_faiss.configure_embedding_backend("torch")
+    assert rag_faiss.embedding_dimension() == 384
+
+
+def test_onnx_backend_explains_missing_runtime(monkeypatch):
+    def missing(name, **kwargs):
+        assert kwargs == {"backend": "onnx"}
+        raise ImportError("onnxruntime")
+
+    monkeypatch.setattr(embedding_backends, "_sentence_transformer", missing)
+    with pytest.raises(RuntimeError, match="sentence-transformers\\[onnx\\]"):
+        embedding_backends.create_backend("onnx", "m")
+
+
+def test_int8_backend_quantizes_linear_layers(monkeypatch):
+    torch = pytest.importorskip("torch")
+
+    class Tiny(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.linear = torch.nn.Linear(8, 3)
+
+        def encode(self, texts, **kwargs):
+            with torch.no_grad():
+                return self.linear(torch.ones(len(texts), 8)).numpy()
+
+    monkeypatch.setattr(embedding_backends, "_sentence_transformer", lambda name, **kw: Tiny())
+    backend = embedding_backends.create_backend("int8", "m")
+    assert backend.id == "m@int8"
+    assert "quantized" in type(backend.model.linear).__module__
+    assert backend.encode(["a", "b"]).shape == (2, 3)
+
+
+def test_environment_selects_the_backend(monkeypatch, tmp_path):
+    monkeypatch.setenv("EMBEDDING_BACKEND", "onnx")
+    assert rag_faiss.embedding_backend_id() == f"{rag_faiss.MODEL_NAME}@onnx"
+    cache = rag_faiss.configure_embedding_cache(str(tmp_path))
+    rag_faiss.configure_embedding_backend("torch")
+    assert rag_faiss._CACHE.directory != cache.directory
+
+
+def test_indexes_of_other_backends_are_rebuilt(tmp_path):
+    paths = {
+        "index_file": str(tmp_path / "faiss.index"),
+        "meta_file": str(tmp_path / "faiss_meta.json"),
+    }
+    sources = [{"file": "a.pdf", "page": i, "text": f"texto {i}"} for i in range(5)]
+    rag_faiss._MODEL = HashModel("m@onnx")
+    rag_faiss.ensure_index(sources, **paths)
+    rag_faiss._MODEL = HashModel("m@int8")
+    rag_faiss.ensure_index(sources, **paths)
+    with open(paths["meta_file"], encoding="utf-8") as f:
+        assert json.load(f)["embedding_backend"] == "m@int8"
@@ -0,0 +1,105 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import rag_faiss
+from embedding_cache import EmbeddingCache
+
+
+def _vectors(*values):
+    return np.array([[v, v, v, v] for v in values], dtype="float32")
+
+
+def test_cache_persists_vectors_across_instances(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "modelo")
+    cache.store(["a", "b"], _vectors(1.0, 2.0))
+    cache.close()
+
+    reopened = EmbeddingCache(str(tmp_path), "modelo")
+    hits, matrix, misses = reopened.lookup(["b", "c", "a"])
+
+    assert hits == [0, 2]
+    assert misses == [1]
+    assert matrix[:, 0].tolist() == [2.0, 1.0]
+    assert reopened.stats()["hits"] == 2
+    assert reopened.stats()["misses"] == 1
+
+
+def test_cache_is_keyed_by_model(tmp_path):
+    EmbeddingCache(str(tmp_path), "modelo-a").store(["a"], _vectors(1.0))
+    hits, matrix, misses = EmbeddingCache(str(tmp_path), "modelo-b").lookup(["a"])
+    assert hits == [] and matrix is None and misses == [0]
+
+
+def test_cache_evicts_least_recently_used_under_byte_budget(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "modelo", max_bytes=2 * 4 * 4)
+    cache.store(["a", "b"], _vectors(1.0, 2.0))
+    cache.lookup(["a"])
+    cache.store(["c"], _vectors(3.0))
+
+    hits, _, misses = cache.lookup(["a", "b", "c"])
+    assert hits == [0, 2]
+    assert misses == [1]
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_key_index_is_written_every_few_batches(monkeypatch, tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "modelo", flush_every=3)
+    writes = []
+    save = np.save
+    monkeypatch.setattr(np, "save", lambda f, arr: writes.append(len(arr)) or save(f, arr))
+
+    cache.store(["a"], _vectors(1.0))  # grows the store, which writes the index once
+    writes.clear()
+    cache.store(["b"], _vectors(2.0))
+    cache.store(["c"], _vectors(3.0))
+    assert writes == [1024, 1024]  # keys and ticks on the third batch
+    cache.store(["d"], _vectors(4.0))
+    assert len(writes) == 2
+    cache.close()
+    assert len(writes) == 4
+
+    hits, matrix, _ = EmbeddingCache(str(tmp_path), "modelo").lookup(["a", "b", "c", "d"])
+    assert hits == [0, 1, 2, 3] and matrix[:, 0].tolist() == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_instances_sharing_a_directory_never_mix_vectors(tmp_path):
+    first = EmbeddingCache(str(tmp_path), "modelo", max_bytes=2 * 4 * 4)
+    second = EmbeddingCache(str(tmp_path), "modelo", max_bytes=2 * 4 * 4)
+    first.store(["a"], _vectors(1.0))
+    # ``a`` was never written to the index, so ``second`` may take its slot.
+    second.store(["b", "c"], _vectors(2.0, 3.0))
+    assert first.lookup(["a", "b", "c"])[2] == [0, 1, 2]
+
+    second.flush()
+    hits, matrix, misses = first.lookup(["a", "b", "c"])
+    assert misses == [0] and matrix[:, 0].tolist() == [2.0, 3.0]
+    first.store(["d"], _vectors(4.0))  # evicts ``b``
+    first.close()
+    hits, matrix, _ = second.lookup(["b", "c", "d"])
+    assert hits == [1, 2] and matrix[:, 0].tolist() == [3.0, 4.0]
+
+
+def test_embed_texts_reads_from_cache(monkeypatch, tmp_path):
+    encoded = []
+
+    class Model:
+        def encode(self, texts, **kwargs):
+            encoded.extend(texts)
+            return _vectors(*[float(len(t)) for t in texts])
+
+    monkeypatch.setattr(rag_faiss, "_MODEL", Model())
+    monkeypatch.setattr(rag_faiss, "_CACHE", None)
+    monkeypatch.setattr(rag_faiss, "_CACHE_CONFIGURED", False)
+    rag_faiss.configure_embedding_cache(str(tmp_path))
+
+    first = rag_faiss._embed_texts(["uno", "dos"])
+    second = rag_faiss._embed_texts(["dos", "tres", "uno"])
+
+    assert encoded == ["uno", "dos", "tres"]
+    assert np.array_equal(second[[0, 2]], first[[1, 0]])
+    stats = rag_faiss.embedding_cache_stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 3
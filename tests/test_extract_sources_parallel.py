@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+
+import pytest
+from fpdf import FPDF
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import pirjo_pipeline
+
+
+def _make_pdf(path, pages, author="Autora"):
+    pdf = FPDF()
+    pdf.set_author(author)
+    pdf.set_font("Helvetica", size=12)
+    for n in range(1, pages + 1):
+        pdf.add_page()
+        pdf.cell(0, 10, f"{os.path.basename(path)} pagina {n}")
+    pdf.output(str(path))
+    return str(path)
+
+
+def _simple_chunk_pages(texts):
+    return [([t], [len(t.split())]) if t else ([], []) for t in texts]
+
+
+_original_pages_task = pirjo_pipeline._pdf_pages_task
+
+
+def _simple_pages_task(path, start, stop):
+    # Workers are spawned, so the patched chunker is installed in each of them.
+    pirjo_pipeline.chunk_pages = _simple_chunk_pages
+    return _original_pages_task(path, start, stop)
+
+
+@pytest.fixture(autouse=True)
+def simple_chunks(monkeypatch):
+    monkeypatch.setattr(pirjo_pipeline, "chunk_pages", _simple_chunk_pages)
+    monkeypatch.setattr(pirjo_pipeline, "_pdf_pages_task", _simple_pages_task)
+    monkeypatch.setattr(pirjo_pipeline, "PAGES_PER_TASK", 2)
+
+
+def test_parallel_extraction_matches_sequential(tmp_path):
+    files = [
+        _make_pdf(tmp_path / "a.pdf", 5),
+        _make_pdf(tmp_path / "b.pdf", 1, author="Autor B"),
+        _make_pdf(tmp_path / "c.pdf", 3),
+    ]
+    sequential = pirjo_pipeline.extract_sources(files, workers=1)
+    parallel = pirjo_pipeline.extract_sources(files, workers=3, timeout=30)
+
+    assert parallel == sequential
+    sources, metadata = parallel
+    assert [(s["file"], s["page"]) for s in sources][:3] == [
+        ("a.pdf", 1),
+        ("a.pdf", 2),
+        ("a.pdf", 3),
+    ]
+    assert metadata["b.pdf"]["author"] == "Autor B"
+
+
+def _slow_pages_task(path, start, stop):
+    # Module-level so the process pool can pickle it by name.
+    if path.endswith("lento.pdf"):
+        time.sleep(30)
+    return _simple_pages_task(path, start, stop)
+
+
+def test_slow_file_is_skipped_after_timeout(tmp_path, monkeypatch):
+    files = [_make_pdf(tmp_path / "ok.pdf", 2), _make_pdf(tmp_path / "lento.pdf", 2)]
+    monkeypatch.setattr(pirjo_pipeline, "_pdf_pages_task", _slow_pages_task)
+    start = time.monotonic()
+    sources, metadata = pirjo_pipeline.extract_sources(files, workers=2, timeout=1)
+
+    assert time.monotonic() - start < 10
+    assert {s["file"] for s in sources} == {"ok.pdf"}
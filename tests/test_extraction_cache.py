@@ -0,0 +1,77 @@
+import os
+import shutil
+import sys
+
+import pytest
+from fpdf import FPDF
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import pirjo_pipeline
+from extraction_cache import ExtractionCache
+
+
+def _make_pdf(path, pages=2):
+    pdf = FPDF()
+    pdf.set_author("Autora")
+    pdf.set_font("Helvetica", size=12)
+    for n in range(1, pages + 1):
+        pdf.add_page()
+        pdf.cell(0, 10, f"contenido pagina {n}")
+    pdf.output(str(path))
+    return str(path)
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        pirjo_pipeline,
+        "chunk_pages",
+        lambda texts: [([t], [len(t.split())]) if t else ([], []) for t in texts],
+    )
+    monkeypatch.setattr(pirjo_pipeline, "_EXTRACTION_CACHE", None)
+    monkeypatch.setattr(pirjo_pipeline, "_EXTRACTION_CACHE_CONFIGURED", False)
+    return pirjo_pipeline.configure_extraction_cache(str(tmp_path / "cache"))
+
+
+def test_reupload_under_new_name_skips_parsing(cache, tmp_path, monkeypatch):
+    first = _make_pdf(tmp_path / "subida1.pdf")
+    sources, metadata = pirjo_pipeline.extract_sources([first])
+
+    second = str(tmp_path / "subida2.pdf")
+    shutil.copy(first, second)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("PDF should not be parsed again")
+
+    monkeypatch.setattr(pirjo_pipeline, "PdfReader", fail)
+    cached_sources, cached_metadata = pirjo_pipeline.extract_sources([second])
+
+    assert [s["text"] for s in cached_sources] == [s["text"] for s in sources]
+    assert {s["file"] for s in cached_sources} == {"subida2.pdf"}
+    assert cached_metadata["subida2.pdf"]["title"] == "subida2"
+    assert cached_metadata["subida2.pdf"]["author"] == "Autora"
+    assert cache.stats()["hits"] == 1
+
+
+def test_changed_chunking_parameters_invalidate_entries(tmp_path):
+    store = ExtractionCache(str(tmp_path), {"chunk_size": 700})
+    store.put("abc", {"author": "", "title": None, "year": ""}, [(1, "t", ["t"], [1])])
+    assert store.get("abc") is not None
+
+    changed = ExtractionCache(str(tmp_path), {"chunk_size": 500})
+    assert changed.get("abc") is None
+    assert changed.stats()["entries"] == 0
+
+
+def test_size_cap_evicts_least_recently_used(tmp_path):
+    store = ExtractionCache(str(tmp_path), {}, max_bytes=10_000)
+    info = {"author": "", "title": None, "year": ""}
+    for n in range(5):
+        text = os.urandom(2_000).hex()
+        store.put(f"doc{n}", info, [(1, text, [text], [1])])
+        os.utime(store._path(f"doc{n}"), (n, n))
+
+    stats = store.stats()
+    assert stats["bytes"] <= 10_000
+    assert store.get("doc4") is not None
+    assert store.get("doc0") is None
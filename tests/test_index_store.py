@@ -0,0 +1,192 @@
+import os
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+import pytest
+from fpdf import FPDF
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import pirjo_pipeline
+import rag_faiss
+from index_store import IndexStore, corpus_key
+
+
+def _make_pdf(path, text):
+    pdf = FPDF()
+    pdf.set_author("Autora")
+    pdf.set_font("Helvetica", size=12)
+    pdf.add_page()
+    pdf.cell(0, 10, text)
+    pdf.output(str(path))
+    return str(path)
+
+
+def test_concurrent_requests_build_a_corpus_once(tmp_path):
+    store = IndexStore(str(tmp_path / "store"))
+    builds = []
+
+    def build(directory):
+        builds.append(directory)
+        time.sleep(0.2)
+        with open(os.path.join(directory, "data"), "w") as f:
+            f.write("x")
+        return "built"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(store.get("k", build, lambda d: "loaded")))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(builds) == 1
+    assert results == ["built"] * 4
+    assert store.stats()["hits"] == 3
+
+
+def test_lru_evicts_and_disk_copies_are_reloaded(tmp_path):
+    root = str(tmp_path / "store")
+    store = IndexStore(root, max_loaded=1)
+    store.get("a", lambda d: "A", lambda d: "A from disk")
+    store.get("b", lambda d: "B", lambda d: "B from disk")
+    assert store.get("a", lambda d: "again", lambda d: "A from disk") == "A from disk"
+
+    fresh = IndexStore(root)
+    assert fresh.get("b", lambda d: "again", lambda d: "B from disk") == "B from disk"
+    assert fresh.stats()["builds"] == 0
+
+
+def test_interrupted_build_is_restarted_from_scratch(tmp_path):
+    store = IndexStore(str(tmp_path / "store"))
+
+    def failing(directory):
+        open(os.path.join(directory, "partial"), "w").close()
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        store.get("k", failing, lambda d: "loaded")
+    seen = []
+    store.get("k", lambda d: seen.extend(os.listdir(d)) or "built", lambda d: "loaded")
+    assert "partial" not in seen
+
+
+def test_load_corpus_uses_one_directory_per_corpus(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        rag_faiss,
+        "_MODEL",
+        types.SimpleNamespace(
+            encode=lambda texts, **kw: np.array([[len(t), 1.0] for t in texts], dtype="float32")
+        ),
+    )
+    monkeypatch.setattr(
+        pirjo_pipeline,
+        "chunk_pages",
+        lambda texts: [([t], [len(t.split())]) if t else ([], []) for t in texts],
+    )
+    monkeypatch.setattr(pirjo_pipeline, "_EXTRACTION_CACHE", None)
+    monkeypatch.setattr(pirjo_pipeline, "_EXTRACTION_CACHE_CONFIGURED", True)
+    store = pirjo_pipeline.configure_index_store(str(tmp_path / "store"))
+    monkeypatch.setattr(pirjo_pipeline, "_INDEX_STORE", store)
+
+    first = [_make_pdf(tmp_path / "a.pdf", "primer documento")]
+    second = [_make_pdf(tmp_path / "b.pdf", "segundo documento")]
+    index, chunks, info, lexical = pirjo_pipeline.load_corpus(first)
+    assert index.ntotal == 1 and info["a.pdf"]["author"] == "Autora"
+    assert lexical.search("primer", 1)[0][0] == chunks[0]["id"]
+
+    pirjo_pipeline.load_corpus(second)
+    assert pirjo_pipeline.load_corpus(first)[0] is index
+    corpora = [name for name in os.listdir(store.root) if not name.startswith(".")]
+    assert sorted(corpora) == sorted([corpus_key(first), corpus_key(second)])
+    assert store.last_used() == corpus_key(first)
+    assert store.stats()["builds"] == 2 and store.stats()["hits"] == 1
+
+
+def test_new_corpus_is_seeded_from_the_closest_stored_one(monkeypatch, tmp_path):
+    encoded = []
+
+    def encode(texts, **kw):
+        encoded.extend(texts)
+        return np.array([[len(t), 1.0] for t in texts], dtype="float32")
+
+    monkeypatch.setattr(rag_faiss, "_MODEL", types.SimpleNamespace(encode=encode))
+    monkeypatch.setattr(
+        pirjo_pipeline,
+        "chunk_pages",
+        lambda texts: [([t], [len(t.split())]) if t else ([], []) for t in texts],
+    )
+    monkeypatch.setattr(pirjo_pipeline, "_EXTRACTION_CACHE", None)
+    monkeypatch.setattr(pirjo_pipeline, "_EXTRACTION_CACHE_CONFIGURED", True)
+    store = pirjo_pipeline.configure_index_store(str(tmp_path / "store"))
+    monkeypatch.setattr(pirjo_pipeline, "_INDEX_STORE", store)
+
+    a = _make_pdf(tmp_path / "a.pdf", "primer documento")
+    b = _make_pdf(tmp_path / "b.pdf", "segundo documento")
+    pirjo_pipeline.load_corpus([a])
+    encoded.clear()
+    index, chunks, info, lexical = pirjo_pipeline.load_corpus([a, b])
+
+    # The empty text probes the embedding dimension.
+    assert [t for t in encoded if t] == ["segundo documento"]
+    assert index.ntotal == 2 and sorted(c["file"] for c in chunks) == ["a.pdf", "b.pdf"]
+    assert set(info) == {"a.pdf", "b.pdf"}
+    assert store.stats()["seeded"] == 1
+
+
+def test_growing_corpus_only_parses_and_embeds_new_files(monkeypatch, model, tmp_path):
+    monkeypatch.setattr(
+        pirjo_pipeline,
+        "chunk_pages",
+        lambda texts: [(t.split(), [1] * len(t.split())) for t in texts],
+    )
+    monkeypatch.setattr(pirjo_pipeline, "_EXTRACTION_CACHE", None)
+    monkeypatch.setattr(pirjo_pipeline, "_EXTRACTION_CACHE_CONFIGURED", True)
+    parsed = []
+    iter_extracted = pirjo_pipeline._iter_extracted
+
+    def recording(files, *args):
+        parsed.extend(os.path.basename(f) for f in files)
+        return iter_extracted(files, *args)
+
+    monkeypatch.setattr(pirjo_pipeline, "_iter_extracted", recording)
+
+    def rows(chunks):
+        return sorted((c["file"], c["page"], c["chunk"], c["text"]) for c in chunks)
+
+    texts = {"a.pdf": "uno dos tres", "b.pdf": "cuatro cinco", "c.pdf": "seis siete ocho nueve"}
+    paths = [_make_pdf(tmp_path / name, text) for name, text in texts.items()]
+    store = pirjo_pipeline.configure_index_store(str(tmp_path / "store"))
+    for step in range(1, 4):
+        parsed.clear()
+        monkeypatch.setattr(pirjo_pipeline, "_INDEX_STORE", store)
+        index, chunks, info, _ = pirjo_pipeline.load_corpus(paths[:step])
+        assert parsed == [os.path.basename(paths[step - 1])]
+        stored = rows(pirjo_pipeline._load_corpus_dir(store.directory(store.last_used()))[1])
+
+        fresh = pirjo_pipeline.configure_index_store(str(tmp_path / f"fresh-{step}"))
+        monkeypatch.setattr(pirjo_pipeline, "_INDEX_STORE", fresh)
+        expected = pirjo_pipeline.load_corpus(paths[:step])
+        assert rows(chunks) == stored == rows(expected[1])
+        assert index.ntotal == expected[0].ntotal
+        assert info == expected[2]
+    assert store.stats()["seeded"] == 2
+
+
+def test_least_recently_used_corpora_are_removed_from_disk(tmp_path):
+    store = IndexStore(str(tmp_path / "store"), max_loaded=1, max_corpora=2)
+    for key in ("a", "b", "c"):
+        store.get(key, lambda d: key, lambda d: "loaded")
+        time.sleep(0.01)
+
+    assert store.stats()["removed"] == 1
+    assert store.last_used() == "c"
+    assert store.get("a", lambda d: "rebuilt", lambda d: "loaded") == "rebuilt"
+    assert store.stats()["removed"] == 2
+    built = [n for n in os.listdir(store.root) if os.path.exists(os.path.join(store.root, n, ".complete"))]
+    assert sorted(built) == ["a", "c"]
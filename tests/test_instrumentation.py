@@ -0,0 +1,222 @@
+import json
+import os
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+import pytest
+from fpdf import FPDF
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import instrumentation
+import pirjo_pipeline
+import rag_faiss
+from instrumentation import Trace
+
+
+def _usage(prompt, completion):
+    return types.SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion)
+
+
+class FakeClient:
+    """Answer in JSON and report 10 prompt and 3 completion tokens per call."""
+
+    def __init__(self):
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, model, messages, stream=False, **kwargs):
+        message = types.SimpleNamespace(content='{"P": "p", "I": "i"}')
+        choice = types.SimpleNamespace(message=message)
+        return types.SimpleNamespace(choices=[choice], usage=_usage(10, 3))
+
+
+@pytest.fixture(autouse=True)
+def no_caches(monkeypatch):
+    monkeypatch.setattr(pirjo_pipeline, "_RESPONSE_CACHE", None)
+    monkeypatch.setattr(pirjo_pipeline, "_RESPONSE_CACHE_CONFIGURED", True)
+    monkeypatch.setattr(pirjo_pipeline, "_TRACING", None)
+    monkeypatch.delenv("PIPELINE_TRACE", raising=False)
+
+
+def test_disabled_layer_is_a_no_op():
+    def fn():
+        return 1
+
+    items = [1, 2]
+    assert instrumentation.span("a") is instrumentation.span("b")
+    assert instrumentation.bind(fn) is fn
+    assert instrumentation.timed_iter("x", items) is items
+    instrumentation.count("ignored")
+
+    start = time.perf_counter()
+    for _ in range(100_000):
+        with instrumentation.span("x"):
+            pass
+    assert time.perf_counter() - start < 0.5
+
+
+def test_spans_nest_and_follow_bound_threads():
+    trace = Trace("run")
+    with trace.activate():
+        with instrumentation.span("outer", n=1):
+            bump = instrumentation.bind(lambda: instrumentation.count("c", 2))
+            worker = threading.Thread(target=bump)
+            worker.start()
+            worker.join()
+            with instrumentation.span("inner") as inner:
+                inner.set("k", "v")
+    data = trace.to_dict()
+    spans = {s["name"]: s for s in data["spans"]}
+    assert spans["inner"]["parent"] == "outer"
+    assert spans["inner"]["attrs"] == {"k": "v"}
+    assert spans["outer"]["parent_id"] == data["span_id"]
+    assert data["counters"] == {"c": 2}
+    assert data["stages"]["outer"]["calls"] == 1
+    json.dumps(data)
+
+
+def test_prometheus_families_have_one_type_line():
+    trace = Trace("run")
+    with trace.activate():
+        with instrumentation.span("llm", model="m") as call:
+            call.set("prompt_tokens", 3)
+        instrumentation.count("llm.prompt_tokens", 3)
+        instrumentation.count("llm.cache_hits")
+        instrumentation.count("llm_cache_hits", 2)
+    text = instrumentation.to_prometheus(trace.to_dict())
+
+    types_ = [line.split()[2] for line in text.splitlines() if line.startswith("# TYPE")]
+    assert len(types_) == len(set(types_))
+    for line in text.splitlines():
+        if not line.startswith("#"):
+            family = line.split("{")[0].split()[0]
+            assert family in types_
+    assert "pirjo_counter_llm_prompt_tokens 3" in text
+
+
+def test_generate_introduction_traces_every_llm_caller(monkeypatch, tmp_path):
+    monkeypatch.setattr(pirjo_pipeline, "ensure_openai_api_key", lambda: None)
+    monkeypatch.setattr(pirjo_pipeline, "_get_client", lambda: FakeClient())
+    monkeypatch.setattr(pirjo_pipeline, "count_tokens", lambda texts: [len(t) for t in texts])
+    monkeypatch.setattr(pirjo_pipeline, "load_corpus", lambda paths: ("idx", [], {}, None))
+    monkeypatch.setattr(
+        pirjo_pipeline,
+        "search_index_batch",
+        lambda queries, k, *a, **kw: [
+            [{"id": 0, "file": "a.pdf", "page": 1, "chunk": 1, "text": "t", "score": 0.1}]
+        ]
+        * len(queries),
+    )
+    pirjo_pipeline.configure_tracing(True, str(tmp_path), ["json", "prometheus", "otel"])
+
+    result = pirjo_pipeline.generate_introduction("t", "o", "s", ["a.pdf"])
+
+    trace = result["trace"]
+    calls = trace["llm_calls"]
+    assert set(calls) == {
+        "analista_de_fuentes",
+        "pirjo_block",
+        "agente_manager",
+        "redactor_cientifico",
+        "revisor_citas_referencias",
+    }
+    assert calls["pirjo_block"]["calls"] == 5
+    assert calls["agente_manager"]["prompt_tokens"] == 10
+    assert trace["counters"]["llm.prompt_tokens"] == 90
+    assert trace["counters"]["llm.completion_tokens"] == 27
+    assert trace["stages"]["retrieve_relevant_chunks"]["calls"] == 1
+
+    files = sorted(os.listdir(tmp_path))
+    assert files == sorted(f"{trace['trace_id']}{ext}" for ext in (".json", ".prom", ".otel.json"))
+    with open(tmp_path / f"{trace['trace_id']}.prom", encoding="utf-8") as f:
+        assert 'pirjo_llm_prompt_tokens{caller="agente_manager"} 10' in f.read()
+    with open(tmp_path / f"{trace['trace_id']}.otel.json", encoding="utf-8") as f:
+        spans = json.load(f)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert len(spans) == len(trace["spans"]) + 1
+    assert {s["traceId"] for s in spans} == {trace["trace_id"]}
+
+
+def test_tracing_is_off_by_default(monkeypatch):
+    monkeypatch.setattr(pirjo_pipeline, "ensure_openai_api_key", lambda: None)
+    monkeypatch.setattr(pirjo_pipeline, "load_corpus", lambda paths: ("idx", [], {}, None))
+    monkeypatch.setattr(pirjo_pipeline, "retrieve_relevant_chunks", lambda *a, **kw: ("b", []))
+    monkeypatch.setattr(pirjo_pipeline, "metodologo_pirjo", lambda bullets, **kw: {"P": "p"})
+    monkeypatch.setattr(pirjo_pipeline, "agente_manager", lambda t, o, blocks: blocks)
+    monkeypatch.setattr(pirjo_pipeline, "redactor_cientifico", lambda blocks: "texto")
+    monkeypatch.setattr(pirjo_pipeline, "revisor_citas_referencias", lambda text: text)
+
+    assert "trace" not in pirjo_pipeline.generate_introduction("t", "o", "s", ["a.pdf"])
+
+
+def test_streamed_calls_report_usage_and_cache_hits(monkeypatch):
+    class StreamingClient:
+        def __init__(self):
+            self.chat = types.SimpleNamespace(completions=self)
+            self.kwargs = None
+
+        def create(self, model, messages, stream=False, **kwargs):
+            self.kwargs = kwargs
+            choice = types.SimpleNamespace(delta=types.SimpleNamespace(content="hola"))
+            return iter(
+                [
+                    types.SimpleNamespace(choices=[choice], usage=None),
+                    types.SimpleNamespace(choices=[], usage=_usage(7, 1)),
+                ]
+            )
+
+    pirjo_pipeline.configure_response_cache()
+    client = StreamingClient()
+    trace = Trace("run")
+    with trace.activate():
+        assert list(pirjo_pipeline._stream_openai("p", client=client)) == ["hola"]
+        assert pirjo_pipeline._call_openai("p", client=client) == "hola"
+    assert client.kwargs == {"stream_options": {"include_usage": True}}
+    data = trace.to_dict()
+    assert data["counters"] == {
+        "llm.prompt_tokens": 7,
+        "llm.completion_tokens": 1,
+        "llm.cache_hits": 1,
+    }
+    assert [s["attrs"].get("cached", False) for s in data["spans"]] == [False, True]
+
+
+def test_load_corpus_records_extraction_and_indexing(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        rag_faiss,
+        "_MODEL",
+        types.SimpleNamespace(
+            encode=lambda texts, **kw: np.array([[len(t), 1.0] for t in texts], dtype="float32")
+        ),
+    )
+    monkeypatch.setattr(
+        pirjo_pipeline,
+        "chunk_pages",
+        lambda texts: [([t], [len(t.split())]) if t else ([], []) for t in texts],
+    )
+    monkeypatch.setattr(pirjo_pipeline, "_EXTRACTION_CACHE", None)
+    monkeypatch.setattr(pirjo_pipeline, "_EXTRACTION_CACHE_CONFIGURED", True)
+    store = pirjo_pipeline.configure_index_store(str(tmp_path / "store"))
+    monkeypatch.setattr(pirjo_pipeline, "_INDEX_STORE", store)
+    pdf = FPDF()
+    pdf.set_font("Helvetica", size=12)
+    pdf.add_page()
+    pdf.cell(0, 10, "primer documento")
+    pdf.output(str(tmp_path / "a.pdf"))
+
+    trace = Trace("run")
+    with trace.activate():
+        pirjo_pipeline.load_corpus([str(tmp_path / "a.pdf")])
+        pirjo_pipeline.load_corpus([str(tmp_path / "a.pdf")])
+    data = trace.to_dict()
+
+    spans = {s["name"]: s for s in data["spans"]}
+    assert spans["extract_sources"]["parent"] == "ensure_index"
+    assert spans["extract_sources"]["attrs"]["items"] == 1
+    assert spans["ensure_index"]["parent"] == "load_corpus"
+    assert data["stages"]["load_corpus"]["calls"] == 2
+    assert data["counters"]["extraction.pages"] == 1
+    assert data["counters"]["extraction.chunks"] == 1
+    assert data["counters"]["index_store.builds"] == 1
+    assert data["counters"]["index_store.hits"] == 1
@@ -0,0 +1,145 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import llm_client
+import openai_utils
+from llm_client import RateLimiter, TokenBucket, estimate_tokens, make_client
+
+
+def _completion(content, total_tokens=30):
+    return {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-3.5-turbo",
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": total_tokens},
+    }
+
+
+@pytest.fixture
+def server():
+    """Local OpenAI-compatible server answering with the queued responses."""
+    state = {"responses": [], "requests": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            state["requests"] += 1
+            status, headers, body = state["responses"].pop(0)
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    state["url"] = f"http://127.0.0.1:{httpd.server_address[1]}/v1"
+    yield state
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _ask(client):
+    return client.chat.completions.create(
+        model="gpt-3.5-turbo", messages=[{"role": "user", "content": "hola"}]
+    )
+
+
+def test_rate_limits_and_server_errors_are_retried(server):
+    error = {"error": {"message": "slow down", "type": "rate_limit"}}
+    server["responses"] = [
+        (429, {"Retry-After": "0"}, error),
+        (503, {}, {"error": {"message": "busy"}}),
+        (200, {}, _completion("listo")),
+    ]
+    delays = []
+    client = make_client("x", server["url"], backoff_base=0.01, sleep=delays.append)
+    assert _ask(client).choices[0].message.content == "listo"
+    assert server["requests"] == 3
+    assert len(delays) == 2 and all(0 <= d <= 0.02 for d in delays)
+
+
+def test_client_errors_are_not_retried(server):
+    from openai import BadRequestError
+
+    server["responses"] = [(400, {}, {"error": {"message": "bad"}})]
+    client = make_client("x", server["url"], sleep=lambda s: None)
+    with pytest.raises(BadRequestError):
+        _ask(client)
+    assert server["requests"] == 1
+
+
+def test_retries_stop_after_max_retries(server):
+    from openai import InternalServerError
+
+    server["responses"] = [(500, {}, {"error": {"message": "down"}})] * 3
+    client = make_client("x", server["url"], max_retries=2, sleep=lambda s: None)
+    with pytest.raises(InternalServerError):
+        _ask(client)
+    assert server["requests"] == 3
+
+
+def test_token_bucket_waits_for_refill():
+    now = [0.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(60, clock=lambda: now[0], sleep=sleep)
+    assert bucket.acquire(60) == 0
+    assert bucket.acquire(30) == pytest.approx(30)
+    # More than the capacity is clamped instead of blocking forever.
+    assert bucket.acquire(600) == pytest.approx(60)
+    assert sum(slept) == pytest.approx(90)
+
+
+def test_token_estimates_are_corrected_with_reported_usage(server):
+    server["responses"] = [(200, {}, _completion("a", total_tokens=100))]
+    now = [0.0]
+    limiter = RateLimiter(rpm=10, tpm=1000, clock=lambda: now[0], sleep=lambda s: None)
+    client = make_client("x", server["url"], limiter=limiter)
+    _ask(client)
+    assert limiter.requests._level == pytest.approx(9)
+    assert limiter.tokens._level == pytest.approx(900)
+    assert estimate_tokens([{"role": "user", "content": "x" * 400}], max_tokens=50) == 154
+
+
+def test_get_client_shares_one_client_per_endpoint(monkeypatch, server):
+    monkeypatch.setattr(llm_client, "_CLIENTS", {})
+    monkeypatch.setattr(llm_client, "_LIMITERS", {})
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "x")
+    monkeypatch.setenv("DEEPSEEK_BASE_URL", server["url"])
+    monkeypatch.setenv("DEEPSEEK_RPM", "120")
+    monkeypatch.setenv("LLM_MAX_RETRIES", "1")
+
+    client = openai_utils.get_client()
+    assert openai_utils.get_client() is client
+    assert client.max_retries == 1 and client.limiter.requests.capacity == 120
+    assert "openai" not in llm_client._CLIENTS
+    server["responses"] = [(502, {}, {}), (200, {}, _completion("hola"))]
+    monkeypatch.setattr(client, "_sleep", lambda s: None)
+    assert _ask(client).choices[0].message.content == "hola"
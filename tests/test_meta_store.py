@@ -0,0 +1,67 @@
+import json
+import os
+import sys
+
+import faiss
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import rag_faiss
+from meta_store import ChunkStore
+
+
+RECORDS = [
+    {"id": 0, "file": "a.pdf", "page": 1, "chunk": 0, "text": "año uno"},
+    {"id": 1, "file": "b.pdf", "page": 3, "chunk": 0, "text": "dos"},
+    {"id": 2, "file": "a.pdf", "page": 2, "chunk": 1, "text": ""},
+]
+
+
+def test_store_round_trips_through_memory_mapped_files(tmp_path):
+    meta_file = str(tmp_path / "meta.json")
+    ChunkStore.from_records(RECORDS).save(meta_file, {"dim": 3})
+
+    with open(meta_file, encoding="utf-8") as f:
+        header = json.load(f)
+    store = ChunkStore.load(meta_file, header)
+
+    assert header["dim"] == 3 and header["files"] == ["a.pdf", "b.pdf"]
+    assert isinstance(store.text, np.memmap)
+    assert list(store) == RECORDS
+    assert store.find(1) == RECORDS[1]
+    assert store.find(7) is None
+
+
+def test_drop_and_extend_keep_ids_sorted():
+    store = ChunkStore.from_records(RECORDS)
+    mask = store.file_mask(["a.pdf"])
+    updated = store.drop(mask).extend(
+        [{"id": store.next_id, "file": "c.pdf", "page": 1, "chunk": 0, "text": "tres"}]
+    )
+    assert [m["text"] for m in updated] == ["dos", "tres"]
+    assert updated.ids.tolist() == [1, 3]
+    assert updated.find(3)["file"] == "c.pdf"
+
+
+def test_legacy_json_meta_is_migrated_on_load(tmp_path):
+    index_file = str(tmp_path / "faiss.index")
+    meta_file = str(tmp_path / "faiss_meta.json")
+    index = faiss.IndexFlatL2(2)
+    index.add(np.zeros((2, 2), dtype="float32"))
+    faiss.write_index(index, index_file)
+    legacy = [
+        {"file": "a.pdf", "page": 1, "chunk": 0, "text": "uno"},
+        {"file": "a.pdf", "page": 2, "chunk": 0, "text": "dos"},
+    ]
+    with open(meta_file, "w", encoding="utf-8") as f:
+        json.dump({"dim": 2, "sources_hash": "x", "chunks": legacy}, f)
+
+    _, metadata, dim, sources_hash = rag_faiss.load_index(index_file, meta_file)
+
+    assert (dim, sources_hash) == (2, "x")
+    assert [m["text"] for m in metadata] == ["uno", "dos"]
+    with open(meta_file, encoding="utf-8") as f:
+        migrated = json.load(f)
+    assert "chunks" not in migrated and migrated["count"] == 2
+    _, reloaded, _, _ = rag_faiss.load_index(index_file, meta_file)
+    assert reloaded == metadata
@@ -0,0 +1,67 @@
+import json
+import os
+import re
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import pirjo_pipeline
+
+
+def _letter(prompt):
+    match = re.search(r"bloque ([PIRJO])", prompt)
+    return match.group(1) if match else "X"
+
+
+def test_blocks_run_concurrently(monkeypatch):
+    def slow_call(prompt, system="", client=None):
+        time.sleep(0.3)
+        letter = _letter(prompt)
+        return json.dumps({letter: letter.lower()})
+
+    monkeypatch.setattr(pirjo_pipeline, "_call_openai", slow_call)
+    start = time.monotonic()
+    blocks = pirjo_pipeline.metodologo_pirjo("- ejemplo", max_concurrency=5)
+
+    assert time.monotonic() - start < 1.0
+    assert blocks == {k: k.lower() for k in "PIRJO"}
+    assert list(blocks) == list("PIRJO")
+
+
+def test_failed_block_keeps_other_results(monkeypatch):
+    def flaky_call(prompt, system="", client=None):
+        letter = _letter(prompt)
+        if letter == "R":
+            raise ConnectionError("falló la red")
+        return json.dumps({letter: letter.lower()})
+
+    monkeypatch.setattr(pirjo_pipeline, "_call_openai", flaky_call)
+    blocks = pirjo_pipeline.metodologo_pirjo("- ejemplo", max_concurrency=2)
+    assert blocks == {"P": "p", "I": "i", "R": "", "J": "j", "O": "o"}
+
+
+def test_slow_block_times_out(monkeypatch):
+    def hanging_call(prompt, system="", client=None):
+        letter = _letter(prompt)
+        if letter == "J":
+            time.sleep(2)
+        return json.dumps({letter: letter.lower()})
+
+    monkeypatch.setattr(pirjo_pipeline, "_call_openai", hanging_call)
+    start = time.monotonic()
+    blocks = pirjo_pipeline.metodologo_pirjo("- ejemplo", max_concurrency=5, timeout=0.3)
+
+    assert time.monotonic() - start < 1.5
+    assert blocks["J"] == ""
+    assert blocks["P"] == "p"
+
+
+def test_error_raised_when_every_block_fails(monkeypatch):
+    def broken_call(prompt, system="", client=None):
+        raise ConnectionError("sin conexión")
+
+    monkeypatch.setattr(pirjo_pipeline, "_call_openai", broken_call)
+    with pytest.raises(ConnectionError):
+        pirjo_pipeline.metodologo_pirjo("- ejemplo", max_concurrency=5)
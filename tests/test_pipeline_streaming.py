@@ -0,0 +1,90 @@
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import pirjo_pipeline
+
+
+def _chunk(text):
+    delta = types.SimpleNamespace(content=text)
+    return types.SimpleNamespace(choices=[types.SimpleNamespace(delta=delta)])
+
+
+class StreamingClient:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.calls = 0
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, model, messages, stream=False, **kwargs):
+        assert stream
+        self.calls += 1
+        return iter([_chunk(t) for t in self.tokens] + [_chunk(None)])
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(pirjo_pipeline, "_RESPONSE_CACHE", None)
+    monkeypatch.setattr(pirjo_pipeline, "_RESPONSE_CACHE_CONFIGURED", False)
+    pirjo_pipeline.configure_response_cache()
+
+
+def test_stream_openai_yields_deltas_and_caches_answer():
+    client = StreamingClient(["Hola", " mundo", " "])
+    assert list(pirjo_pipeline._stream_openai("p", client=client)) == ["Hola", " mundo", " "]
+    assert list(pirjo_pipeline._stream_openai("p", client=client)) == ["Hola mundo"]
+    assert client.calls == 1
+    assert pirjo_pipeline._call_openai("p", client=client) == "Hola mundo"
+
+
+def test_iter_introduction_reports_stages_and_streams_tokens(monkeypatch):
+    monkeypatch.setattr(pirjo_pipeline, "ensure_openai_api_key", lambda: None)
+    monkeypatch.setattr(pirjo_pipeline, "load_corpus", lambda paths: ("idx", [], {}, None))
+    monkeypatch.setattr(
+        pirjo_pipeline, "retrieve_relevant_chunks", lambda *a, **kw: ("viñetas", [])
+    )
+    monkeypatch.setattr(pirjo_pipeline, "metodologo_pirjo", lambda bullets, **kw: {"P": "p"})
+    monkeypatch.setattr(pirjo_pipeline, "agente_manager", lambda t, o, blocks: blocks)
+    monkeypatch.setattr(
+        pirjo_pipeline, "redactor_cientifico_stream", lambda blocks: iter(["Intro", " final"])
+    )
+    monkeypatch.setattr(
+        pirjo_pipeline, "revisor_citas_referencias_stream", lambda text: iter([text, " [rev]"])
+    )
+
+    events = list(pirjo_pipeline.iter_introduction("t", "o", "s", ["/tmp/a.pdf"]))
+
+    stages = [e["stage"] for e in events]
+    assert stages[:4] == ["indexando", "analizando", "pirjo", "manager"]
+    assert [e["text"] for e in events if e["stage"] == "redactando"] == [
+        "",
+        "Intro",
+        "Intro final",
+        "Intro final",
+    ]
+    assert events[-2]["text"] == "Intro final [rev]"
+    assert events[-1]["stage"] == "listo"
+    assert events[-1]["result"] == {
+        "introduction": "Intro final [rev]",
+        "blocks": {"P": "p"},
+        "files": ["a.pdf"],
+    }
+
+
+def test_generate_introduction_uses_blocking_calls(monkeypatch):
+    monkeypatch.setattr(pirjo_pipeline, "ensure_openai_api_key", lambda: None)
+    monkeypatch.setattr(pirjo_pipeline, "load_corpus", lambda paths: ("idx", [], {}, None))
+    monkeypatch.setattr(
+        pirjo_pipeline, "retrieve_relevant_chunks", lambda *a, **kw: ("viñetas", [])
+    )
+    monkeypatch.setattr(pirjo_pipeline, "metodologo_pirjo", lambda bullets, **kw: {"P": "p"})
+    monkeypatch.setattr(pirjo_pipeline, "agente_manager", lambda t, o, blocks: blocks)
+    monkeypatch.setattr(pirjo_pipeline, "redactor_cientifico", lambda blocks: "texto")
+    monkeypatch.setattr(pirjo_pipeline, "revisor_citas_referencias", lambda text: text + "!")
+
+    result = pirjo_pipeline.generate_introduction("t", "o", "s", ["a.pdf"])
+
+    assert result["introduction"] == "texto!"
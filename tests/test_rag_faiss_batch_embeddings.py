@@ -0,0 +1,77 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import rag_faiss
+
+
+class BatchModel:
+    """Deterministic stand-in that records the size of every encode call."""
+
+    def __init__(self, dim: int = 4):
+        self.dim = dim
+        self.batches = []
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, show_progress_bar=False):
+        self.batches.append(len(texts))
+        return np.array(
+            [[float(len(t))] * self.dim for t in texts],
+            dtype="float64",
+        )
+
+
+@pytest.fixture
+def model(monkeypatch):
+    m = BatchModel()
+    monkeypatch.setattr(rag_faiss, "_MODEL", m)
+    return m
+
+
+def test_embed_texts_batches_into_contiguous_matrix(model):
+    progress = []
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+    matrix = rag_faiss._embed_texts(texts, batch_size=2, progress_callback=lambda d, t: progress.append((d, t)))
+
+    assert matrix.shape == (5, 4)
+    assert matrix.dtype == np.float32
+    assert matrix.flags["C_CONTIGUOUS"]
+    assert matrix[:, 0].tolist() == [1.0, 2.0, 3.0, 4.0, 5.0]
+    assert model.batches == [2, 2, 1]
+    assert progress == [(2, 5), (4, 5), (5, 5)]
+
+
+def test_build_index_embeds_in_batches(model, tmp_path):
+    sources = [
+        {"file": "a.pdf", "page": 1, "text": "uno dos tres"},
+        {"file": "b.pdf", "page": 2, "text": "cuatro cinco"},
+    ]
+    index, metadata = rag_faiss.build_index(
+        sources,
+        index_file=str(tmp_path / "faiss.index"),
+        meta_file=str(tmp_path / "faiss_meta.json"),
+        chunk_size=1,
+        overlap=0,
+        batch_size=3,
+    )
+
+    assert index.ntotal == 5
+    assert len(metadata) == 5
+    assert model.batches == [3, 2]
+
+
+def test_search_index_uses_batched_path(model, tmp_path):
+    sources = [{"file": "a.pdf", "page": 1, "text": "uno cuatro"}]
+    index, metadata = rag_faiss.build_index(
+        sources,
+        index_file=str(tmp_path / "faiss.index"),
+        meta_file=str(tmp_path / "faiss_meta.json"),
+        chunk_size=1,
+        overlap=0,
+    )
+    model.batches.clear()
+    results = rag_faiss.search_index("cinco!", 1, index, metadata)
+    assert model.batches == [1]
+    assert results[0]["text"] == "cuatro"
@@ -0,0 +1,67 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import rag_faiss
+
+
+class CountingIndex:
+    def __init__(self, index):
+        self.index = index
+        self.ntotal = index.ntotal
+        self.query_shapes = []
+
+    def search(self, emb, k, **kwargs):
+        self.query_shapes.append(emb.shape)
+        return self.index.search(emb, k, **kwargs)
+
+
+@pytest.fixture
+def index_data(model, tmp_path):
+    sources = [
+        {"file": "a.pdf", "page": 1, "text": "xx"},
+        {"file": "a.pdf", "page": 2, "text": "xxxx"},
+        {"file": "b.pdf", "page": 1, "text": "xxxx"},
+        {"file": "b.pdf", "page": 2, "text": "xxxxxxxx"},
+    ]
+    index, metadata = rag_faiss.build_index(
+        sources,
+        index_file=str(tmp_path / "faiss.index"),
+        meta_file=str(tmp_path / "faiss_meta.json"),
+        dedupe=False,
+    )
+    model.batches.clear()
+    return CountingIndex(index), metadata
+
+
+def test_batch_search_uses_one_embedding_and_one_search(model, index_data):
+    index, metadata = index_data
+    results = rag_faiss.search_index_batch(["yy", "yyyyyyy"], 2, index, metadata)
+
+    assert model.batches == [["yy", "yyyyyyy"]]
+    assert index.query_shapes == [(2, 2)]
+    assert [r["text"] for r in results[0]] == ["xx", "xxxx"]
+    assert [r["text"] for r in results[1]] == ["xxxxxxxx", "xxxx"]
+    assert results[1][0]["score"] == pytest.approx(1.0)
+
+
+def test_batch_search_skips_duplicate_texts(index_data):
+    index, metadata = index_data
+    hits = rag_faiss.search_index_batch(["yyyy"], 3, index, metadata)[0]
+    assert [h["text"] for h in hits] == ["xxxx", "xx", "xxxxxxxx"]
+
+    raw = rag_faiss.search_index_batch(["yyyy"], 3, index, metadata, dedupe=False)[0]
+    assert [h["text"] for h in raw] == ["xxxx", "xxxx", "xx"]
+
+
+def test_merge_keeps_best_score_once(index_data):
+    index, metadata = index_data
+    results = rag_faiss.search_index_batch(["yy", "yyy"], 2, index, metadata)
+    merged = rag_faiss.merge_search_results(results)
+
+    ids = [h["id"] for h in merged]
+    assert len(ids) == len(set(ids))
+    assert [h["score"] for h in merged] == sorted(h["score"] for h in merged)
+    assert merged[0]["text"] == "xx" and merged[0]["score"] == 0.0
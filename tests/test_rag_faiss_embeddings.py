@@ -1,14 +1,10 @@
 import os
 import sys
-import types
 
 import pytest
 
-dummy_module = types.ModuleType("sentence_transformers")
-dummy_module.SentenceTransformer = object
-sys.modules.setdefault("sentence_transformers", dummy_module)
-
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import embedding_backends
 import rag_faiss
 
 
@@ -25,7 +21,7 @@ def test_local_model_used(monkeypatch):
             import numpy as np
             return np.array([0.1, 0.2, 0.3])
 
-    monkeypatch.setattr(rag_faiss, "SentenceTransformer", DummyModel)
+    monkeypatch.setattr(embedding_backends, "SentenceTransformer", DummyModel)
     rag_faiss._MODEL = None
 
     emb1 = rag_faiss._embed_text("hola")
@@ -36,3 +32,12 @@ def test_local_model_used(monkeypatch):
     assert calls["init"] == 1
     assert calls["encode"] == ["hola", "mundo"]
 
+
+def test_chunks_of_a_page_get_distinct_numbers():
+    sources = [
+        {"file": "a.pdf", "page": 1, "chunk_id": 1, "text": "uno dos"},
+        {"file": "a.pdf", "page": 1, "chunk_id": 2, "text": "tres cuatro"},
+        {"file": "a.pdf", "page": 2, "text": "cinco"},
+    ]
+    _, metadata = rag_faiss._collect_chunks(sources, chunk_size=50, overlap=0)
+    assert [(m["page"], m["chunk"]) for m in metadata] == [(1, 1), (1, 2), (2, 0)]
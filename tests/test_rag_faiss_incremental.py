@@ -0,0 +1,59 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import rag_faiss
+
+
+def _embedded_chunks(model):
+    return [t for t in model.encoded if t]
+
+
+def test_unchanged_sources_are_not_reembedded(model, paths):
+    sources = [{"file": "a.pdf", "page": 1, "text": "alfa"}]
+    rag_faiss.ensure_index(sources, **paths)
+    model.encoded.clear()
+    index, metadata = rag_faiss.ensure_index(sources, **paths)
+    assert _embedded_chunks(model) == []
+    assert index.ntotal == 1
+
+
+def test_only_new_and_changed_files_are_embedded(model, paths):
+    sources = [
+        {"file": "a.pdf", "page": 1, "text": "alfa"},
+        {"file": "b.pdf", "page": 1, "text": "beta"},
+    ]
+    rag_faiss.ensure_index(sources, **paths)
+    model.encoded.clear()
+
+    updated = [
+        {"file": "a.pdf", "page": 1, "text": "alfa"},
+        {"file": "b.pdf", "page": 1, "text": "beta revisada"},
+        {"file": "c.pdf", "page": 1, "text": "gamma"},
+    ]
+    index, metadata = rag_faiss.ensure_index(updated, **paths)
+
+    assert _embedded_chunks(model) == ["beta revisada", "gamma"]
+    assert index.ntotal == 3
+    assert sorted(m["text"] for m in metadata) == ["alfa", "beta revisada", "gamma"]
+
+
+def test_removed_files_are_deleted_from_index(model, paths):
+    sources = [
+        {"file": "a.pdf", "page": 1, "text": "alfa"},
+        {"file": "b.pdf", "page": 1, "text": "beta"},
+    ]
+    rag_faiss.ensure_index(sources, **paths)
+    model.encoded.clear()
+
+    index, metadata = rag_faiss.ensure_index(sources[1:], **paths)
+
+    assert _embedded_chunks(model) == []
+    assert index.ntotal == 1
+    assert [m["file"] for m in metadata] == ["b.pdf"]
+    results = rag_faiss.search_index("beta", 1, index, metadata)
+    assert results[0]["file"] == "b.pdf"
+
+    reloaded, reloaded_meta, _, _ = rag_faiss.load_index(**paths)
+    assert reloaded.ntotal == 1
+    assert reloaded_meta == metadata
@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import rag_faiss
+
+
+class HashModel:
+    """Map every text to a fixed pseudo-random vector."""
+
+    def encode(self, texts, **kwargs):
+        return np.stack(
+            [np.random.default_rng(zlib.crc32(t.encode())).random(8) for t in texts]
+        ).astype("float32")
+
+
+@pytest.fixture(autouse=True)
+def model(monkeypatch):
+    monkeypatch.setattr(rag_faiss, "_MODEL", HashModel())
+
+
+def _sources(n):
+    return [{"file": f"doc{i % 3}.pdf", "page": i, "text": f"palabra{i}"} for i in range(n)]
+
+
+@pytest.mark.parametrize("index_type", ["hnsw", "ivf"])
+def test_approximate_index_finds_exact_match(paths, index_type):
+    index, metadata = rag_faiss.build_index(_sources(200), index_type=index_type, **paths)
+    results = rag_faiss.search_index(
+        "palabra42", 1, index, metadata, ef_search=64, nprobe=8
+    )
+    assert results[0]["text"] == "palabra42"
+
+
+def test_index_type_and_params_are_persisted(paths):
+    rag_faiss.build_index(_sources(200), index_type="ivf", index_params={"nlist": 4}, **paths)
+    with open(paths["meta_file"], encoding="utf-8") as f:
+        meta = json.load(f)
+    assert meta["index_type"] == "ivf"
+    assert meta["index_params"] == {"nlist": 4}
+    assert meta["index_spec"] == {"type": "ivf", "params": {"nlist": 4}}
+
+
+def test_ivf_reduces_lists_for_small_corpora(paths):
+    index, _ = rag_faiss.build_index(_sources(80), index_type="ivf", **paths)
+    assert rag_faiss._describe_index(index) == {"type": "ivf", "params": {"nlist": 2}}
+
+
+def test_ivf_probes_a_share_of_its_lists_by_default(paths):
+    index, _ = rag_faiss.build_index(
+        _sources(800), index_type="ivf", index_params={"nlist": 16}, **paths
+    )
+    assert rag_faiss._search_params(index).nprobe == 2
+    assert rag_faiss._search_params(index, nprobe=32).nprobe == 16
+
+    # Indexes saved with FAISS's default of one list are searched the same way.
+    rag_faiss._inner_index(index).nprobe = 1
+    rag_faiss._write_faiss(index, paths["index_file"])
+    loaded = rag_faiss.load_index(**paths)[0]
+    assert rag_faiss._search_params(loaded).nprobe == 2
+
+
+def test_ensure_index_rebuilds_when_index_type_changes(paths):
+    rag_faiss.ensure_index(_sources(50), **paths)
+    index, _ = rag_faiss.ensure_index(_sources(50), index_type="hnsw", **paths)
+    assert rag_faiss._describe_index(index)["type"] == "hnsw"
+    assert index.ntotal == 50
+
+
+def test_unknown_index_type_is_rejected(paths):
+    with pytest.raises(ValueError):
+        rag_faiss.build_index(_sources(1), index_type="lsh", **paths)
@@ -0,0 +1,105 @@
+import json
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import rag_faiss
+
+
+class HashModel:
+    """Map every text to a fixed pseudo-random 16-dimensional vector."""
+
+    def encode(self, texts, **kwargs):
+        return np.stack(
+            [np.random.default_rng(zlib.crc32(t.encode())).random(16) for t in texts]
+        ).astype("float32")
+
+
+@pytest.fixture(autouse=True)
+def model(monkeypatch):
+    monkeypatch.setattr(rag_faiss, "_MODEL", HashModel())
+
+
+def _sources(n):
+    return [{"file": f"doc{i % 3}.pdf", "page": i, "text": f"palabra{i}"} for i in range(n)]
+
+
+def _header(paths):
+    with open(paths["meta_file"], encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf"])
+@pytest.mark.parametrize("encoding", ["fp16", "sq8", "pq"])
+def test_quantized_index_is_recorded_and_searchable(paths, index_type, encoding):
+    index, metadata = rag_faiss.build_index(
+        _sources(700),
+        index_type=index_type,
+        index_params={"nlist": 4},
+        encoding=encoding,
+        encoding_params={"m": 8},
+        **paths,
+    )
+    hits = rag_faiss.search_index("palabra42", 1, index, metadata, nprobe=4, rerank=20)
+    assert hits[0]["text"] == "palabra42"
+    assert hits[0]["score"] == pytest.approx(0.0, abs=1e-6)
+
+    header = _header(paths)
+    assert header["index_spec"]["encoding"]["type"] == encoding
+    assert header["encoding"]["type"] == encoding
+    expected = {"fp16": 32, "sq8": 16, "pq": 4}[encoding]  # pq: 8 codes of 4 bits
+    assert header["bytes_per_vector"] == expected
+
+
+def test_encodings_fall_back_when_training_data_is_scarce(paths):
+    rag_faiss.build_index(_sources(30), encoding="pq", **paths)
+    assert _header(paths)["encoding"] == {"type": "sq8", "params": {}}
+    rag_faiss.build_index([], encoding="sq8", **paths)
+    assert _header(paths)["encoding"] == {"type": "fp16", "params": {}}
+
+
+def test_full_precision_headers_are_unchanged(paths):
+    rag_faiss.build_index(_sources(10), **paths)
+    header = _header(paths)
+    assert header["index_spec"] == {"type": "flat", "params": {}}
+    assert header["encoding"] == {"type": "float32", "params": {}}
+    assert header["bytes_per_vector"] == 64
+
+
+def test_rerank_restores_exact_order(paths, tmp_path):
+    sources = _sources(700)
+    exact_paths = {k: str(tmp_path / ("exact_" + os.path.basename(v))) for k, v in paths.items()}
+    exact, exact_meta = rag_faiss.build_index(sources, **exact_paths)
+    index, metadata = rag_faiss.build_index(
+        sources, encoding="pq", encoding_params={"m": 4}, **paths
+    )
+    queries = [f"consulta{i}" for i in range(10)]
+    truth = rag_faiss.search_index_batch(queries, 5, exact, exact_meta, dedupe=False)
+    reranked = rag_faiss.search_index_batch(
+        queries, 5, index, metadata, dedupe=False, rerank=400
+    )
+    for want, got in zip(truth, reranked):
+        assert [h["id"] for h in got] == [h["id"] for h in want]
+        assert [h["score"] for h in got] == pytest.approx([h["score"] for h in want], rel=1e-4)
+
+
+def test_changing_the_encoding_rebuilds_the_index(paths):
+    rag_faiss.ensure_index(_sources(50), **paths)
+    index, _ = rag_faiss.ensure_index(_sources(50), encoding="fp16", **paths)
+    assert rag_faiss._describe_encoding(index)["type"] == "fp16"
+    before = _header(paths)["index_spec"]
+    again, _ = rag_faiss.ensure_index(_sources(51), encoding="fp16", **paths)
+    assert again.ntotal == 51 and rag_faiss._describe_encoding(again)["type"] == "fp16"
+    assert _header(paths)["index_spec"] == before
+
+
+def test_streaming_holds_vectors_to_train_sq8(paths):
+    index, _ = rag_faiss.ensure_index_streaming(
+        iter(_sources(200)), batch_size=16, encoding="sq8", **paths
+    )
+    assert index.ntotal == 200
+    assert _header(paths)["encoding"]["type"] == "sq8"
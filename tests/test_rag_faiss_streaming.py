@@ -0,0 +1,133 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import rag_faiss
+
+
+class EventModel:
+    def __init__(self, events):
+        self.events = events
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        if texts != [""]:
+            self.events.append("encode")
+            self.encoded.extend(texts)
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype="float32")
+
+
+@pytest.fixture
+def events():
+    return []
+
+
+@pytest.fixture
+def model(monkeypatch, events):
+    m = EventModel(events)
+    monkeypatch.setattr(rag_faiss, "_MODEL", m)
+    return m
+
+
+def _sources(n, files=2):
+    return [{"file": f"doc{i % files}.pdf", "page": i, "text": "x" * (i + 1)} for i in range(n)]
+
+
+def test_embedding_overlaps_with_source_production(model, events, paths):
+    sources = sorted(_sources(10), key=lambda s: s["file"])
+
+    def produce():
+        for i, src in enumerate(sources):
+            events.append(f"source {i}")
+            yield src
+
+    index, metadata = rag_faiss.ensure_index_streaming(
+        produce(), batch_size=2, prefetch=1, **paths
+    )
+
+    assert index.ntotal == 10
+    assert events.index("encode") < events.index("source 9")
+    assert sorted(m["text"] for m in metadata) == sorted(s["text"] for s in sources)
+    results = rag_faiss.search_index("x" * 4, 1, index, metadata)
+    assert results[0]["page"] == 3
+
+
+def test_streaming_matches_list_hashes(model, paths):
+    sources = sorted(_sources(6, files=3), key=lambda s: s["file"])
+    hasher = rag_faiss._SourcesHasher()
+    for src in sources:
+        hasher.update(src)
+    assert hasher.sources_hash() == rag_faiss._hash_sources(sources)
+    assert hasher.file_hashes() == rag_faiss._hash_sources_by_file(sources)
+
+    rag_faiss.ensure_index_streaming(iter(sources), **paths)
+    model.encoded.clear()
+    index, _ = rag_faiss.ensure_index(sources, **paths)
+    assert model.encoded == []
+    assert index.ntotal == 6
+
+
+def test_streaming_refresh_only_embeds_changed_files(model, paths):
+    sources = sorted(_sources(6), key=lambda s: s["file"])
+    rag_faiss.ensure_index_streaming(iter(sources), **paths)
+    model.encoded.clear()
+
+    unchanged_index, _ = rag_faiss.ensure_index_streaming(iter(sources), **paths)
+    assert model.encoded == []
+    assert unchanged_index.ntotal == 6
+
+    updated = [s for s in sources if s["file"] == "doc0.pdf"] + [
+        {"file": "doc1.pdf", "page": 1, "text": "nuevo texto"}
+    ]
+    index, metadata = rag_faiss.ensure_index_streaming(iter(updated), **paths)
+
+    assert model.encoded == ["nuevo texto"]
+    assert index.ntotal == 4
+    assert sorted(m["text"] for m in metadata if m["file"] == "doc1.pdf") == ["nuevo texto"]
+    reloaded, reloaded_meta, _, _ = rag_faiss.load_index(**paths)
+    assert reloaded.ntotal == 4 and reloaded_meta == metadata
+
+
+def test_streaming_trains_ivf_once_enough_vectors_arrive(model, paths):
+    sources = _sources(100, files=1)
+    index, _ = rag_faiss.ensure_index_streaming(
+        iter(sources), index_type="ivf", index_params={"nlist": 2}, batch_size=16, **paths
+    )
+    assert rag_faiss._describe_index(index)["type"] == "ivf"
+    assert index.ntotal == 100
+
+
+def test_producer_errors_are_raised(model, paths):
+    def broken():
+        yield {"file": "a.pdf", "page": 1, "text": "uno"}
+        raise ValueError("PDF dañado")
+
+    with pytest.raises(ValueError):
+        rag_faiss.ensure_index_streaming(broken(), **paths)
+
+
+def test_successive_streaming_refreshes_keep_chunk_texts(model, paths, tmp_path):
+    docs = {
+        "a.pdf": ["alpha text one", "alpha text two"],
+        "b.pdf": ["bravo content here"],
+        "c.pdf": ["charlie words", "charlie more words", "charlie end"],
+        "d.pdf": ["delta final"],
+    }
+    sources = []
+    for fname, texts in docs.items():
+        sources += [{"file": fname, "page": p, "text": t} for p, t in enumerate(texts, 1)]
+        _, metadata = rag_faiss.ensure_index_streaming(iter(sources), **paths)
+        fresh = {
+            "index_file": str(tmp_path / f"fresh-{fname}.index"),
+            "meta_file": str(tmp_path / f"fresh-{fname}.json"),
+        }
+        _, expected = rag_faiss.ensure_index_streaming(iter(sources), **fresh)
+
+        def texts_of(store):
+            return sorted((m["file"], m["page"], m["text"]) for m in store)
+
+        assert texts_of(metadata) == texts_of(expected)
+        assert texts_of(rag_faiss.load_index(**paths)[1]) == texts_of(expected)
@@ -0,0 +1,88 @@
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import pirjo_pipeline
+from llm_cache import MemoryResponseCache, ResponseCache, SQLiteResponseCache, make_key
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+        self.chat = types.SimpleNamespace(completions=self)
+
+    def create(self, model, messages, **kwargs):
+        self.calls.append((model, messages))
+        message = types.SimpleNamespace(content=f" respuesta {len(self.calls)} ")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(pirjo_pipeline, "_RESPONSE_CACHE", None)
+    monkeypatch.setattr(pirjo_pipeline, "_RESPONSE_CACHE_CONFIGURED", False)
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.delenv("DEEPSEEK_API_KEY", raising=False)
+    pirjo_pipeline.configure_response_cache()
+    return FakeClient()
+
+
+def test_identical_requests_hit_the_cache(client):
+    first = pirjo_pipeline._call_openai("hola", system="s", client=client)
+    second = pirjo_pipeline._call_openai("hola", system="s", client=client)
+    third = pirjo_pipeline._call_openai("hola", system="otro", client=client)
+
+    assert first == second == "respuesta 1"
+    assert third == "respuesta 2"
+    assert len(client.calls) == 2
+    stats = pirjo_pipeline.response_cache_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2
+
+
+def test_bypass_flag_skips_the_cache(client):
+    pirjo_pipeline._call_openai("hola", client=client)
+    assert pirjo_pipeline._call_openai("hola", client=client, use_cache=False) == "respuesta 2"
+    assert len(client.calls) == 2
+
+
+def test_provider_model_is_part_of_the_key(client, monkeypatch):
+    pirjo_pipeline._call_openai("hola", client=client)
+    monkeypatch.delenv("OPENAI_API_KEY")
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "ds-test")
+    assert pirjo_pipeline._call_openai("hola", client=client) == "respuesta 2"
+    assert [model for model, _ in client.calls] == ["gpt-3.5-turbo", "deepseek-chat"]
+
+
+def test_memory_cache_limits_and_ttl(monkeypatch):
+    cache = MemoryResponseCache(max_entries=2, max_bytes=10, ttl=60)
+    cache.put("a", "1234")
+    cache.put("b", "5678")
+    cache.get("a")
+    cache.put("c", "90")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1234" and cache.get("c") == "90"
+
+    cache.put("d", "12345")
+    assert cache.size_bytes <= 10
+    assert cache.get("a") is None
+
+    now = pirjo_pipeline.time.time()
+    monkeypatch.setattr("llm_cache.time.time", lambda: now + 120)
+    assert cache.get("d") is None
+
+
+def test_sqlite_cache_persists_and_warms_memory(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    key = make_key("m", [{"role": "user", "content": "x"}])
+    ResponseCache(MemoryResponseCache(), SQLiteResponseCache(path)).put(key, "guardado")
+
+    cache = ResponseCache(MemoryResponseCache(), SQLiteResponseCache(path, max_entries=1))
+    assert cache.get(key) == "guardado"
+    assert cache.memory.get(key) == "guardado"
+    assert cache.stats()["disk_hits"] == 1
+
+    cache.put("otra", "valor")
+    assert len(cache.disk) == 1
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import sys
+import threading
+import types
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import app
+from serving import QueueFull, Scheduler
+
+
+def _blocked(gate, events):
+    def run():
+        gate.wait(5)
+        yield from events
+
+    return run
+
+
+def test_identical_requests_share_one_job():
+    gate = threading.Event()
+    calls = []
+    scheduler = Scheduler(workers=1, max_queue=0)
+
+    def run():
+        calls.append(1)
+        gate.wait(5)
+        yield "a"
+        yield "b"
+
+    first = scheduler.submit("k", run)
+    second = scheduler.submit("k", run)
+    assert first is second
+    gate.set()
+    updates = list(second.updates(timeout=5))
+    assert [e for events, _ in updates for e in events] == ["a", "b"]
+    assert calls == [1]
+    assert scheduler.stats()["coalesced"] == 1
+
+
+def test_waiting_jobs_report_their_position_and_the_queue_is_bounded():
+    gate = threading.Event()
+    scheduler = Scheduler(workers=1, max_queue=1)
+    running = scheduler.submit("a", _blocked(gate, ["a"]))
+    waiting = scheduler.submit("b", _blocked(gate, ["b"]))
+    assert waiting.position == 1
+    with pytest.raises(QueueFull):
+        scheduler.submit("c", _blocked(gate, ["c"]))
+    assert scheduler.stats()["rejected"] == 1
+
+    gate.set()
+    list(running.updates(timeout=5))
+    assert [e for events, _ in waiting.updates(timeout=5) for e in events] == ["b"]
+    assert waiting.position == 0
+
+
+def test_failures_reach_every_follower():
+    def run():
+        yield "a"
+        raise ValueError("roto")
+
+    job = Scheduler().submit("k", run)
+    list(job.updates(timeout=5))
+    assert isinstance(job.error, ValueError)
+
+
+def test_async_followers_get_every_event():
+    gate = threading.Event()
+    scheduler = Scheduler(workers=1)
+
+    async def follow():
+        job = scheduler.submit("k", _blocked(gate, ["a", "b", "c"]))
+        asyncio.get_running_loop().call_later(0.05, gate.set)
+        return [e async for events, _ in job.aupdates() for e in events]
+
+    assert asyncio.run(follow()) == ["a", "b", "c"]
+
+
+def test_duplicate_submissions_from_the_app_run_the_pipeline_once(monkeypatch, tmp_path):
+    pdf = tmp_path / "a.pdf"
+    pdf.write_bytes(b"%PDF-1.4 contenido")
+    gate = threading.Event()
+    calls = []
+
+    def fake_iter(title, objective, summary, paths):
+        calls.append(title)
+        gate.wait(5)
+        yield {"stage": "manager", "label": "Revisando", "text": "", "blocks": {"P": "p"}}
+        result = {"introduction": "intro", "blocks": {"P": "p"}, "files": ["a.pdf"]}
+        yield {"stage": "listo", "label": "Listo", "text": "intro", "result": result}
+
+    monkeypatch.setattr(app, "iter_introduction", fake_iter)
+    monkeypatch.setattr(app, "_SCHEDULER", None)
+    app.configure_serving(workers=1, max_queue=2)
+    files = [types.SimpleNamespace(name=str(pdf))]
+
+    async def session():
+        return [out async for out in app.run_pipeline_stream("t", "o", "s", files)]
+
+    async def main():
+        first = asyncio.ensure_future(session())
+        await asyncio.sleep(0.1)
+        second = asyncio.ensure_future(session())
+        await asyncio.sleep(0.1)
+        gate.set()
+        return await first, await second
+
+    first, second = asyncio.run(main())
+    assert calls == ["t"]
+    assert first[-1] == second[-1] == ("intro", "Problema:\np", "a.pdf")
+
+
+def test_streamed_events_are_compacted_to_the_latest_per_stage():
+    gate = threading.Event()
+    scheduler = Scheduler(workers=1, stage_of=lambda e: e.get("stage"))
+    text = ["palabra " * n for n in range(1, 200)]
+
+    def run():
+        yield {"stage": "pirjo"}
+        for chunk in text:
+            yield {"stage": "redactando", "text": chunk}
+        gate.wait(5)
+        yield {"result": "fin"}
+
+    job = scheduler.submit("k", run)
+    early = job.updates(timeout=5)
+    first_events, _ = next(early)
+    for _ in range(500):
+        if job.events and job.events[-1].get("text") == text[-1]:
+            break
+        gate.wait(0.01)
+    assert [e.get("stage") for e in job.events] == ["pirjo", "redactando"]
+
+    gate.set()
+    late = [e for events, _ in job.updates(timeout=5) for e in events]
+    assert late[-2:] == [{"stage": "redactando", "text": text[-1]}, {"result": "fin"}]
+    seen = first_events + [e for events, _ in early for e in events]
+    assert seen[-1] == {"result": "fin"}
+    assert {"stage": "redactando", "text": text[-1]} in seen
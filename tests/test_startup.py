@@ -0,0 +1,77 @@
+import json
+import os
+import subprocess
+import sys
+import types
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import pirjo_pipeline
+import rag_faiss
+from index_store import IndexStore
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+HEAVY_MODULES = ["gradio", "faiss", "sentence_transformers", "torch", "PyPDF2", "tiktoken", "openai"]
+# Generous enough for slow CI machines; importing gradio alone takes seconds.
+IMPORT_BUDGET_SECONDS = float(os.getenv("IMPORT_BUDGET_SECONDS", "2.0"))
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def test_importing_the_application_is_fast_and_light():
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE % HEAVY_MODULES],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    report = json.loads(out.stdout.strip().splitlines()[-1])
+    assert report["loaded"] == []
+    assert report["seconds"] < IMPORT_BUDGET_SECONDS
+
+
+def test_warm_up_preloads_the_last_used_corpus(monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr(pirjo_pipeline, "rag_warm_up", lambda: calls.append("model"))
+    monkeypatch.setattr(pirjo_pipeline, "get_encoding", lambda: calls.append("tokenizer"))
+    monkeypatch.setattr(pirjo_pipeline, "_load_corpus_dir", lambda d: ("index", os.path.basename(d)))
+    root = str(tmp_path / "store")
+    IndexStore(root).get("abc", lambda d: "built", lambda d: "loaded")
+    store = IndexStore(root)
+    monkeypatch.setattr(pirjo_pipeline, "_INDEX_STORE", store)
+
+    timings = pirjo_pipeline.warm_up()
+
+    assert calls == ["model", "tokenizer"]
+    assert set(timings) == {"model", "tokenizer", "pdf", "index"}
+    assert store.stats()["loads"] == 1
+    assert store.get("abc", lambda d: "built", lambda d: "loaded") == ("index", "abc")
+
+
+def test_warm_up_failures_do_not_propagate(monkeypatch, tmp_path):
+    def broken():
+        raise OSError("no model")
+
+    monkeypatch.setattr(pirjo_pipeline, "rag_warm_up", broken)
+    monkeypatch.setattr(pirjo_pipeline, "get_encoding", lambda: None)
+    monkeypatch.setattr(pirjo_pipeline, "_INDEX_STORE", IndexStore(str(tmp_path / "store")))
+
+    thread = pirjo_pipeline.warm_up_in_background()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert "model" not in pirjo_pipeline.warm_up()
+
+
+def test_embedding_dimension_does_not_encode(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("encode should not be called")
+
+    model = types.SimpleNamespace(encode=fail, get_sentence_embedding_dimension=lambda: 384)
+    monkeypatch.setattr(rag_faiss, "_MODEL", model)
+    assert rag_faiss.embedding_dimension() == 384
@@ -0,0 +1,89 @@
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+import pirjo_pipeline
+import rag_faiss
+from meta_store import ChunkStore, _sidecar_paths
+
+
+class CharEncoding:
+    """One token per character; records every batch it encodes."""
+
+    def __init__(self):
+        self.batches = []
+
+    def encode_batch(self, texts):
+        self.batches.append(list(texts))
+        return [[ord(ch) for ch in text] for text in texts]
+
+    def decode_batch(self, batches):
+        return ["".join(chr(t) for t in tokens) for tokens in batches]
+
+
+@pytest.fixture
+def encoding(monkeypatch):
+    enc = CharEncoding()
+    monkeypatch.setattr(pirjo_pipeline, "get_encoding", lambda model=None: enc)
+    return enc
+
+
+def test_chunk_pages_encodes_once_and_returns_counts(encoding):
+    result = pirjo_pipeline.chunk_pages(["abcde", "", "xy"], chunk_size=2)
+    assert result == [(["ab", "cd", "e"], [2, 2, 1]), ([], []), (["xy"], [2])]
+    assert encoding.batches == [["abcde", "", "xy"]]
+
+
+def test_analista_only_encodes_labels_when_counts_are_known(encoding, monkeypatch):
+    prompts = []
+    monkeypatch.setattr(
+        pirjo_pipeline, "_call_openai", lambda prompt, system="", client=None: prompts.append(prompt)
+    )
+    chunks = [
+        {"file": "a.pdf", "page": 1, "chunk": 0, "text": "uno", "tokens": 11_500},
+        {"file": "a.pdf", "page": 2, "chunk": 0, "text": "dos", "tokens": 900},
+        {"file": "b.pdf", "page": 1, "chunk": 0, "text": "tres", "tokens": 5},
+    ]
+
+    pirjo_pipeline.analista_de_fuentes("t", "o", "s", chunks)
+
+    assert encoding.batches == [["[a.pdf:1:0]\n", "[a.pdf:2:0]\n", "[b.pdf:1:0]\n"]]
+    assert "[a.pdf:1:0]" not in prompts[0]
+    assert "[a.pdf:2:0]" in prompts[0] and "[b.pdf:1:0]" in prompts[0]
+
+
+def test_token_counts_reach_index_metadata(monkeypatch, tmp_path):
+    model = types.SimpleNamespace(
+        encode=lambda texts, **kw: np.ones((len(texts), 2), dtype="float32")
+    )
+    monkeypatch.setattr(rag_faiss, "_MODEL", model)
+    sources = [
+        {"file": "a.pdf", "page": 1, "chunk_id": 1, "text": "hola mundo", "tokens": 3},
+        {"file": "a.pdf", "page": 2, "chunk_id": 1, "text": "sin conteo"},
+    ]
+    meta_file = str(tmp_path / "faiss_meta.json")
+    _, metadata = rag_faiss.build_index(
+        sources, index_file=str(tmp_path / "faiss.index"), meta_file=meta_file
+    )
+    assert metadata[0]["tokens"] == 3
+    assert "tokens" not in metadata[1]
+
+    _, reloaded, _, _ = rag_faiss.load_index(str(tmp_path / "faiss.index"), meta_file)
+    assert reloaded[0]["tokens"] == 3
+
+
+def test_rows_without_token_column_are_upgraded(tmp_path):
+    meta_file = str(tmp_path / "meta.json")
+    store = ChunkStore.from_records([{"id": 0, "file": "a.pdf", "text": "x", "tokens": 1}])
+    store.save(meta_file, {})
+    rows_path, _ = _sidecar_paths(meta_file)
+    legacy = np.load(rows_path)
+    names = [n for n in legacy.dtype.names if n != "tokens"]
+    np.save(rows_path, legacy[names].copy())
+
+    loaded = ChunkStore.load(meta_file, {"files": ["a.pdf"]})
+    assert loaded[0] == {"id": 0, "file": "a.pdf", "page": 0, "chunk": 0, "text": "x"}